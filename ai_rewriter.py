@@ -6,9 +6,34 @@ AI Content Rewriter - 使用 Gemini 改写 TG 信号为 Twitter 风格
 """
 
 import os
+import json
 import random
-import google.generativeai as genai
-from signal_parser import SignalParser, SignalData
+import time
+import asyncio
+from typing import Optional, Tuple, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from signal_parser import SignalParser, SignalData, latest_market_cap
+from rewriter_backends import create_backend, TemplateBackend, CircuitBreaker
+from rewrite_cache import RewriteCache
+from tweet_length import weighted_length, TWEET_LIMIT
+
+
+# AI 调用配置（后端见 rewriter_backends.py，REWRITER_BACKEND=gemini / http / template）
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4'))  # 同时进行的 AI 请求数
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', '15'))                # 单次改写超时（秒），超时用模板
+AI_LATENCY_BUDGET = float(os.getenv('AI_LATENCY_BUDGET', '0'))  # 对冲模式延迟预算（秒），超出就先发模板；0 为关闭
+AI_BATCH_WINDOW = float(os.getenv('AI_BATCH_WINDOW', '0'))      # 批量改写收集窗口（秒），0 为关闭
+AI_BATCH_SIZE = int(os.getenv('AI_BATCH_SIZE', '5'))             # 一次批量改写最多几条信号
+
+# 熔断配置：最近 20 次里错误率或 p95 延迟超标就熔断，冷却后放一个探测请求
+AI_BREAKER_ERROR_RATE = float(os.getenv('AI_BREAKER_ERROR_RATE', '0.5'))
+AI_BREAKER_P95 = float(os.getenv('AI_BREAKER_P95', '10'))           # p95 延迟阈值（秒）
+AI_BREAKER_COOLDOWN = float(os.getenv('AI_BREAKER_COOLDOWN', '30'))  # 熔断冷却时间（秒）
+
+# 改写缓存配置（路径留空则只用内存）
+REWRITE_CACHE_PATH = os.getenv('REWRITE_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'rewrite_cache.db'))
+REWRITE_CACHE_TTL = int(os.getenv('REWRITE_CACHE_TTL', '21600'))   # 缓存有效期（秒），默认6小时
+REWRITE_CACHE_SIZE = int(os.getenv('REWRITE_CACHE_SIZE', '2048'))  # 内存里最多缓存多少条
 
 
 # VIP 推广话术（随机选择）
@@ -49,16 +74,46 @@ HASHTAGS = [
     "#DeFi",
 ]
 
+# 固定文案的加权字数预先算好，组装时不用每次重算
+PROMO_WEIGHTS = {promo: weighted_length(promo) for promo in VIP_PROMOS}
+SHORTEST_PROMO = min(VIP_PROMOS, key=PROMO_WEIGHTS.get)
+HASHTAG_WEIGHTS = {tag: weighted_length(tag) for tag in HASHTAGS}
+
 
 class AIRewriter:
     def __init__(self):
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            print("⚠️ 未设置 GEMINI_API_KEY，将使用模板模式")
-            self.model = None
-        else:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-pro')
+        # 改写后端：Gemini / 本地 HTTP 替身 / 模板
+        self.backend = create_backend()
+        self.use_ai = self.backend.remote
+        self.template_backend = TemplateBackend() if self.use_ai else self.backend
+        self.breaker = CircuitBreaker(
+            error_rate=AI_BREAKER_ERROR_RATE,
+            p95_latency=AI_BREAKER_P95,
+            cooldown=AI_BREAKER_COOLDOWN,
+            probe_timeout=AI_TIMEOUT * 2,   # 正常的探测最多 AI_TIMEOUT 秒就有结果
+        )
+
+        # 后端的 generate 是同步调用，放到专用线程池里跑，避免卡住事件循环
+        self.max_concurrency = AI_MAX_CONCURRENCY
+        self.timeout = AI_TIMEOUT
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='rewriter')
+        self._slots = None  # asyncio.Semaphore，在事件循环里第一次用到时再创建
+        self.latency_budget = AI_LATENCY_BUDGET
+        self._late_tasks = set()  # 超出预算、还在跑的 AI 请求（保持引用，结果进缓存）
+
+        # 批量改写：短时间内的多条信号合成一个 prompt
+        self.batch_window = AI_BATCH_WINDOW
+        self.batch_size = AI_BATCH_SIZE
+        self._batch = []           # [(signal, future)]
+        self._batch_timer = None
+        self._batch_tasks = set()
+
+        # 改写缓存：只缓存 AI 生成且校验通过的正文（模板模式不需要落盘）
+        try:
+            self.cache = RewriteCache(REWRITE_CACHE_PATH if self.use_ai else None, ttl=REWRITE_CACHE_TTL, max_size=REWRITE_CACHE_SIZE)
+        except Exception as e:
+            print(f"⚠️ 改写缓存文件不可用，只用内存缓存: {e}")
+            self.cache = RewriteCache(None, ttl=REWRITE_CACHE_TTL, max_size=REWRITE_CACHE_SIZE)
 
         self.parser = SignalParser()
         self.channel_link = os.getenv('VIP_CHANNEL', 't.me/egeyeaimeme')
@@ -87,6 +142,51 @@ class AIRewriter:
 
 直接输出推文内容，不要任何解释："""
 
+    def _get_batch_prompt(self, signals: List[SignalData]) -> str:
+        """生成批量改写 prompt（每条信号一条推文，按 CA 对应）"""
+        items = "\n\n".join(
+            f"""#{i}
+- 币名: {signal.token_name}
+- CA: {signal.ca}
+- 涨幅: {signal.gain}
+- 市值: {signal.market_cap}
+- 原始信号: {signal.raw_text.strip()}"""
+            for i, signal in enumerate(signals, 1)
+        )
+        return f"""你是一个加密货币推特博主。将以下 {len(signals)} 条信号分别改写成简短有力的英文推文。
+
+【绝对禁止修改的信息】：每条信号的币名、CA、涨幅、市值
+
+【要求】：
+1. 用英文写
+2. 简短有力，像真人发的推文
+3. 可以用 emoji
+4. 每条推文必须包含对应信号的币名、CA、涨幅
+5. 不要加 hashtag（我会单独加）
+6. 不要加推广链接（我会单独加）
+7. 每条不超过 150 字符
+
+【信号列表】：
+{items}
+
+只输出一个 JSON 数组，每条信号一个对象，格式为 [{{"ca": "信号的CA", "tweet": "推文内容"}}]，不要任何解释："""
+
+    @staticmethod
+    def _parse_batch_response(text: str) -> Dict[str, str]:
+        """解析批量改写结果，返回 {CA: 推文}；格式不对的条目直接忽略"""
+        start, end = text.find('['), text.rfind(']')
+        if start < 0 or end <= start:
+            return {}
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            return {}
+        results = {}
+        for item in items if isinstance(items, list) else []:
+            if isinstance(item, dict) and isinstance(item.get('ca'), str) and isinstance(item.get('tweet'), str):
+                results[item['ca'].strip()] = item['tweet'].strip()
+        return results
+
     async def rewrite(self, original_text: str) -> str:
         """改写信号为 Twitter 推文"""
         # 1. 解析信号
@@ -96,41 +196,199 @@ class AIRewriter:
             print("⚠️ 未找到 CA，跳过")
             return None
 
-        # 2. 生成推文
-        if self.model:
+        return await self.rewrite_signal(signal)
+
+    async def rewrite_signal(self, signal: SignalData) -> str:
+        """改写已经解析好的信号（流水线里用，不再重复解析原文）"""
+        # 2. 生成推文（先查缓存，命中时不再调用 AI）
+        tweet_body = self.cache.get(signal) if self.use_ai else None
+        from_cache = tweet_body is not None
+        from_ai = False
+        if from_cache:
+            print("♻️ 改写缓存命中")
+        elif self.use_ai and self.latency_budget > 0:
+            tweet_body, from_ai = await self._hedged_rewrite(signal)
+        elif self.use_ai:
             tweet_body = await self._ai_rewrite(signal)
+            from_ai = tweet_body is not None
+            if not from_ai:
+                tweet_body = self._template_rewrite(signal)
         else:
             tweet_body = self._template_rewrite(signal)
 
-        # 3. 验证关键信息
-        valid, errors = self.parser.validate_output(signal, tweet_body)
-        if not valid:
-            print(f"⚠️ AI 输出验证失败: {errors}")
+        # 3. 验证关键信息（按规范化后的文本匹配；校验通过时发的是只去掉零宽 / 控制字符的原文）
+        result = self.parser.check_output(signal, tweet_body)
+        if result.ok:
+            tweet_body = result.text
+            if from_ai:
+                self.cache.put(signal, tweet_body)
+        else:
+            print(f"⚠️ AI 输出验证失败: {result.errors}")
             # 使用模板兜底
             tweet_body = self._template_rewrite(signal)
 
         # 4. 组装完整推文
         full_tweet = self._assemble_tweet(tweet_body, signal)
 
-        # 5. 最终长度检查
-        if len(full_tweet) > 280:
+        # 5. 最终长度检查（组装时已经按加权字数控制过，这里兜底）
+        if weighted_length(full_tweet) > TWEET_LIMIT:
             # 缩短版本
             full_tweet = self._short_version(signal)
 
         return full_tweet
 
-    async def _ai_rewrite(self, signal: SignalData) -> str:
-        """使用 AI 改写"""
+    async def _ai_rewrite(self, signal: SignalData) -> Optional[str]:
+        """使用 AI 改写，失败返回 None，由调用方回退到模板"""
+        if self.batch_window > 0 and self.batch_size > 1:
+            return await self._enqueue_batch(signal)
+        return await self._generate(self._get_prompt(signal))
+
+    async def _generate(self, prompt: str) -> Optional[str]:
+        """调用 AI 后端
+
+        熔断时直接返回 None（走模板）。排队 + 请求共用一个截止时间：超时或失败返回 None，
+        不会拖住后面的消息。超时的请求占着的名额要等线程真正结束才释放，保证在途请求数不超过上限。
+        熔断器放行之后不管从哪里退出（包括被取消）都要告诉它结果，否则半开状态的探测名额收不回来。
+        """
+        if not self.breaker.allow():
+            return None
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        outcome = None   # (ok, 延迟)；没拿到结果就退出（排队超时、被取消）时保持 None
+
         try:
-            prompt = self._get_prompt(signal)
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"⚠️ AI 改写失败: {e}")
-            return self._template_rewrite(signal)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ AI 请求排队超时 ({self.timeout}秒)，使用模板")
+                return None
+
+            started = loop.time()
+            try:
+                work = self._executor.submit(self.backend.generate, prompt)
+            except Exception as e:
+                self._slots.release()
+                outcome = (False, 0.0)
+                print(f"⚠️ AI 改写失败: {e}")
+                return None
+            # 名额挂在线程池的 Future 上：线程真正结束才释放。asyncio 那一层的 Future 超时取消后马上就结束了，
+            # 线程里的请求还在跑，不能用它
+            work.add_done_callback(lambda _: self._release_slot(loop))
+            future = asyncio.wrap_future(work)
+
+            try:
+                text = await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
+                outcome = (True, loop.time() - started)
+                return text.strip()
+            except asyncio.TimeoutError:
+                future.cancel()  # 还没开始跑的直接取消，已经在跑的等它结束后释放名额
+                outcome = (False, loop.time() - started)
+                print(f"⚠️ AI 改写超时 ({self.timeout}秒)，使用模板")
+                return None
+            except Exception as e:
+                outcome = (False, loop.time() - started)
+                print(f"⚠️ AI 改写失败: {e}")
+                return None
+        finally:
+            if outcome is None:
+                self.breaker.release()
+            else:
+                self._record(*outcome)
+
+    def _release_slot(self, loop: asyncio.AbstractEventLoop):
+        """在工作线程里调用，把名额还给事件循环（循环已经关闭时忽略）"""
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            pass
+
+    def _record(self, ok: bool, latency: float):
+        self.backend.stats.record(latency, ok)
+        self.breaker.record(ok, latency)
+
+    def backend_stats(self) -> Dict[str, dict]:
+        """各后端的调用次数、错误数、p50 / p95 延迟，以及熔断状态"""
+        stats = {self.backend.name: self.backend.stats.as_dict()}
+        stats[self.template_backend.name] = self.template_backend.stats.as_dict()
+        stats['breaker'] = self.breaker.as_dict()
+        return stats
+
+    def _enqueue_batch(self, signal: SignalData) -> asyncio.Future:
+        """加入当前批次：攒满 batch_size 条或等满 batch_window 秒就发出去"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((signal, future))
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = loop.call_later(self.batch_window, self._flush_batch)
+        return future
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[SignalData, asyncio.Future]]):
+        """发出一个批次，按 CA 把结果分给各条信号；没拿到结果的信号得到 None"""
+        results = {}
+        try:
+            if len(batch) == 1:
+                signal = batch[0][0]
+                results[signal.ca] = await self._generate(self._get_prompt(signal))
+            else:
+                text = await self._generate(self._get_batch_prompt([signal for signal, _ in batch]))
+                if text:
+                    results = self._parse_batch_response(text)
+                print(f"📦 批量改写 {len(batch)} 条信号，拿到 {len(results)} 条结果")
+        finally:
+            for signal, future in batch:
+                if not future.done():
+                    future.set_result(results.get(signal.ca))
+
+    async def _hedged_rewrite(self, signal: SignalData) -> Tuple[str, bool]:
+        """对冲改写：模板先备好，AI 在延迟预算内返回就用 AI，否则直接用模板
+
+        超出预算的 AI 请求不取消，跑完后校验通过的结果只进缓存，留给下一次同类信号。
+        返回 (正文, 是否来自 AI)。
+        """
+        template_body = self._template_rewrite(signal)
+        task = asyncio.ensure_future(self._ai_rewrite(signal))
+
+        done, _ = await asyncio.wait({task}, timeout=self.latency_budget)
+        if done:
+            ai_body = task.result()
+            if ai_body is not None:
+                return ai_body, True
+            return template_body, False
+
+        print(f"⏱️ AI 超出延迟预算 ({self.latency_budget}秒)，先发模板")
+        self._late_tasks.add(task)
+        task.add_done_callback(lambda t: self._cache_late_result(signal, t))
+        return template_body, False
+
+    def _cache_late_result(self, signal: SignalData, task: asyncio.Task):
+        """迟到的 AI 结果：校验通过就缓存，否则丢弃"""
+        self._late_tasks.discard(task)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        result = self.parser.check_output(signal, task.result())
+        if result.ok:
+            self.cache.put(signal, result.text)
+            print("♻️ 迟到的 AI 改写已缓存")
 
     def _template_rewrite(self, signal: SignalData) -> str:
         """模板改写（无 AI 时使用）"""
+        started = time.perf_counter()
         opener = random.choice(OPENERS)
 
         templates = [
@@ -147,37 +405,83 @@ class AIRewriter:
         if signal.market_cap:
             body += f"\n\nMC: {signal.market_cap}"
 
+        self.template_backend.stats.record(time.perf_counter() - started)
         return body
 
     def _assemble_tweet(self, body: str, signal: SignalData) -> str:
-        """组装完整推文"""
+        """组装完整推文，按 Twitter 加权字数一次装进上限
+
+        装不下时按顺序去掉可选部分：通用 hashtag → 币名 hashtag → 正文里的市值行 → 换最短的推广语。
+        CA 和推广链接从不截断，实在装不下就用极简版。
+        """
         # 随机 VIP 推广
         promo = random.choice(VIP_PROMOS)
 
         # 随机 2-3 个 hashtags
         tags = random.sample(HASHTAGS, random.randint(2, 3))
 
-        # 如果有币名，加入 hashtag
+        # 如果有币名，加入 hashtag（放在最前面，最后才去掉）
         if signal.token_name:
             token_tag = f"#{signal.token_name.replace('$', '')}"
             tags.insert(0, token_tag)
 
-        hashtag_str = " ".join(tags)
+        body_weight = weighted_length(body)
+        fixed = body_weight + 2 + PROMO_WEIGHTS[promo]
+
+        # 正文 + 推广语已经超了：先去掉市值行，再换最短的推广语
+        if fixed > TWEET_LIMIT:
+            body = self._drop_market_cap(body, signal)
+            body_weight = weighted_length(body)
+            fixed = body_weight + 2 + PROMO_WEIGHTS[promo]
+        if fixed > TWEET_LIMIT:
+            promo = SHORTEST_PROMO
+            fixed = body_weight + 2 + PROMO_WEIGHTS[promo]
+        if fixed > TWEET_LIMIT:
+            return self._short_version(signal)
+
+        # hashtag 按剩余额度装：第一个前面是 "\n\n"，后面的前面是空格
+        room = TWEET_LIMIT - fixed - 2
+        kept = []
+        for tag in tags:
+            cost = (HASHTAG_WEIGHTS.get(tag) or weighted_length(tag)) + (1 if kept else 0)
+            if cost > room:
+                break
+            kept.append(tag)
+            room -= cost
 
         # 组装
-        full_tweet = f"{body}\n\n{promo}\n\n{hashtag_str}"
-
-        return full_tweet
+        if kept:
+            return f"{body}\n\n{promo}\n\n{' '.join(kept)}"
+        return f"{body}\n\n{promo}"
+
+    def _drop_market_cap(self, body: str, signal: SignalData) -> str:
+        """去掉正文里只含市值的行（带 CA 的行保留）；去掉后关键信息校验不过就保留原文"""
+        latest = latest_market_cap(signal.market_cap)
+        if not latest:
+            return body
+        # "$279.64 K" 和 "$279.64K" 都算
+        lines = [line for line in body.split("\n")
+                 if latest not in line.replace(' ', '') or (signal.ca and signal.ca in line)]
+        trimmed = "\n".join(lines).strip()
+        if trimmed == body or not self.parser.check_output(signal, trimmed).ok:
+            return body
+        return trimmed
 
     def _short_version(self, signal: SignalData) -> str:
-        """超长时的缩短版本"""
+        """超长时的缩短版本（不截断 CA 和链接，装不下就不带推广语）"""
         opener = random.choice(OPENERS)
-        promo = random.choice(VIP_PROMOS)
+        promo = SHORTEST_PROMO
 
         # 极简版
-        short = f"{opener} {signal.token_name} {signal.gain}!\n\n{signal.ca}\n\n{promo}"
+        short = f"{opener} {signal.token_name} {signal.gain}!\n\n{signal.ca}"
+        with_promo = f"{short}\n\n{promo}"
+
+        return with_promo if weighted_length(with_promo) <= TWEET_LIMIT else short
 
-        return short[:280]
+    def close(self):
+        """关闭后端线程池（不等待已超时的请求）和缓存文件"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.close()
 
 
 # 测试
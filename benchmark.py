@@ -0,0 +1,196 @@
+"""
+性能基准 - 部署前跑一遍，和上一次的结果对比，提前发现性能回退
+
+用法：
+  python benchmark.py                            # 默认 10k 和 1M 条
+  python benchmark.py --sizes 10000 --output bench.json
+  python benchmark.py --compare bench.json       # 与基线对比，回退超过阈值时退出码为 1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from signal_corpus import iter_corpus
+from signal_parser import SignalParser
+from message_sanitizer import MessageSanitizer
+
+
+DEFAULT_SIZES = [10_000, 1_000_000]
+
+# 转发清洗的小尾巴（和 main_v2 默认的 MY_FOOTER 一样）
+FOOTER = "\n--------------------\n🚀 加入 EgeEye，抓住下一个 100 倍！\n👉 t.me/egeyeaimeme\n"
+
+
+def _run(fn: Callable, inputs: List, size: int, repeat: int) -> float:
+    """循环调用 fn，输入不够时循环复用；重复 repeat 次取最快一次的总耗时（秒）"""
+    count = len(inputs)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(size):
+            fn(inputs[i % count])
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _entities_for(text: str) -> list:
+    """给合成信号配上 TG 会带的格式实体：首行粗体、CA 代码、链接和 @提及"""
+    import re
+    from telethon.tl.types import MessageEntityBold, MessageEntityCode, MessageEntityMention, MessageEntityUrl
+    from message_sanitizer import utf16_len
+
+    def entity(kind, start, end):
+        return kind(offset=utf16_len(text[:start]), length=utf16_len(text[start:end]))
+
+    first_line = text.find('\n')
+    entities = [entity(MessageEntityBold, 0, first_line if first_line > 0 else len(text))]
+    for match in re.finditer(r'[1-9A-HJ-NP-Za-km-z]{32,44}|https?://\S+|@\w+', text):
+        found = match.group()
+        kind = MessageEntityUrl if found.startswith('http') else MessageEntityMention if found.startswith('@') else MessageEntityCode
+        entities.append(entity(kind, *match.span()))
+    return sorted(entities, key=lambda e: e.offset)
+
+
+def build_cases(size: int, seed: int, rewriter, queue) -> Dict[str, tuple]:
+    """准备各个用例的 (函数, 输入池)，准备过程不计时；改写器和持久化队列由调用方创建和关闭
+
+    转发清洗直接构造 MessageSanitizer，不导入 main_v2（那会拉起 telethon 和整套启动配置）；
+    没装 telethon 时跳过需要 TG 实体的 forward_entities。
+    """
+    random.seed(seed)
+    parser = SignalParser()
+
+    texts = list(iter_corpus(min(size, 50_000), seed=seed))
+    signals = [s for s in (parser.parse(text) for text in texts) if s.ca]
+    bodies = [(s, rewriter._template_rewrite(s)) for s in signals]
+
+    # 持久化队列：入队 + 出队 + ack 一个来回，队列长度保持不变
+    def queue_roundtrip(tweet):
+        queue.put(tweet)
+        queue.ack(queue.lease().id)
+
+    sanitizer = MessageSanitizer(FOOTER)
+    cases = {
+        'parse': (parser.parse, texts),
+        'validate_output': (lambda pair: parser.validate_output(*pair), bodies),
+        'template_rewrite': (rewriter._template_rewrite, signals),
+        'assemble_tweet': (lambda pair: rewriter._assemble_tweet(pair[1], pair[0]), bodies),
+        'forward_sanitizer': (sanitizer.sanitize, texts),
+    }
+    try:
+        cases['forward_entities'] = (lambda pair: sanitizer.sanitize(*pair),
+                                     [(text, _entities_for(text)) for text in texts[:1000]])
+    except ImportError:
+        print("  ⚠️ 没有安装 telethon，跳过 forward_entities", file=sys.stderr)
+    cases['queue_roundtrip'] = (queue_roundtrip, [rewriter._assemble_tweet(body, s) for s, body in bodies[:1000]])
+    return cases
+
+
+def run_benchmarks(sizes: List[int], seed: int = 42, only: List[str] = None, repeat: int = 3) -> dict:
+    import shutil
+    import tempfile
+    from ai_rewriter import AIRewriter
+    from durable_queue import DurableQueue
+
+    # 改写器（线程池、缓存）和持久化队列各规模共用一份，跑完关闭、删掉临时目录
+    rewriter = AIRewriter()
+    queue_dir = tempfile.mkdtemp()
+    queue = DurableQueue(os.path.join(queue_dir, 'bench_queue.db'))
+
+    results = []
+    try:
+        for size in sizes:
+            cases = build_cases(size, seed, rewriter, queue)
+            for name, (fn, inputs) in cases.items():
+                if only and name not in only:
+                    continue
+                seconds = _run(fn, inputs, size, repeat)
+                result = {
+                    'case': name,
+                    'size': size,
+                    'seconds': round(seconds, 4),
+                    'us_per_op': round(seconds / size * 1e6, 3),
+                    'ops_per_sec': round(size / seconds),
+                }
+                results.append(result)
+                print(f"  {name:<20} {size:>9,} 条  {result['us_per_op']:>9.3f} µs/条  "
+                      f"{result['ops_per_sec']:>10,} 条/秒", file=sys.stderr)
+    finally:
+        rewriter.close()
+        queue.close()
+        shutil.rmtree(queue_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """对比基线，返回回退超过阈值的用例描述"""
+    previous = {(r['case'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        old = previous.get((result['case'], result['size']))
+        if not old or not old['us_per_op']:
+            continue
+        ratio = result['us_per_op'] / old['us_per_op']
+        status = '❌' if ratio > 1 + threshold else '✅'
+        print(f"  {status} {result['case']:<20} {result['size']:>9,}  "
+              f"{old['us_per_op']:.3f} -> {result['us_per_op']:.3f} µs ({ratio:.2f}x)", file=sys.stderr)
+        if ratio > 1 + threshold:
+            regressions.append(f"{result['case']}@{result['size']}: {ratio:.2f}x")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='EgeEye 性能基准')
+    arg_parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                            help='消息条数，逗号分隔 (默认 10000,1000000)')
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--only', default='', help='只跑指定用例，逗号分隔')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每个用例重复次数，取最快一次 (默认 3)')
+    arg_parser.add_argument('--output', help='结果写入 JSON 文件（默认输出到 stdout）')
+    arg_parser.add_argument('--compare', help='基线 JSON 文件')
+    arg_parser.add_argument('--threshold', type=float, default=0.2, help='允许的回退比例 (默认 0.2)')
+    args = arg_parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    only = [name for name in args.only.split(',') if name]
+
+    print("⏱️ 运行基准测试...", file=sys.stderr)
+    report = run_benchmarks(sizes, seed=args.seed, only=only, repeat=args.repeat)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"📄 结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ 性能回退: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+        print("✅ 没有性能回退", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+频道消息游标 - 记录每个源频道处理到哪条消息，重启后补发停机期间漏掉的信号
+- SQLite 单表，每个频道一行（最后处理完的消息 id）
+- 实时消息和补抓共用 claim()：同一条消息只会进流水线一次
+- 只有在它之前认领的消息都处理完了，游标才前进（水位线），崩溃后不会跳过还在处理中的消息
+- 补抓结束前，水位线不会越过补抓已经扫到的位置（实时消息先处理完也不会把漏掉的跳过去）
+"""
+
+import time
+import sqlite3
+from typing import Optional, Set
+
+
+class ChannelCursor:
+    """单个频道的消息游标"""
+
+    def __init__(self, path: str, channel: str):
+        self.channel = channel
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS channel_cursor ('
+            'channel TEXT PRIMARY KEY, '
+            'message_id INTEGER NOT NULL, '
+            'updated_at REAL NOT NULL)'
+        )
+        row = self._db.execute(
+            'SELECT message_id FROM channel_cursor WHERE channel = ?', (channel,)
+        ).fetchone()
+        self.last_id: Optional[int] = row[0] if row else None   # 已持久化的水位线，None 表示第一次运行
+        self._claimed: Set[int] = set()     # 水位线以上已经认领的消息
+        self._inflight: Set[int] = set()    # 认领了还没处理完的消息
+        self._highest = self.last_id or 0   # 处理完的最大 id
+        self.start_id = self.last_id        # 启动时的位置，补抓从这里开始
+        # 补抓扫到的位置；补抓结束（end_backfill）前水位线不超过它。第一次运行不补抓
+        self._barrier: Optional[int] = self.last_id
+
+    def claim(self, message_id: int) -> bool:
+        """认领一条消息；已经处理过或正在处理时返回 False"""
+        if (self.last_id is not None and message_id <= self.last_id) or message_id in self._claimed:
+            return False
+        self._claimed.add(message_id)
+        self._inflight.add(message_id)
+        return True
+
+    def done(self, message_id: int):
+        """消息处理完（发出、丢弃或出错都算），水位线尽量往前推"""
+        self._inflight.discard(message_id)
+        self._highest = max(self._highest, message_id)
+        self._advance()
+
+    def backfilled(self, message_id: int):
+        """补抓已经扫过 message_id（不管它是否需要处理）"""
+        if self._barrier is not None and message_id > self._barrier:
+            self._barrier = message_id
+
+    def end_backfill(self):
+        """补抓完成，水位线可以跟着实时消息前进"""
+        self._barrier = None
+        self._advance()
+
+    def _advance(self):
+        if not self._highest:
+            return
+        watermark = min(self._inflight) - 1 if self._inflight else self._highest
+        if self._barrier is not None:
+            watermark = min(watermark, self._barrier)
+        if self.last_id is None or watermark > self.last_id:
+            self._save(watermark)
+
+    def _save(self, message_id: int):
+        self._db.execute(
+            'INSERT INTO channel_cursor (channel, message_id, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(channel) DO UPDATE SET message_id = excluded.message_id, updated_at = excluded.updated_at',
+            (self.channel, message_id, time.time()),
+        )
+        self.last_id = message_id
+        self._claimed = {claimed for claimed in self._claimed if claimed > message_id}
+
+    def inflight(self) -> int:
+        """认领了还没处理完的消息数（关闭时还剩的，下次启动会补抓）"""
+        return len(self._inflight)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# 测试
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), 'cursor.db')
+    cursor = ChannelCursor(path, 'source')
+    print(f"  第一次运行: last_id={cursor.last_id}")
+
+    for message_id in (101, 102, 103):
+        cursor.claim(message_id)
+    print(f"  重复认领 102: {cursor.claim(102)}")
+    cursor.done(101)
+    cursor.done(103)   # 102 还在处理，水位线停在 101
+    print(f"  101、103 完成: last_id={cursor.last_id}")
+    cursor.close()
+
+    # 模拟崩溃重启：102 没处理完，会重新补抓
+    cursor = ChannelCursor(path, 'source')
+    print(f"  重启后: last_id={cursor.last_id}，认领 102: {cursor.claim(102)}，认领 101: {cursor.claim(101)}")
+    cursor.claim(110)   # 实时消息先到
+    cursor.done(110)
+    print(f"  补抓中实时消息 110 完成: last_id={cursor.last_id}")
+    cursor.backfilled(102)
+    cursor.done(102)
+    cursor.backfilled(103)
+    print(f"  补抓 102、103: last_id={cursor.last_id}")
+    cursor.end_backfill()
+    print(f"  补抓结束: last_id={cursor.last_id}")
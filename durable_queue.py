@@ -0,0 +1,277 @@
+"""
+持久化推文队列 - 重启 / 重新部署不丢待发推文
+- SQLite WAL 模式，单文件
+- 至少一次投递：取出的消息在可见性超时内没有 ack，会重新变成可取
+- ack / nack（延迟重试）/ 压缩（清理已完成的记录、截断 WAL）
+- 提供 async get()，在事件循环里等新消息或延迟到期
+
+用法：
+  python durable_queue.py 100000      # 压测入队 / 出队吞吐
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+from dataclasses import dataclass
+from typing import Optional, List, Tuple
+
+
+@dataclass
+class QueueMessage:
+    id: int
+    payload: str
+    attempts: int
+    enqueued_at: float
+
+
+class DurableQueue:
+    """SQLite 持久化队列（单进程使用，调用都在事件循环线程里，单次操作几十微秒）"""
+
+    def __init__(self, path: str, visibility_timeout: float = 600, compact_every: int = 500,
+                 retention: float = 86400):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.compact_every = compact_every
+        self.retention = retention
+        self._acks_since_compact = 0
+        self._event = None  # asyncio.Event，put 时唤醒等待中的 get
+
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        # auto_vacuum 要在文件头写入之前设置（切 WAL 就会写文件头）；已有的文件要 VACUUM 一次才会切换
+        self._db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        if self._db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            self._db.execute('VACUUM')
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'payload TEXT NOT NULL, '
+            'enqueued_at REAL NOT NULL, '
+            'visible_at REAL NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'acked_at REAL, '
+            'key TEXT, '
+            'score REAL NOT NULL DEFAULT 0, '
+            'leased_until REAL)'
+        )
+        # 旧版本的队列文件没有 key / score / leased_until 列
+        # （升级前租出的消息 leased_until 为空，不会被 requeue_leased 放回，等可见性超时后重新可取）
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(queue)')}
+        if 'key' not in columns:
+            self._db.execute('ALTER TABLE queue ADD COLUMN key TEXT')
+        if 'score' not in columns:
+            self._db.execute('ALTER TABLE queue ADD COLUMN score REAL NOT NULL DEFAULT 0')
+        if 'leased_until' not in columns:
+            self._db.execute('ALTER TABLE queue ADD COLUMN leased_until REAL')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS queue_pending ON queue (id) WHERE acked_at IS NULL'
+        )
+
+    # ---------- 同步接口 ----------
+
+    def put(self, payload: str, delay: float = 0, key: Optional[str] = None, score: float = 0.0) -> int:
+        """入队，delay 秒后才可取；key / score 供调度器合并和排序用（例如 CA / 涨幅）"""
+        now = time.time()
+        cursor = self._db.execute(
+            'INSERT INTO queue (payload, enqueued_at, visible_at, key, score) VALUES (?, ?, ?, ?, ?)',
+            (payload, now, now + delay, key, score),
+        )
+        if self._event is not None:
+            self._event.set()
+        return cursor.lastrowid
+
+    def lease(self, visibility_timeout: Optional[float] = None) -> Optional[QueueMessage]:
+        """取出一条可见的消息，在 visibility_timeout 秒内对其他消费者不可见；没有则返回 None"""
+        now = time.time()
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        # 按入队顺序取第一条已可见的；单进程使用，查询和更新之间不会被别人抢走
+        row = self._db.execute(
+            'SELECT id, payload, attempts, enqueued_at FROM queue '
+            'WHERE acked_at IS NULL AND visible_at <= ? ORDER BY id LIMIT 1',
+            (now,),
+        ).fetchone()
+        return self._mark_leased(row, now + timeout)
+
+    def _mark_leased(self, row, visible_at: float) -> Optional[QueueMessage]:
+        if not row:
+            return None
+        self._db.execute(
+            'UPDATE queue SET visible_at = ?, leased_until = ?, attempts = attempts + 1 WHERE id = ?',
+            (visible_at, visible_at, row[0]),
+        )
+        return QueueMessage(row[0], row[1], row[2] + 1, row[3])
+
+    def lease_id(self, message_id: int, visibility_timeout: Optional[float] = None) -> Optional[QueueMessage]:
+        """按 id 租出指定消息（调度器决定发哪一条时用）；已 ack 的返回 None"""
+        now = time.time()
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        row = self._db.execute(
+            'SELECT id, payload, attempts, enqueued_at FROM queue WHERE id = ? AND acked_at IS NULL',
+            (message_id,),
+        ).fetchone()
+        return self._mark_leased(row, now + timeout)
+
+    def replace(self, message_id: int, payload: str, score: float = 0.0) -> bool:
+        """用更新的内容替换一条待处理消息（入队时间也刷新），消息已完成时返回 False"""
+        cursor = self._db.execute(
+            'UPDATE queue SET payload = ?, score = ?, enqueued_at = ? WHERE id = ? AND acked_at IS NULL',
+            (payload, score, time.time(), message_id),
+        )
+        return cursor.rowcount > 0
+
+    def pending(self) -> List[Tuple[int, float, Optional[str], float, float]]:
+        """所有待处理消息的 (id, 可取时间, key, score, 入队时间)，按 id 排序"""
+        return self._db.execute(
+            'SELECT id, visible_at, key, score, enqueued_at FROM queue WHERE acked_at IS NULL ORDER BY id'
+        ).fetchall()
+
+    def ack(self, message_id: int):
+        """处理完成"""
+        self._db.execute('UPDATE queue SET acked_at = ? WHERE id = ?', (time.time(), message_id))
+        self._acks_since_compact += 1
+        if self.compact_every and self._acks_since_compact >= self.compact_every:
+            self.compact()
+
+    def nack(self, message_id: int, delay: float = 0):
+        """放回队列，delay 秒后重新可取"""
+        self._db.execute(
+            'UPDATE queue SET visible_at = ?, leased_until = NULL WHERE id = ? AND acked_at IS NULL',
+            (time.time() + delay, message_id),
+        )
+        if self._event is not None:
+            self._event.set()
+
+    def release(self, message_id: int):
+        """原样放回（这次租出不算一次尝试），用于还没开始处理就需要推迟的消息"""
+        self._db.execute(
+            'UPDATE queue SET visible_at = ?, leased_until = NULL, attempts = MAX(attempts - 1, 0) '
+            'WHERE id = ? AND acked_at IS NULL',
+            (time.time(), message_id),
+        )
+        if self._event is not None:
+            self._event.set()
+
+    def requeue_leased(self) -> int:
+        """把所有租出去还没 ack 的消息立即放回（单消费者启动时用：上次进程崩溃时手里的消息）
+
+        只看 leased_until：nack 之后还在退避中的消息 visible_at 也在将来，但它们不是租出状态，保持原来的重试时间。
+        """
+        cursor = self._db.execute(
+            'UPDATE queue SET visible_at = ?, leased_until = NULL WHERE acked_at IS NULL AND leased_until IS NOT NULL',
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    def compact(self) -> int:
+        """删除超过保留期的已完成记录，截断 WAL，回收空闲页"""
+        cursor = self._db.execute(
+            'DELETE FROM queue WHERE acked_at IS NOT NULL AND acked_at < ?',
+            (time.time() - self.retention,),
+        )
+        # incremental_vacuum 每执行一步只释放一页，execute() 只走一步，要用 executescript 执行到底；
+        # 之后再截断 WAL，文件才会真正变小
+        self._db.executescript('PRAGMA incremental_vacuum')
+        self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._acks_since_compact = 0
+        return cursor.rowcount
+
+    def next_visible_at(self) -> Optional[float]:
+        """最早一条待处理消息的可取时间"""
+        row = self._db.execute('SELECT MIN(visible_at) FROM queue WHERE acked_at IS NULL').fetchone()
+        return row[0]
+
+    def __len__(self):
+        """待处理（含已租出未 ack）的消息数"""
+        return self._db.execute('SELECT COUNT(*) FROM queue WHERE acked_at IS NULL').fetchone()[0]
+
+    def qsize(self) -> int:
+        return len(self)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ---------- 异步接口 ----------
+
+    async def get(self, visibility_timeout: Optional[float] = None, max_wait: float = 60) -> QueueMessage:
+        """等到有可取的消息为止（新消息入队或延迟到期时唤醒）"""
+        if self._event is None:
+            self._event = asyncio.Event()
+        while True:
+            self._event.clear()
+            message = self.lease(visibility_timeout)
+            if message:
+                return message
+            next_at = self.next_visible_at()
+            wait = max_wait if next_at is None else min(max_wait, max(0.0, next_at - time.time()))
+            try:
+                await asyncio.wait_for(self._event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _benchmark(count: int):
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_queue.db')
+    queue = DurableQueue(path, compact_every=0)
+    payload = "🚀 $KERNEL just did 12.83x!\n\nCA: AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n\n#KERNEL #Solana"
+
+    start = time.perf_counter()
+    for _ in range(count):
+        queue.put(payload)
+    enqueue = time.perf_counter() - start
+
+    start = time.perf_counter()
+    while True:
+        message = queue.lease()
+        if not message:
+            break
+        queue.ack(message.id)
+    dequeue = time.perf_counter() - start
+
+    start = time.perf_counter()
+    queue.retention = 0
+    removed = queue.compact()
+    compact = time.perf_counter() - start
+
+    print(f"  入队   {count:>9,} 条  {enqueue / count * 1e6:>8.1f} µs/条  {count / enqueue:>10,.0f} 条/秒")
+    print(f"  出队+ack {count:>7,} 条  {dequeue / count * 1e6:>8.1f} µs/条  {count / dequeue:>10,.0f} 条/秒")
+    print(f"  压缩   删除 {removed:,} 条  {compact * 1e3:.1f} ms，文件 {os.path.getsize(path) / 1024:.0f} KB")
+    queue.close()
+
+
+# 测试
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1:
+        _benchmark(int(sys.argv[1]))
+        sys.exit(0)
+
+    path = os.path.join(tempfile.mkdtemp(), 'tweet_queue.db')
+    queue = DurableQueue(path, visibility_timeout=0.2)
+    queue.put("tweet 1")
+    queue.put("tweet 2")
+
+    first = queue.lease()
+    print(f"  取出: {first}")
+    queue.nack(queue.lease().id, delay=60)   # 退避中的重试，重启后不应被提前放回
+    queue.close()
+
+    # 模拟崩溃重启：没 ack 的消息还在
+    queue = DurableQueue(path, visibility_timeout=0.2)
+    print(f"  重启后待处理: {len(queue)} 条，放回未 ack 的: {queue.requeue_leased()} 条")
+
+    async def consume():
+        while queue.next_visible_at() <= time.time():
+            message = await queue.get()
+            print(f"  处理: {message.payload} (第 {message.attempts} 次)")
+            queue.ack(message.id)
+
+    asyncio.run(consume())
+    print(f"  还在退避中的重试: {len(queue)} 条")
@@ -0,0 +1,92 @@
+"""
+优雅关闭 - 收到 SIGTERM / SIGINT 后按顺序执行关闭步骤，每步都有超时，最后打印一份报告
+- install(): 在事件循环上注册信号；wait(): 等到收到信号
+- step(): 执行一步，超时或出错都记下来接着做下一步，不会卡住整个关闭过程
+- note(): 记下保存了什么、丢了什么，和各步骤一起出现在报告里
+- 关闭过程中再收到一次信号就立即退出（滚动部署卡住时的兜底）
+"""
+
+import os
+import time
+import signal
+import asyncio
+from typing import Awaitable, List, Optional, Tuple
+
+
+class GracefulShutdown:
+    def __init__(self):
+        self.reason: Optional[str] = None     # 触发关闭的信号名
+        self.started: Optional[float] = None
+        self.steps: List[Tuple[str, str, float]] = []   # (步骤, 结果, 耗时)
+        self.notes: List[str] = []
+        self._requested: Optional[asyncio.Event] = None   # 在事件循环里 install() 时创建
+
+    def install(self, loop=None, signals=(signal.SIGTERM, signal.SIGINT)) -> bool:
+        """注册信号处理（Windows 的事件循环不支持，返回 False）"""
+        loop = loop or asyncio.get_running_loop()
+        self._requested = asyncio.Event()
+        try:
+            for sig in signals:
+                loop.add_signal_handler(sig, self.request, sig.name)
+        except (NotImplementedError, RuntimeError):
+            return False
+        return True
+
+    def request(self, reason: str = 'manual'):
+        if self.reason is not None:
+            print(f"\n⛔ 关闭过程中再次收到 {reason}，立即退出")
+            os._exit(1)
+        print(f"\n🛑 收到 {reason}，开始优雅关闭...")
+        self.reason = reason
+        self.started = time.perf_counter()
+        self._requested.set()
+
+    @property
+    def requested(self) -> bool:
+        return self.reason is not None
+
+    async def wait(self):
+        await self._requested.wait()
+
+    async def step(self, name: str, awaitable: Awaitable, timeout: float) -> bool:
+        """执行一步关闭操作，timeout 秒内没完成就放弃（取消）这一步"""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(awaitable, timeout)
+            result = '完成'
+        except asyncio.TimeoutError:
+            result = f'超时 ({timeout:g}s)'
+        except Exception as e:
+            result = f'出错: {e}'
+        self.steps.append((name, result, time.perf_counter() - start))
+        return result == '完成'
+
+    def note(self, text: str):
+        self.notes.append(text)
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        lines = [f"🛑 关闭报告 ({self.reason or '连接断开'}，用时 {elapsed:.1f}s)"]
+        for name, result, seconds in self.steps:
+            icon = '✅' if result == '完成' else '⚠️'
+            lines.append(f"  {icon} {name:<12} {result:<16} {seconds:>5.1f}s")
+        for note in self.notes:
+            lines.append(f"  • {note}")
+        return "\n".join(lines)
+
+
+# 测试
+if __name__ == '__main__':
+    async def demo():
+        shutdown = GracefulShutdown()
+        shutdown.install()
+        asyncio.get_running_loop().call_later(0.2, os.kill, os.getpid(), signal.SIGTERM)
+        await shutdown.wait()
+
+        await shutdown.step('停止接收', asyncio.sleep(0), 1)
+        await shutdown.step('流水线', asyncio.sleep(0.3), 1)
+        await shutdown.step('发帖', asyncio.sleep(5), 0.5)   # 超时，放弃这一步
+        shutdown.note("推文队列: 3 条待发已落盘")
+        print(shutdown.report())
+
+    asyncio.run(demo())
@@ -1,8 +1,10 @@
-import re
 import os
 import asyncio
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
+from telethon.extensions import markdown
+
+from message_sanitizer import MessageSanitizer, PreparedFormat
 
 # ================= 配置区域 (从环境变量获取) =================
 
@@ -36,34 +38,58 @@ print("🤖 机器人正在启动...")
 # 使用 StringSession，这样就不需要本地文件了，适合 Zeabur 部署
 client = TelegramClient(StringSession(SESSION_STRING), int(API_ID), API_HASH)
 
+# 清洗器：去掉别人的链接 / @用户名 / 引流行，保留原消息的格式，再加上我们自己的"小尾巴"（小尾巴支持 markdown）
+sanitizer = MessageSanitizer(MY_FOOTER, parse=markdown.parse)
+
+async def forward(message, media=None):
+    """清洗文本、加小尾巴后发到目标频道；media 可以是单个媒体，也可以是相册的媒体列表"""
+    # --- 清洗逻辑 (关键) ---
+    # 按原文 + 格式实体清洗，粗体 / 代码等格式原样带过去
+    new_text, new_entities = sanitizer.sanitize(message.raw_text or "", message.entities)
+
+    # 转发 (带图片/视频一起发)
+    # 如果消息有媒体文件(图片等)，会一起发送；媒体列表会作为一个相册发出，只带一条说明
+    # 实体通过 parse_mode 传：相册的发送路径不认 formatting_entities，会把原文当 markdown 重新解析
+    await client.send_message(
+        DEST_CHANNEL,
+        new_text,
+        parse_mode=PreparedFormat(new_entities),
+        file=media
+    )
+
+
 @client.on(events.NewMessage(chats=SOURCE_CHANNEL))
 async def handler(event):
+    # 相册里的每张图都会触发一次 NewMessage，交给下面的 Album 处理器整组转发
+    if event.message.grouped_id:
+        return
+
     try:
         # 获取原始文本
         original_text = event.message.text or ""
         print(f"📩 收到新消息: {original_text[:20]}...")
 
-        # --- 清洗逻辑 (关键) ---
+        await forward(event.message, event.message.media)
+        print("✅ 转发并修改成功！")
 
-        # 1. 去掉原始链接 (正则匹配 t.me 链接和 @username)
-        # 这是一个简单的过滤，把别人的引流链接删掉
-        clean_text = re.sub(r'(https?://t\.me/[a-zA-Z0-9_]+)', '', original_text)
-        clean_text = re.sub(r'(@[a-zA-Z0-9_]+)', '', clean_text)
+    except Exception as e:
+        print(f"❌ 转发出错: {e}")
 
-        # 2. 加上我们自己的“小尾巴”
-        new_text = clean_text.strip() + "\n" + MY_FOOTER
 
-        # 3. 转发 (带图片/视频一起发)
-        # 如果消息有媒体文件(图片等)，会一起发送
-        await client.send_message(
-            DEST_CHANNEL,
-            new_text,
-            file=event.message.media
-        )
-        print("✅ 转发并修改成功！")
+@client.on(events.Album(chats=SOURCE_CHANNEL))
+async def album_handler(event):
+    """相册（多张图 / 视频共享 grouped_id）：整组一次发出，一条说明、一个小尾巴"""
+    try:
+        original_text = event.text or ""
+        print(f"📩 收到相册 ({len(event.messages)} 个媒体): {original_text[:20]}...")
+
+        # 说明文字在相册的某一条消息上
+        caption = next((message for message in event.messages if message.raw_text), event.messages[0])
+        await forward(caption, [message.media for message in event.messages])
+        print("✅ 相册转发并修改成功！")
 
     except Exception as e:
-        print(f"❌ 转发出错: {e}")
+        print(f"❌ 相册转发出错: {e}")
 
 # 启动客户端
 print("🔗 正在连接 Telegram 服务器...")
@@ -11,18 +11,33 @@ TG 信号 → AI 改写 → 发 Twitter + 转发 TG 频道
 - 新号保护模式
 """
 
-import re
 import os
 import asyncio
+import time
 import random
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
+from telethon.extensions import markdown
 
 from ai_rewriter import AIRewriter
 from twitter_poster import TwitterPoster
-from signal_parser import SignalParser
+from signal_parser import SignalParser, gain_value
+from signal_dedup import CADedupIndex, Decision
+from durable_queue import DurableQueue
+from tweet_scheduler import TweetScheduler, ORDER_GAIN
+from signal_pipeline import SignalRecord, Stage, StageStats, Pipeline
+from channel_cursor import ChannelCursor
+from message_sanitizer import MessageSanitizer, PreparedFormat
+import metrics
+from metrics import Counter, Gauge, Histogram
+from startup_profile import StartupProfile
+from graceful_shutdown import GracefulShutdown
+
+# 启动时间线（从进程启动算起，到这里就是解释器启动 + import 的耗时）
+startup = StartupProfile()
+startup.record('import', startup.started, time.perf_counter())
 
 # ================= 配置区域 =================
 
@@ -51,6 +66,40 @@ MY_FOOTER = os.getenv('MY_FOOTER', """
 👉 t.me/egeyeaimeme
 """)
 
+# CA 去重配置（同一个 CA 在窗口内只发一次，涨幅翻倍才再发）
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', '21600'))                  # 去重窗口（秒），默认6小时
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', '10000'))        # 窗口内最多记录多少个 CA
+DEDUP_UPGRADE_RATIO = float(os.getenv('DEDUP_UPGRADE_RATIO', '2.0'))  # 涨幅达到上次的几倍才再发
+DEDUP_BLOOM_WINDOW = int(os.getenv('DEDUP_BLOOM_WINDOW', '0'))    # 布隆过滤器长窗口（秒），0 为关闭
+
+# 推文队列（SQLite 持久化，重启不丢）
+TWEET_QUEUE_PATH = os.getenv('TWEET_QUEUE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tweet_queue.db'))
+TWEET_MAX_ATTEMPTS = int(os.getenv('TWEET_MAX_ATTEMPTS', '3'))  # 发推出错最多重试几次
+TWEET_MAX_AGE = int(os.getenv('TWEET_MAX_AGE', '7200'))          # 排队超过多少秒的推文直接丢弃，0 为不限
+TWEET_ORDER = os.getenv('TWEET_ORDER', ORDER_GAIN)               # 额度紧张时先发哪条: gain（涨幅高）/ fresh（最新）/ fifo
+
+# 每条推文发完后的随机间隔（秒），避免太规律
+POST_GAP = (5, 15)
+
+# 流水线配置（每个阶段独立的并发数，阶段之间的队列满了上游会等待）
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '100'))          # 每个阶段最多排队多少条
+PIPELINE_INGEST_WORKERS = int(os.getenv('PIPELINE_INGEST_WORKERS', '2'))    # 接收 / TG 转发并发数
+PIPELINE_REWRITE_WORKERS = int(os.getenv('PIPELINE_REWRITE_WORKERS', '4'))  # 同时改写几条信号
+
+# 补抓配置（重启后补发停机期间漏掉的信号）
+CURSOR_PATH = os.getenv('CURSOR_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'channel_cursor.db'))
+BACKFILL_MAX_AGE = int(os.getenv('BACKFILL_MAX_AGE', '1800'))  # 只补抓多少秒内的消息，更早的直接跳过
+BACKFILL_LIMIT = int(os.getenv('BACKFILL_LIMIT', '500'))       # 补抓每一轮扫多少条，扫满了接着扫下一轮
+
+# 指标（Prometheus 文本格式，本地端口；kill -USR1 打印快照）
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))            # 指标端口，0 为不开
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')         # 默认只监听本机
+
+# 优雅关闭（SIGTERM / Ctrl+C）：各步骤的超时，加起来要小于平台给的停止宽限时间
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '15'))  # 等流水线里的信号（改写中）处理完
+SHUTDOWN_POST_TIMEOUT = float(os.getenv('SHUTDOWN_POST_TIMEOUT', '30'))    # 等正在打字的推文发完
+SHUTDOWN_STEP_TIMEOUT = float(os.getenv('SHUTDOWN_STEP_TIMEOUT', '5'))     # 其余每一步（关浏览器、断开 TG 等）
+
 # 悉尼时区
 TIMEZONE = ZoneInfo('Australia/Sydney')
 
@@ -59,8 +108,27 @@ TIMEZONE = ZoneInfo('Australia/Sydney')
 tg_client = None
 ai_rewriter = None
 twitter_poster = None
+twitter_launched = None   # 已经开始启动浏览器的发帖器（登录检查前就记下，关闭时不管登录没登录都要关掉）
+ai_ready = None        # asyncio.Event：AI 改写器初始化结束（不管成功与否）
+twitter_ready = None   # asyncio.Event：Twitter 发帖器初始化结束（不管成功与否）
 signal_parser = None
-twitter_queue = asyncio.Queue()
+dedup_index = None
+twitter_queue = None
+tweet_scheduler = None
+signal_pipeline = None
+channel_cursor = None
+accepting = True       # 关闭时置 False：不再认领新消息，worker 不再取新推文
+post_idle = None       # asyncio.Event：当前没有正在发的推文（关闭时等它）
+post_stats = StageStats('post')  # 发帖阶段在持久化队列之后，单独统计
+sanitizer = MessageSanitizer(MY_FOOTER, parse=markdown.parse)  # TG 转发清洗 + 小尾巴（小尾巴支持 markdown）
+
+# ================= 指标 =================
+
+RECEIVE_TO_PARSE_SECONDS = Histogram('signal_receive_to_parse_seconds', '从收到 TG 消息到开始解析（秒）')
+QUEUE_WAIT_SECONDS = Histogram('tweet_queue_wait_seconds', '推文在发帖队列里等待的时间（秒）')
+END_TO_END_SECONDS = Histogram('signal_end_to_end_seconds', '从收到信号到推文发出（秒）')
+FORWARD_SECONDS = Histogram('tg_forward_seconds', 'TG 转发耗时（秒）', ['result'])
+SCHEDULER_DEPTH = Gauge('tweet_scheduler_depth', '发帖队列里排队中的推文数')
 
 # ================= 初始化函数 =================
 
@@ -74,12 +142,21 @@ def check_config():
 
 
 async def init_services():
-    """初始化所有服务"""
-    global tg_client, ai_rewriter, twitter_poster, signal_parser
+    """初始化本地服务（解析、去重、队列、流水线、指标），不碰网络，很快完成
+
+    AI 改写器和 Twitter 浏览器比较慢，由 init_ai / init_twitter 在后台并发初始化。
+    """
+    global tg_client, signal_parser, dedup_index, twitter_queue, tweet_scheduler, signal_pipeline, channel_cursor
+    global ai_ready, twitter_ready, post_idle
 
     print("🤖 EgeEye Signal Bot V2 启动中...")
     print(f"⏰ 当前悉尼时间: {datetime.now(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')}")
 
+    ai_ready = asyncio.Event()
+    twitter_ready = asyncio.Event()
+    post_idle = asyncio.Event()
+    post_idle.set()
+
     # Telegram 客户端
     tg_client = TelegramClient(StringSession(SESSION_STRING), int(API_ID), API_HASH)
 
@@ -87,79 +164,171 @@ async def init_services():
     signal_parser = SignalParser()
     print("✅ 信号解析器已就绪")
 
-    # AI 改写器
+    # CA 去重索引
+    dedup_index = CADedupIndex(
+        ttl=DEDUP_TTL,
+        max_size=DEDUP_MAX_SIZE,
+        upgrade_ratio=DEDUP_UPGRADE_RATIO,
+        bloom_window=DEDUP_BLOOM_WINDOW,
+    )
+    print(f"✅ CA 去重已启用 (窗口 {DEDUP_TTL} 秒，涨幅 {DEDUP_UPGRADE_RATIO} 倍以上再发)")
+
+    # 推文队列：上次进程退出时没发完的推文还在
+    twitter_queue = DurableQueue(TWEET_QUEUE_PATH)
+    recovered = twitter_queue.requeue_leased()
+    tweet_scheduler = TweetScheduler(twitter_queue, order=TWEET_ORDER, max_age=TWEET_MAX_AGE)
+    print(f"✅ 推文队列已就绪 (待发 {len(twitter_queue)} 条，恢复未确认 {recovered} 条)")
+
+    # 消息游标：记录源频道处理到哪条消息
+    channel_cursor = ChannelCursor(CURSOR_PATH, SOURCE_CHANNEL)
+
+    # 信号流水线：接收 → 解析 → 去重 → 改写 → 入队（发帖由 twitter_worker 从持久化队列里取）
+    signal_pipeline = build_pipeline()
+    signal_pipeline.start()
+    print(f"✅ 信号流水线已启动 (改写并发 {PIPELINE_REWRITE_WORKERS}，每段队列 {PIPELINE_QUEUE_SIZE})")
+
+    # 指标
+    SCHEDULER_DEPTH.set_function(lambda: len(tweet_scheduler))
+    metrics.install_dump_signal(asyncio.get_running_loop())
+    if METRICS_PORT:
+        try:
+            metrics.start_server(METRICS_PORT, METRICS_HOST)
+            print(f"📊 指标端口: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ 指标端口启动失败: {e}")
+
+
+async def init_ai():
+    """AI 改写器（google.generativeai 的导入和配置放到线程里，不卡事件循环）"""
+    global ai_rewriter
+
     try:
-        ai_rewriter = AIRewriter()
-        if GEMINI_API_KEY:
-            print("✅ AI 改写器已启用 (Gemini)")
+        ai_rewriter = await asyncio.to_thread(AIRewriter)
+        if ai_rewriter.use_ai:
+            print(f"✅ AI 改写器已启用 ({ai_rewriter.backend.name})")
         else:
-            print("⚠️ 未设置 GEMINI_API_KEY，使用模板模式")
+            print("⚠️ 未启用 AI 后端，使用模板模式")
     except Exception as e:
         print(f"⚠️ AI 改写器初始化失败: {e}")
         ai_rewriter = None
+    finally:
+        ai_ready.set()
 
-    # Twitter 发帖器
-    if ENABLE_TWITTER:
-        try:
-            twitter_poster = TwitterPoster()
-            await twitter_poster.init_browser()
 
-            is_logged_in = await twitter_poster.check_login()
-            if is_logged_in:
-                print("✅ Twitter 已登录")
-            else:
-                print("❌ Twitter 未登录，请先运行 python twitter_login.py")
-                print("   Twitter 功能将被禁用")
-                await twitter_poster.close()
-                twitter_poster = None
-        except Exception as e:
-            print(f"❌ Twitter 初始化失败: {e}")
-            twitter_poster = None
-    else:
+async def init_twitter():
+    """Twitter 发帖器：启动浏览器并检查登录，就绪后 twitter_worker 才开始发"""
+    global twitter_poster, twitter_launched
+
+    if not ENABLE_TWITTER:
         print("⚠️ Twitter 发帖已禁用 (ENABLE_TWITTER=false)")
+        twitter_ready.set()
+        return
+
+    try:
+        poster = twitter_launched = TwitterPoster()
+        await poster.init_browser()
+
+        is_logged_in = await poster.check_login()
+        if is_logged_in:
+            print("✅ Twitter 已登录")
+            twitter_poster = poster
+        else:
+            print("❌ Twitter 未登录，请先运行 python twitter_login.py")
+            print("   Twitter 功能将被禁用")
+            await poster.close()
+            twitter_launched = None
+    except Exception as e:
+        print(f"❌ Twitter 初始化失败: {e}")
+        twitter_poster = None
+        # 浏览器可能已经起来了，关掉，不留下孤儿进程
+        if twitter_launched:
+            try:
+                await twitter_launched.close()
+            except Exception:
+                pass
+            twitter_launched = None
+    finally:
+        twitter_ready.set()
+
+
+def build_pipeline(stats_window: int = 200) -> Pipeline:
+    """按配置组装信号流水线（replay.py 也用它）"""
+    return Pipeline([
+        Stage('ingest', stage_ingest, PIPELINE_INGEST_WORKERS, PIPELINE_QUEUE_SIZE, stats_window),
+        Stage('parse', stage_parse, 1, PIPELINE_QUEUE_SIZE, stats_window),
+        Stage('dedup', stage_dedup, 1, PIPELINE_QUEUE_SIZE, stats_window),  # 去重依赖到达顺序，只能单并发
+        Stage('rewrite', stage_rewrite, PIPELINE_REWRITE_WORKERS, PIPELINE_QUEUE_SIZE, stats_window),
+        Stage('enqueue', stage_enqueue, 1, PIPELINE_QUEUE_SIZE, stats_window),
+    ], on_exit=release_record)
 
 
 async def twitter_worker():
     """Twitter 发帖工作线程"""
+    # 浏览器在后台启动，没好之前推文先在持久化队列里排着
+    await twitter_ready.wait()
+    if not twitter_poster:
+        print("⚠️ Twitter 不可用，推文留在队列里，下次启动再发")
+        return
     print("🐦 Twitter worker 已启动")
 
-    while True:
+    while accepting:
         try:
-            # 从队列获取待发内容
-            tweet_content = await twitter_queue.get()
+            # 调度器精确睡到最早可发的时间（持久化队列，发成功才 ack，进程崩溃后会重新投递）
+            message = await tweet_scheduler.get()
+            record = SignalRecord.from_payload(message.payload)
+            tweet_content = record.tweet
 
             if not twitter_poster:
-                print("⚠️ Twitter 未就绪，跳过")
-                twitter_queue.task_done()
+                print("⚠️ Twitter 未就绪，稍后重试")
+                tweet_scheduler.retry(message, delay=60)
+                continue
+
+            # 发帖器给出下一次可发时间：没到就整体暂停到那个时间，这条放回原位，顺序不变
+            # 达到每日上限也一样，暂停到零点额度重置，积压的推文留在队列里（太旧的由调度器按 max_age 丢弃）
+            ready_at, why = twitter_poster.next_post_time()
+            if ready_at > time.time():
+                resume_at = ready_at + random.randint(10, 30)
+                label = {'sleep': '休眠中', 'daily_limit': '达到每日上限'}.get(why, '发帖限流')
+                print(f"⏳ {label}，"
+                      f"{datetime.fromtimestamp(resume_at, TIMEZONE).strftime('%m-%d %H:%M:%S')} 后继续")
+                tweet_scheduler.pause_until(resume_at)
+                tweet_scheduler.defer(message)
                 continue
 
             # 尝试发推
-            success, reason = await twitter_poster.post_tweet(tweet_content)
-
-            if not success:
-                if "休眠" in reason:
-                    # 休眠时段，重新放回队列，等会再试
-                    print(f"😴 休眠中，1800秒后重试...")
-                    await asyncio.sleep(1800)  # 等30分钟
-                    await twitter_queue.put(tweet_content)
-                elif "等待" in reason:
-                    # 需要等待，提取等待时间
-                    wait_match = re.search(r'(\d+)', reason)
-                    if wait_match:
-                        wait_time = int(wait_match.group(1))
-                        print(f"⏳ 等待 {wait_time} 秒后重试...")
-                        await asyncio.sleep(wait_time + random.randint(10, 30))
-                        await twitter_queue.put(tweet_content)
-                elif "上限" in reason:
-                    print(f"📊 达到每日上限，明天继续")
-                    # 不重试，丢弃这条
+            QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - message.enqueued_at))
+            start = time.perf_counter()
+            post_idle.clear()
+            try:
+                success, reason = await twitter_poster.post_tweet(tweet_content)
+            except asyncio.CancelledError:
+                # 关闭时等不及发完：已经点了发送的算发出，否则原样放回队列，下次启动再发
+                if twitter_poster.submitted:
+                    tweet_scheduler.ack(message)
                 else:
-                    print(f"⚠️ 发推失败: {reason}")
-
-            twitter_queue.task_done()
+                    tweet_scheduler.defer(message)
+                raise
+            finally:
+                post_idle.set()
+            post_stats.record(time.perf_counter() - start, passed=success)
+
+            if success:
+                tweet_scheduler.ack(message)
+                if record.received_at:
+                    END_TO_END_SECONDS.observe(record.age())
+                    print(f"⏱️ 从收到信号到发出用时 {record.age():.0f} 秒")
+            elif "休眠" in reason or "等待" in reason or "上限" in reason:
+                # 检查和发送之间状态变了，放回原位，下一轮按发帖器给的时间暂停
+                tweet_scheduler.defer(message)
+            elif "超长" in reason or message.attempts >= TWEET_MAX_ATTEMPTS:
+                print(f"⚠️ 发推失败，放弃: {reason}")
+                tweet_scheduler.ack(message)
+            else:
+                print(f"⚠️ 发推失败 (第 {message.attempts} 次): {reason}，稍后重试")
+                tweet_scheduler.retry(message, delay=60 * message.attempts)
 
             # 随机延迟，避免太规律
-            await asyncio.sleep(random.randint(5, 15))
+            await asyncio.sleep(random.uniform(*POST_GAP))
 
         except Exception as e:
             print(f"❌ Twitter worker 错误: {e}")
@@ -169,69 +338,218 @@ async def twitter_worker():
 # ================= 消息处理 =================
 
 async def handle_signal(event):
-    """处理新信号"""
-    global tg_client
+    """收到新消息：交给流水线（流水线排满时在这里等待）"""
+    # 相册里的每个媒体都会触发一次 NewMessage，整组由 handle_album 处理
+    if event.message.grouped_id or not accepting:
+        return
+    await submit_messages([event.message])
 
-    try:
-        original_text = event.message.text or ""
 
-        # 跳过空消息
-        if not original_text.strip():
-            return
+async def handle_album(event):
+    """收到相册：整组作为一条信号，转发时一次发出、只带一条说明"""
+    if not accepting:
+        return
+    await submit_messages(event.messages)
+
+
+async def submit_messages(messages, received_at=None) -> bool:
+    """认领消息并交给流水线；实时和补抓共用，已经处理过的消息直接跳过（返回 False）"""
+    message_ids = [message.id for message in messages if channel_cursor.claim(message.id)]
+    if not message_ids:
+        return False
+    media = [message.media for message in messages] if len(messages) > 1 else messages[0].media
+    # 用原文 + 格式实体（而不是 markdown 文本），转发时格式才能原样保留；相册的说明在其中一条消息上
+    caption = next((message for message in messages if message.raw_text), messages[0])
+    await signal_pipeline.submit(SignalRecord(
+        caption.raw_text or "",
+        received_at=received_at or time.time(),
+        message_ids=message_ids,
+        media=media,
+        entities=caption.entities,
+    ))
+    return True
+
+
+def release_record(record: SignalRecord):
+    """记录离开流水线（发出 / 过滤 / 出错），推进消息游标"""
+    for message_id in record.message_ids:
+        channel_cursor.done(message_id)
+
 
-        print(f"\n{'='*50}")
-        print(f"📩 收到新信号")
-        print(f"   {original_text[:80]}...")
+async def backfill():
+    """补抓停机期间漏掉的消息，按消息顺序进流水线；和实时消息共用游标认领，不会重复处理
 
-        # 1. 解析信号
-        signal = signal_parser.parse(original_text)
+    超过 BACKFILL_MAX_AGE 的消息直接跳过，从截止时间之后的第一条开始扫。BACKFILL_LIMIT 是每一轮扫的条数：
+    扫满了就接着扫下一轮（每轮重新跳过这期间变旧的消息），一直扫到追上实时消息才结束补抓；
+    结束之前水位线不会越过补抓扫到的位置。
+    """
+    if channel_cursor.start_id is None:
+        print("📭 第一次运行，不补抓历史消息")
+        return
+
+    print(f"📥 补抓消息 {channel_cursor.start_id} 之后漏掉的信号...")
+    start_id = channel_cursor.start_id
+    submitted = scanned = 0
+    album = []
 
-        if signal.ca:
-            print(f"   币名: {signal.token_name}")
-            print(f"   CA: {signal.ca[:20]}...")
-            print(f"   涨幅: {signal.gain}")
+    async def flush_album():
+        nonlocal submitted
+        if album:
+            submitted += await submit_messages(list(album), album[0].date.timestamp())
+            channel_cursor.backfilled(album[-1].id)
+            album.clear()
 
-        # 2. 转发到 TG 频道（如果启用）
-        if ENABLE_TG_FORWARD:
-            await forward_to_tg(original_text, event.message.media)
+    while True:
+        # 截止时间之前最新的一条：它和它之前的都太旧，标记为已处理，从它后面开始扫
+        cutoff = time.time() - BACKFILL_MAX_AGE
+        async for message in tg_client.iter_messages(SOURCE_CHANNEL, limit=1, offset_date=cutoff):
+            if message.id > start_id:
+                if channel_cursor.claim(message.id):
+                    channel_cursor.done(message.id)
+                channel_cursor.backfilled(message.id)
+                print(f"   {start_id + 1} ~ {message.id} 超过 {BACKFILL_MAX_AGE} 秒，跳过")
+                start_id = message.id
+
+        # 多取一条，用来判断这一轮之后还有没有
+        count, last_id, more = 0, start_id, False
+        async for message in tg_client.iter_messages(SOURCE_CHANNEL, min_id=start_id,
+                                                     reverse=True, limit=BACKFILL_LIMIT + 1):
+            if count == BACKFILL_LIMIT:
+                more = True
+                break
+            count += 1
+            last_id = message.id
+
+            # 给实时消息留一半的排队空间，补抓不挡实时
+            while signal_pipeline.stages[0].depth() > PIPELINE_QUEUE_SIZE // 2:
+                await asyncio.sleep(0.2)
+
+            if album and message.grouped_id != album[0].grouped_id:
+                await flush_album()
+            if message.grouped_id:
+                album.append(message)
+                continue
+            submitted += await submit_messages([message], message.date.timestamp())
+            channel_cursor.backfilled(message.id)
+        scanned += count
+        if not more:
+            break
+
+        # 被这一轮截断的相册下一轮从头再扫（整轮都是这个相册时只能先发出去）
+        if album and album[0].id - 1 > start_id:
+            last_id = album[0].id - 1
+            scanned -= len(album)
+            album.clear()
+        else:
+            await flush_album()
+        start_id = last_id
+        print(f"   补抓已扫 {scanned} 条，继续扫 {start_id} 之后的...")
+    await flush_album()
+    channel_cursor.end_backfill()
 
-        # 3. 改写并发 Twitter（仅当有 CA 时）
-        if signal.ca and ENABLE_TWITTER and twitter_poster and ai_rewriter:
-            tweet_content = await ai_rewriter.rewrite(original_text)
+    print(f"📥 补抓完成: 扫了 {scanned} 条，{submitted} 条进入流水线")
 
-            if tweet_content:
-                await twitter_queue.put(tweet_content)
-                print(f"📝 已加入 Twitter 队列 (队列长度: {twitter_queue.qsize()})")
-        elif not signal.ca:
-            print("⚠️ 未找到 CA，仅转发 TG")
 
+async def run_backfill():
+    try:
+        await backfill()
     except Exception as e:
-        print(f"❌ 处理信号出错: {e}")
-        import traceback
-        traceback.print_exc()
+        # 游标停在补抓扫到的位置，下次启动会从那里继续
+        print(f"❌ 补抓失败 (不影响实时监听，下次启动重试): {e}")
 
 
-async def forward_to_tg(original_text: str, media=None):
-    """转发到 TG 频道"""
+async def stage_ingest(record: SignalRecord):
+    """接收：跳过空消息，转发 TG 频道"""
+    if not record.raw_text.strip():
+        return None
+
+    print(f"\n{'='*50}")
+    print(f"📩 收到新信号" + (f" (相册 {len(record.media)} 个媒体)" if isinstance(record.media, list) else ""))
+    print(f"   {record.raw_text[:80]}...")
+
+    if ENABLE_TG_FORWARD:
+        await forward_to_tg(record.raw_text, record.entities, record.media)
+    record.media = record.entities = None
+    return record
+
+
+async def stage_parse(record: SignalRecord):
+    """解析：只在这里解析一次，后面的阶段都用 record.signal"""
+    RECEIVE_TO_PARSE_SECONDS.observe(record.age())
+    signal = signal_parser.parse(record.raw_text)
+    record.signal = signal
+
+    if not signal.ca:
+        print("⚠️ 未找到 CA，仅转发 TG")
+        return None
+
+    print(f"   币名: {signal.token_name}")
+    print(f"   CA: {signal.ca[:20]}...")
+    print(f"   涨幅: {signal.gain}")
+
+    # 改写并发 Twitter（仅当有 CA 时）；AI / Twitter 还在初始化时照常往下走，推文先排队
+    if not ENABLE_TWITTER:
+        return None
+    if (twitter_ready.is_set() and not twitter_poster) or (ai_ready.is_set() and not ai_rewriter):
+        return None
+    return record
+
+
+async def stage_dedup(record: SignalRecord):
+    """去重：重复的 CA 不调用 AI，也不占发帖额度"""
+    signal = record.signal
+    decision = dedup_index.check_signal(signal)
+    if decision is Decision.SKIP:
+        print(f"🔁 重复 CA，跳过 Twitter (涨幅 {signal.gain})")
+        return None
+    if decision is Decision.UPGRADE:
+        print(f"⬆️ 同一 CA 涨幅升级到 {signal.gain}，再发一条")
+    record.decision = decision.value
+    return record
+
+
+async def stage_rewrite(record: SignalRecord):
+    """改写：直接用解析好的 SignalData"""
+    await ai_ready.wait()
+    if not ai_rewriter:
+        return None
+    record.tweet = await ai_rewriter.rewrite_signal(record.signal)
+    return record if record.tweet else None
+
+
+async def stage_enqueue(record: SignalRecord):
+    """入队：整条记录落盘，同一个 CA 还没发出去的旧推文直接被新的替换"""
+    signal = record.signal
+    record.mark('enqueue')
+    _, replaced = tweet_scheduler.put(record.to_payload(), key=signal.ca, score=gain_value(signal.gain))
+    if replaced:
+        print(f"♻️ 已替换队列里同一 CA 的旧推文 (队列长度: {len(tweet_scheduler)})")
+    else:
+        print(f"📝 已加入 Twitter 队列 (队列长度: {len(tweet_scheduler)})")
+    return record
+
+
+async def forward_to_tg(original_text: str, entities=None, media=None):
+    """转发到 TG 频道（media 是列表时作为一个相册发出），格式实体跟着原文一起清洗"""
     global tg_client
 
+    started = time.perf_counter()
     try:
-        # 清洗内容
-        clean_text = re.sub(r'(https?://t\.me/[a-zA-Z0-9_]+)', '', original_text)
-        clean_text = re.sub(r'(@[a-zA-Z0-9_]+)', '', clean_text)
-
-        # 加小尾巴
-        tg_content = clean_text.strip() + "\n" + MY_FOOTER
+        # 清洗内容 + 加小尾巴
+        tg_content, tg_entities = sanitizer.sanitize(original_text, entities)
 
         # 发送
         await tg_client.send_message(
             DEST_CHANNEL,
             tg_content,
+            parse_mode=PreparedFormat(tg_entities),  # 相册不认 formatting_entities，只能走 parse_mode
             file=media
         )
+        FORWARD_SECONDS.labels(result='ok').observe(time.perf_counter() - started)
         print("✅ TG 转发成功")
 
     except Exception as e:
+        FORWARD_SECONDS.labels(result='error').observe(time.perf_counter() - started)
         print(f"❌ TG 转发失败: {e}")
 
 
@@ -244,30 +562,113 @@ async def main():
     if not check_config():
         return
 
+    shutdown = GracefulShutdown()
+    shutdown.install()
+
     await init_services()
+    startup.mark('core_ready')
 
     # 注册消息处理器
     @tg_client.on(events.NewMessage(chats=SOURCE_CHANNEL))
     async def handler(event):
         await handle_signal(event)
 
+    @tg_client.on(events.Album(chats=SOURCE_CHANNEL))
+    async def album_handler(event):
+        await handle_album(event)
+
+    # AI 和浏览器在后台并发初始化；Telegram 一连上就开始接信号，Twitter 就绪后再加入发帖
+    twitter_init = asyncio.create_task(startup.track('twitter', init_twitter()))
+    initializing = [asyncio.create_task(startup.track('ai', init_ai())), twitter_init]
+
     # 启动 TG 客户端
     print(f"\n🔗 正在连接 Telegram...")
-    await tg_client.start()
-    print(f"🎧 正在监听: {SOURCE_CHANNEL}")
+    await startup.track('telegram', tg_client.start())
+    startup.mark('listening')
+    print(f"🎧 正在监听: {SOURCE_CHANNEL} (启动后 {startup.elapsed():.1f} 秒)")
     print(f"📤 TG 转发到: {DEST_CHANNEL}")
 
-    # 启动 Twitter worker
-    if ENABLE_TWITTER and twitter_poster:
-        asyncio.create_task(twitter_worker())
-        print(f"🐦 Twitter 发帖已启用")
+    # 补抓停机期间的消息（后台进行，实时消息照常处理）
+    background = [asyncio.create_task(run_backfill())]
+
+    # 启动 Twitter worker（等浏览器就绪后才开始发）
+    worker = asyncio.create_task(twitter_worker()) if ENABLE_TWITTER else None
 
     print(f"\n{'='*50}")
     print("✅ 系统已就绪，等待信号...")
     print(f"{'='*50}\n")
 
-    # 保持运行
-    await tg_client.run_until_disconnected()
+    background.append(asyncio.create_task(report_startup(initializing)))
+
+    # 保持运行，直到收到 SIGTERM / Ctrl+C 或 TG 断开
+    disconnected = asyncio.ensure_future(tg_client.run_until_disconnected())
+    requested = asyncio.ensure_future(shutdown.wait())
+    await asyncio.wait([disconnected, requested], return_when=asyncio.FIRST_COMPLETED)
+    requested.cancel()
+
+    await shutdown_services(shutdown, background, worker, twitter_init)
+    print(shutdown.report())
+
+
+async def report_startup(background):
+    """后台初始化全部结束后打印启动时间线"""
+    await asyncio.gather(*background, return_exceptions=True)
+    if twitter_poster:
+        print(f"🐦 Twitter 发帖已启用")
+    print(startup.report())
+
+
+async def shutdown_services(shutdown: GracefulShutdown, background, worker, twitter_init=None):
+    """按顺序关闭：停止接收 → 等流水线 → 等正在发的推文 → 落盘 → 关浏览器 → 断开 TG
+
+    没处理完的消息不推进游标，下次启动由补抓重新处理；推文队列本身就在 SQLite 里，不会丢。
+    """
+    global accepting
+
+    # 1. 停止接收：新消息不再认领，补抓直接取消
+    #    （AI / 浏览器的初始化不取消：取消了流水线会把等着它们的信号当成"不用发"放掉，游标就前进了）
+    accepting = False
+    for task in background:
+        task.cancel()
+    await shutdown.step('停止接收', asyncio.gather(*background, return_exceptions=True), SHUTDOWN_STEP_TIMEOUT)
+
+    # 2. 等流水线里的信号（主要是改写中的）走完，进推文队列
+    before = channel_cursor.inflight()
+    await shutdown.step('流水线', signal_pipeline.join(), SHUTDOWN_DRAIN_TIMEOUT)
+    await signal_pipeline.stop()
+    left = channel_cursor.inflight()
+    shutdown.note(f"流水线: 处理完 {before - left} 条" +
+                  (f"，未完成 {left} 条（游标没前进，下次启动补抓）" if left else ""))
+
+    # 3. 正在打字的推文等它发完，worker 空闲时直接停
+    if worker is not None:
+        busy = not post_idle.is_set()
+        finished = await shutdown.step('发帖', post_idle.wait(), SHUTDOWN_POST_TIMEOUT)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        if busy:
+            shutdown.note("正在发的推文: " + ("已发完" if finished else "没发完，已放回队列"))
+
+    # 4. 落盘：推文队列、消息游标、改写缓存，最后的指标打到日志里
+    pending = len(twitter_queue)
+    twitter_queue.close()
+    channel_cursor.close()
+    if ai_rewriter:
+        ai_rewriter.close()
+    shutdown.note(f"推文队列: {pending} 条待发已落盘，下次启动继续发")
+    shutdown.note(f"消息游标: 停在 {channel_cursor.last_id}，停止接收后的新消息下次启动补抓 ({BACKFILL_MAX_AGE} 秒内)")
+    metrics.dump()
+
+    # 5. 浏览器还在启动 / 检查登录就取消（worker 已经停了，不会再用到它），然后保存发帖统计、关闭浏览器；
+    #    启动到一半的也要关，否则 Chromium 会成为孤儿进程
+    if twitter_init is not None and not twitter_init.done():
+        twitter_init.cancel()
+        await asyncio.gather(twitter_init, return_exceptions=True)
+    if twitter_launched:
+        await shutdown.step('浏览器', twitter_launched.close(), SHUTDOWN_STEP_TIMEOUT)
+
+    # 6. 断开 Telegram
+    await shutdown.step('Telegram', tg_client.disconnect(), SHUTDOWN_STEP_TIMEOUT)
 
 
 # ================= 入口 =================
@@ -0,0 +1,320 @@
+"""
+转发清洗 - 去掉别人的引流内容，加上自己的小尾巴（main.py 和 main_v2 共用）
+- 一个预编译正则扫一遍：t.me / telegram.me 链接、@用户名、普通链接里的跟踪参数（utm_* / ref 等）
+- 按 TG 的 MessageEntity 处理：输入原文 (message.raw_text) + 实体，输出清洗后的文本 + 平移后的实体，
+  粗体 / 代码 / 链接等格式原样保留；隐藏链接 (TextUrl) 指向别的频道时只去掉链接、保留文字
+- 链接删掉后整行只剩引流话术（"更多信号请关注 …"、"联系管理员 …"）时整行删掉；
+  行里还有信号内容（$币名、CA、数字）时只删引流那一段（"Follow @x: $KERNEL 12x" -> "$KERNEL 12x"）
+- 实体的 offset / length 是 UTF-16 单位（emoji 占 2 个），内部换算成 Python 下标处理完再换回去
+- 发送时用 PreparedFormat 当 parse_mode：相册（send_file 走 _send_album）不接受 formatting_entities，
+  只认 parse_mode，这样单条和相册都不会把原文再当 markdown 解析一遍
+"""
+
+import re
+import copy
+import bisect
+from typing import Callable, List, Optional, Sequence, Tuple
+
+
+# 一次扫描：链接 / 别人的频道链接 / @用户名（链接末尾的标点不算在内）
+# 每个分支都以固定字符开头，re 能直接跳到候选位置，比带可选前缀或 re.I 的写法快一倍多；TG 里的链接基本都是小写
+_URL_TAIL = r'[^\s<>"\']*[^\s<>"\'.,;:!?)\]}，。！？）]'
+_PATTERN = re.compile(
+    r'https?://' + _URL_TAIL
+    + r'|www\.(?:t\.me|telegram\.(?:me|dog))/' + _URL_TAIL
+    + r'|t(?:\.me|elegram\.(?:me|dog))/' + _URL_TAIL
+    + r'|tg://' + _URL_TAIL
+    + r'|@[A-Za-z][A-Za-z0-9_]{3,31}(?![A-Za-z0-9_])'
+)
+# 不带 http 的匹配前面不能紧挨着这些字符（排除 email、edit.me/ 之类）
+_WORD_BEFORE = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.@')
+_PROMO_URL = re.compile(r'(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me|telegram\.dog)/|tg://', re.I)
+_TRACKING_PARAM = re.compile(r'utm_\w+|ref|ref_src|referrer|fbclid|gclid|igshid|si|mc_[ce]id', re.I)
+_TRACKING_QUERY = re.compile(r'[?&](?:utm_\w+|ref|ref_src|referrer|fbclid|gclid|igshid|si|mc_[ce]id)=', re.I)
+
+# 删掉链接 / @用户名后，这一行还剩这些词就当作引流行整行删掉（逐个 in 比不区分大小写的正则快得多）
+_PROMO_WORDS = ('关注', '联系', '加入', '进群', '入群', '频道', '群组', '订阅', '私信',
+                'vip', 'join', 'follow', 'subscribe', 'channel', 'contact')
+_WORD = re.compile(r'\w')
+# 行里有这些就不能整行删：$币名、CA（Solana base58 / EVM 地址）、数字
+_SIGNAL_CONTENT = re.compile(r'\$[A-Za-z]|\d|[1-9A-HJ-NP-Za-km-z]{32,44}')
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+# 原样保留、不在里面删东西的实体（代码块里的内容不动）
+_PROTECTED = ('MessageEntityCode', 'MessageEntityPre')
+# 指向别人的实体：去掉实体，文字保留
+_DROPPED = ('MessageEntityMentionName', 'InputMessageEntityMentionName')
+
+
+def utf16_len(text: str) -> int:
+    """TG 实体用的长度单位"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def strip_tracking(url: str) -> str:
+    """去掉链接里的跟踪参数；没有要去的参数时原样返回"""
+    if '?' not in url or not _TRACKING_QUERY.search(url):
+        return url
+    # 直接按 & 切，其余参数原样保留（不重新编码）
+    base, _, query = url.partition('?')
+    query, hash_mark, fragment = query.partition('#')
+    kept = [param for param in query.split('&') if not _TRACKING_PARAM.fullmatch(param.split('=', 1)[0])]
+    return base + ('?' + '&'.join(kept) if kept else '') + hash_mark + fragment
+
+
+class _Utf16Index:
+    """Python 下标 <-> UTF-16 下标（只有超出 BMP 的字符，比如 emoji，两边不一样）"""
+
+    def __init__(self, text: str):
+        self.astral = [match.start() for match in _ASTRAL.finditer(text)]
+        self.astral16 = [position + index for index, position in enumerate(self.astral)]
+
+    def to_python(self, offset: int) -> int:
+        return offset - bisect.bisect_left(self.astral16, offset) if self.astral else offset
+
+    def to_utf16(self, position: int) -> int:
+        return position + bisect.bisect_left(self.astral, position) if self.astral else position
+
+
+class PreparedFormat:
+    """把算好的实体包装成 Telethon 的 parse_mode：parse() 原样返回文本和这些实体
+
+    用法: client.send_message(chat, text, parse_mode=PreparedFormat(entities), file=media)
+    """
+
+    def __init__(self, entities: Sequence):
+        self.entities = list(entities)
+
+    def parse(self, text: str) -> Tuple[str, list]:
+        # Telethon 会就地删改返回的列表，每次给一份拷贝
+        return text, list(self.entities)
+
+    def unparse(self, text: str, entities: Sequence) -> str:
+        return text
+
+
+class MessageSanitizer:
+    """清洗转发内容：sanitize(原文, 实体) -> (新文本, 新实体)，发送时配合 PreparedFormat(新实体) 使用"""
+
+    def __init__(self, footer: str = "", parse: Optional[Callable[[str], Tuple[str, list]]] = None):
+        """
+        footer: 小尾巴，开头的空行原样保留
+        parse: 小尾巴的格式解析（如 telethon.extensions.markdown.parse），不传则按纯文本
+        """
+        body = footer.strip()
+        self.separator = "\n" + footer[:len(footer) - len(footer.lstrip())] if body else ""
+        self.footer, self.footer_entities = parse(body) if parse and body else (body, [])
+
+    def sanitize(self, text: str, entities: Optional[Sequence] = None) -> Tuple[str, list]:
+        """清洗正文并加上小尾巴"""
+        body, body_entities = self.clean(text, entities)
+        if not self.footer_entities:
+            return body + self.separator + self.footer, body_entities
+        shift = utf16_len(body + self.separator)
+        footer_entities = []
+        for entity in self.footer_entities:
+            entity = copy.copy(entity)
+            entity.offset += shift
+            footer_entities.append(entity)
+        return body + self.separator + self.footer, body_entities + footer_entities
+
+    def clean(self, text: str, entities: Optional[Sequence] = None) -> Tuple[str, list]:
+        """只清洗正文：返回 (去掉引流内容、首尾空白后的文本, 平移后的实体)"""
+        text = text or ""
+        entities = list(entities or ())
+        index = _Utf16Index(text) if entities else None
+        spans = [(entity, index.to_python(entity.offset), index.to_python(entity.offset + entity.length))
+                 for entity in entities]
+        protected = [(start, end) for entity, start, end in spans if type(entity).__name__ in _PROTECTED]
+
+        edits = self._find_edits(text, protected)
+        if not edits and not entities:
+            return text.strip(), []
+
+        # 一遍拼出新文本，同时记下每处修改的位置，用来平移实体
+        pieces = []
+        starts, ends, new_starts, repl_lens, deltas = [], [], [], [], []
+        position = delta = 0
+        for start, end, replacement in edits:
+            pieces.append(text[position:start])
+            pieces.append(replacement)
+            starts.append(start)
+            ends.append(end)
+            new_starts.append(start + delta)
+            repl_lens.append(len(replacement))
+            delta += len(replacement) - (end - start)
+            deltas.append(delta)
+            position = end
+        pieces.append(text[position:])
+        joined = ''.join(pieces)
+        result = joined.strip()
+        lead = len(joined) - len(joined.lstrip())
+
+        def move(position: int, is_end: bool) -> int:
+            k = bisect.bisect_right(starts, position) - 1
+            if k < 0:
+                moved = position
+            elif position < ends[k]:
+                # 在被改掉的区间里：开头挪到替换内容之后，结尾挪到替换内容之前
+                moved = new_starts[k] + (0 if is_end or position == starts[k] else repl_lens[k])
+            else:
+                moved = position + deltas[k]
+            return min(max(moved - lead, 0), len(result))
+
+        new_entities = []
+        result_index = _Utf16Index(result) if spans else None
+        for entity, start, end in spans:
+            name = type(entity).__name__
+            if name in _DROPPED:
+                continue
+            url = getattr(entity, 'url', None) if name == 'MessageEntityTextUrl' else None
+            if url is not None and _PROMO_URL.match(url):
+                continue
+            new_start, new_end = move(start, False), move(end, True)
+            if new_end <= new_start:
+                continue
+            entity = copy.copy(entity)
+            if url is not None:
+                entity.url = strip_tracking(url)
+            entity.offset = result_index.to_utf16(new_start)
+            entity.length = result_index.to_utf16(new_end) - entity.offset
+            new_entities.append(entity)
+        return result, new_entities
+
+    def _find_edits(self, text: str, protected: List[Tuple[int, int]]) -> List[Tuple[int, int, str]]:
+        """[(开始, 结束, 替换成)]，按位置排好、互不重叠"""
+        edits = []
+        # 没有这些字样的消息（大多数信号）连正则都不用跑
+        if '@' not in text and '://' not in text and 't.me/' not in text and 'telegram.' not in text:
+            return edits
+        for match in _PATTERN.finditer(text):
+            start, end = match.span()
+            found = match.group()
+            if start and found[0] != 'h' and text[start - 1] in _WORD_BEFORE:
+                continue
+            if protected and any(start < p_end and p_start < end for p_start, p_end in protected):
+                continue
+            if found[0] == '@' or _PROMO_URL.match(found):
+                replacement = ''
+            else:
+                replacement = strip_tracking(found)
+                if replacement == found:
+                    continue
+            edits.append((start, end, replacement))
+        if not edits:
+            return edits
+
+        # 按行收拾：整行只剩引流话术的删掉整行，否则连带删掉链接前面的空格
+        cleaned = []
+        i = 0
+        while i < len(edits):
+            line_start = text.rfind('\n', 0, edits[i][0]) + 1
+            line_end = text.find('\n', edits[i][0])
+            line_end = len(text) if line_end < 0 else line_end
+            j = i
+            while j < len(edits) and edits[j][0] < line_end:
+                j += 1
+            line_edits = edits[i:j]
+            removals = [edit for edit in line_edits if not edit[2]]
+            rest, position = [], line_start
+            for start, end, replacement in line_edits:
+                rest.append(text[position:start])
+                rest.append(replacement)
+                position = end
+            rest.append(text[position:line_end])
+            rest = ''.join(rest)
+            lowered = rest.lower()
+            promo = bool(removals) and any(word in lowered for word in _PROMO_WORDS)
+            if removals and (promo or not _WORD.search(rest)) and not _SIGNAL_CONTENT.search(rest):
+                if line_end < len(text):
+                    cleaned.append((line_start, line_end + 1, ''))
+                else:
+                    cleaned.append((max(line_start - 1, 0), line_end, ''))
+            else:
+                for start, end, replacement in line_edits:
+                    if not replacement:
+                        floor = max(cleaned[-1][1] if cleaned else 0, line_start)
+                        if promo:
+                            start, end = self._promo_span(text, start, end, floor, line_end, protected)
+                        while start > floor and text[start - 1] in ' \t':
+                            start -= 1
+                    cleaned.append((start, end, replacement))
+            i = j
+        # 删最后一行时吃掉的换行可能和上一处修改挨着，合并掉重叠
+        merged = []
+        for edit in cleaned:
+            if merged and edit[0] < merged[-1][1]:
+                start, end, replacement = merged[-1]
+                merged[-1] = (start, max(end, edit[1]), replacement)
+            else:
+                merged.append(edit)
+        return merged
+
+    @staticmethod
+    def _promo_span(text: str, start: int, end: int, floor: int, line_end: int,
+                    protected: List[Tuple[int, int]]) -> Tuple[int, int]:
+        """把要删的链接 / @用户名往前扩到紧挨着的引流词（中间没有信号内容），往后带上冒号逗号"""
+        lowered = text[floor:start].lower()
+        # 从最靠前的引流词开始试（"Join VIP: t.me/x" 要从 Join 删起）
+        for word_at in sorted(at for at in (lowered.find(word) for word in _PROMO_WORDS) if at >= 0):
+            if not _SIGNAL_CONTENT.search(text, floor + word_at, start) \
+                    and not any(floor + word_at < p_end and p_start < start for p_start, p_end in protected):
+                start = floor + word_at
+                break
+        while end < line_end and text[end] in ':：,，':
+            end += 1
+        if start == floor:
+            # 删到行首（或上一处修改）了，后面的空白也一起删
+            while end < line_end and text[end] in ' \t':
+                end += 1
+        return start, end
+
+
+# 测试
+if __name__ == '__main__':
+    import time
+    from telethon.tl.types import MessageEntityBold, MessageEntityCode, MessageEntityTextUrl, MessageEntityUrl
+
+    sanitizer = MessageSanitizer("\n--------------------\n🚀 加入 EgeEye，抓住下一个 100 倍！\n👉 t.me/egeyeaimeme\n")
+
+    text = ("💰 $KERNEL 最新涨幅为 12.83倍 💰\n"
+            "CA: AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n"
+            "图表 https://dexscreener.com/solana/al9e?utm_source=tg&ref=abc&chain=sol\n"
+            "更多信号请关注 https://t.me/someotherchannel 每日更新\n"
+            "Follow @alpha_calls: $KERNEL 12.83x 上车\n"
+            "感谢 @some_admin_bot 的分享\n"
+            "👉 t.me/another")
+
+    def entity(kind, part, **extra):
+        offset = utf16_len(text[:text.index(part)])
+        return kind(offset=offset, length=utf16_len(part), **extra)
+
+    entities = [
+        entity(MessageEntityBold, "$KERNEL 最新涨幅为 12.83倍"),
+        entity(MessageEntityCode, "AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS"),
+        entity(MessageEntityUrl, "https://dexscreener.com/solana/al9e?utm_source=tg&ref=abc&chain=sol"),
+        entity(MessageEntityTextUrl, "图表", url="https://t.me/someotherchannel"),
+        entity(MessageEntityBold, "的分享"),
+    ]
+
+    result, new_entities = sanitizer.sanitize(text, entities)
+    print(result)
+    print()
+    for new in new_entities:
+        start = len(result.encode('utf-16-le')[:new.offset * 2].decode('utf-16-le'))
+        end = len(result.encode('utf-16-le')[:(new.offset + new.length) * 2].decode('utf-16-le'))
+        print(f"  {type(new).__name__:<20} {result[start:end]!r}")
+
+    # 和原来两遍 re.sub 的写法比一下速度
+    def legacy(original_text):
+        clean_text = re.sub(r'(https?://t\.me/[a-zA-Z0-9_]+)', '', original_text)
+        clean_text = re.sub(r'(@[a-zA-Z0-9_]+)', '', clean_text)
+        return clean_text.strip() + "\n" + sanitizer.footer
+
+    for name, fn in (('原来的两遍 re.sub', legacy),
+                     ('sanitize (纯文本)', sanitizer.sanitize),
+                     ('sanitize (带实体)', lambda t: sanitizer.sanitize(t, entities))):
+        start = time.perf_counter()
+        for _ in range(20000):
+            fn(text)
+        print(f"  {name:<18} {(time.perf_counter() - start) / 20000 * 1e6:.1f} µs/条")
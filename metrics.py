@@ -0,0 +1,286 @@
+"""
+指标 - 分阶段的计数器 / 直方图 / 队列深度，Prometheus 文本格式
+- Counter / Gauge / Histogram，支持标签；模块级 REGISTRY，各模块 import 后直接注册
+- start_server(): 在后台线程开一个本地 HTTP 端口，GET /metrics 返回文本
+- install_dump_signal(): 收到 SIGUSR1 时把当前快照打印到日志
+
+用法：
+  METRICS_PORT=9108 python main_v2.py
+  curl -s 127.0.0.1:9108/metrics
+  kill -USR1 <pid>
+"""
+
+import math
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# 默认直方图分桶（秒）：覆盖解析的微秒级到 AI / 浏览器的几十秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), registry: 'Registry' = None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, child in children:
+            lines.extend(self._child_samples(list(zip(self.labelnames, key)), child))
+        return lines
+
+    def _child_samples(self, pairs, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """取值时再调用 function（队列深度之类的现算值）"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _child_samples(self, pairs, child):
+        return [f'{self.name}_total{_format_labels(pairs)} {_format_value(child.get())}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def _child_samples(self, pairs, child):
+        return [f'{self.name}{_format_labels(pairs)} {_format_value(child.get())}']
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """按分桶线性插值估算分位数（和 Prometheus 的 histogram_quantile 一样），没有数据时为 NaN"""
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1] if self.buckets else float('nan')
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: 'Registry' = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def quantile(self, q: float, **labels) -> float:
+        return self.labels(**labels).quantile(q)
+
+    def _child_samples(self, pairs, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, list(child.counts)):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", _format_value(bound))])} {cumulative}')
+        lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", "+Inf")])} {child.count}')
+        lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{_format_labels(pairs)} {child.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标重复注册: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int, host: str = '127.0.0.1', registry: Registry = None) -> ThreadingHTTPServer:
+    """在后台线程启动指标端口（port=0 时自动分配，见 server.server_address）"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry if registry is not None else REGISTRY
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+def dump(registry: Registry = None):
+    print("📊 指标快照\n" + (registry if registry is not None else REGISTRY).render())
+
+
+def install_dump_signal(loop=None, registry: Registry = None) -> bool:
+    """SIGUSR1 时打印指标快照（Windows 没有 SIGUSR1，返回 False）"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+    if loop is not None:
+        loop.add_signal_handler(signal.SIGUSR1, dump, registry)
+    else:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump(registry))
+    return True
+
+
+# 测试
+if __name__ == '__main__':
+    import os
+    import time
+    import random
+    import urllib.request
+
+    registry = Registry()
+    calls = Counter('demo_calls', '调用次数', ['backend', 'result'], registry=registry)
+    latency = Histogram('demo_latency_seconds', '调用延迟', ['backend'], buckets=(0.1, 0.5, 1, 5), registry=registry)
+    depth = Gauge('demo_queue_depth', '队列深度', registry=registry)
+    items = [1, 2, 3]
+    depth.set_function(lambda: len(items))
+
+    rng = random.Random(1)
+    for _ in range(100):
+        backend = rng.choice(['gemini', 'template'])
+        calls.labels(backend=backend, result='ok').inc()
+        latency.labels(backend=backend).observe(rng.expovariate(1.5) if backend == 'gemini' else 0.001)
+
+    server = start_server(0, registry=registry)
+    url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+    started = time.perf_counter()
+    text = urllib.request.urlopen(url).read().decode()
+    print(text)
+    print(f"  抓取用时 {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    install_dump_signal(registry=registry)
+    os.kill(os.getpid(), signal.SIGUSR1)
+    server.shutdown()
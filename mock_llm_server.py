@@ -0,0 +1,111 @@
+"""
+本地 LLM 替身 - 模拟 Gemini，给离线压测 / 联调用
+- POST /generate {"prompt": ...} -> {"text": ...}
+- 从 prompt 里取出币名、CA、涨幅，生成一条能通过校验的推文（支持批量 prompt）
+- 可配置延迟、抖动、错误率，用来演练超时和熔断
+
+用法：
+  python mock_llm_server.py --port 8765 --latency 0.8 --jitter 0.4 --error-rate 0.05
+  REWRITER_BACKEND=http REWRITER_HTTP_URL=http://127.0.0.1:8765/generate python main_v2.py
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_FIELD_PATTERN = re.compile(r'- 币名: (.*)\n- CA: (\S+)\n- 涨幅: (\S+)')
+
+OPENERS = ["🚀", "🔥", "💎", "📈", "⚡"]
+
+
+def fake_tweet(token: str, ca: str, gain: str, rng: random.Random) -> str:
+    gain = gain.replace('倍', 'x')
+    return f"{rng.choice(OPENERS)} {token} just ran {gain}! Still early?\n\nCA: {ca}"
+
+
+def fake_response(prompt: str, rng: random.Random) -> str:
+    """根据 prompt 生成回复：批量 prompt 返回 JSON 数组，否则返回一条推文"""
+    items = _FIELD_PATTERN.findall(prompt)
+    if 'JSON' in prompt:
+        return json.dumps([{'ca': ca, 'tweet': fake_tweet(token, ca, gain, rng)} for token, ca, gain in items],
+                          ensure_ascii=False)
+    if not items:
+        return "🚀 Another one!"
+    return fake_tweet(*items[0], rng)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = 'MockLLM/1.0'
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            prompt = json.loads(self.rfile.read(length))['prompt']
+        except (ValueError, KeyError):
+            self.send_error(400, 'bad request')
+            return
+
+        with server.lock:
+            delay = max(0.0, server.latency + server.rng.uniform(-server.jitter, server.jitter))
+            failed = server.rng.random() < server.error_rate
+            text = fake_response(prompt, server.rng)
+            server.requests += 1
+        time.sleep(delay)
+
+        if failed:
+            self.send_error(503, 'mock overloaded')
+            return
+        body = json.dumps({'text': text}, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host: str = '127.0.0.1', port: int = 8765, latency: float = 0.5,
+                 jitter: float = 0.2, error_rate: float = 0.0, seed: int = 42) -> ThreadingHTTPServer:
+    """在后台线程启动替身服务，返回 server（port=0 时自动分配端口，见 server.server_address）"""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, name='mock-llm', daemon=True).start()
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='本地 LLM 替身')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8765)
+    arg_parser.add_argument('--latency', type=float, default=0.5, help='平均延迟（秒）')
+    arg_parser.add_argument('--jitter', type=float, default=0.2, help='延迟抖动（秒）')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的比例')
+    arg_parser.add_argument('--seed', type=int, default=42)
+    args = arg_parser.parse_args()
+
+    server = start_server(args.host, args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    print(f"🤖 LLM 替身已启动: http://{args.host}:{server.server_address[1]}/generate")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\n👋 已关闭，共处理 {server.requests} 个请求")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+离线回放 / 压测 - 把录制的或合成的 TG 消息按指定速度灌进 main_v2.handle_signal
+- 全部用替身：假 TG 客户端、假 TwitterPoster、模板或本地 LLM 替身（mock_llm_server）
+- 速度：1 = 实时，N = N 倍速，0 = 不等待（最大吞吐）
+- 结束后报告吞吐、各阶段延迟分位数、队列深度随时间的变化，找出流水线在哪里先饱和
+
+用法：
+  python replay.py --count 2000 --speed 0                        # 合成信号，最大吞吐
+  python replay.py --count 500 --rate 5 --backend mock --llm-latency 0.8
+  python replay.py --input corpus.jsonl --speed 10 --output replay.json
+  （corpus.jsonl 每行 {"text": ..., "date": 时间戳(可选)}，可以用 python signal_corpus.py 10000 > corpus.jsonl 生成）
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+
+# ================= 替身 =================
+
+class FakeMessage:
+    """Telethon Message 的替身（只有 handle_signal 用到的字段）"""
+
+    def __init__(self, message_id: int, text: str, date: float, media=None, grouped_id=None):
+        self.id = message_id
+        self.text = text
+        self.raw_text = text
+        self.entities = None
+        self.media = media
+        self.grouped_id = grouped_id
+        self.date = datetime.fromtimestamp(date, timezone.utc)
+
+
+class FakeEvent:
+    def __init__(self, message: FakeMessage):
+        self.message = message
+
+
+class FakeTelegramClient:
+    """TelegramClient 的替身：send_message 按给定延迟返回"""
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, entity, message, parse_mode=(), file=None):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class FakeTwitterPoster:
+    """TwitterPoster 的替身：不限流，post_tweet 按给定延迟返回"""
+
+    def __init__(self, latency: float = 0.5, error_rate: float = 0.0, seed: int = 42):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.posted = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.submitted = False
+
+    def next_post_time(self):
+        return time.time(), 'ok'
+
+    async def post_tweet(self, content):
+        from tweet_length import weighted_length, TWEET_LIMIT
+
+        length = weighted_length(content)
+        if length > TWEET_LIMIT:
+            self.failed += 1
+            return False, f"推文超长 {length}"
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if self.rng.random() < self.error_rate:
+            self.failed += 1
+            return False, "模拟发推失败"
+        self.posted += 1
+        return True, "发送成功"
+
+
+# ================= 输入 =================
+
+def load_messages(args) -> List[Tuple[float, str]]:
+    """返回 [(相对第一条的秒数, 文本)]"""
+    if args.input:
+        rows = []
+        with open(args.input, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                rows.append((data.get('date'), data['text']))
+        # 没有时间戳的按 --rate 均匀排开
+        if all(date is not None for date, _ in rows):
+            start = rows[0][0]
+            return [(date - start, text) for date, text in rows]
+        return [(index / args.rate, text) for index, (_, text) in enumerate(rows)]
+
+    from signal_corpus import iter_corpus
+
+    # 合成信号：泊松到达，平均每秒 rate 条（模拟行情好时的突发）
+    rng = random.Random(args.seed)
+    offset = 0.0
+    messages = []
+    for text in iter_corpus(args.count, seed=args.seed):
+        messages.append((offset, text))
+        offset += rng.expovariate(args.rate)
+    return messages
+
+
+# ================= 回放 =================
+
+def _percentiles(stats: dict) -> str:
+    return f"p50 {stats['p50'] * 1000:>9.1f}  p95 {stats['p95'] * 1000:>9.1f}  p99 {stats['p99'] * 1000:>9.1f}"
+
+
+async def replay(args) -> dict:
+    import main_v2
+    from ai_rewriter import AIRewriter
+    from signal_parser import SignalParser
+    from signal_dedup import CADedupIndex
+    from durable_queue import DurableQueue
+    from tweet_scheduler import TweetScheduler
+    from channel_cursor import ChannelCursor
+    from signal_pipeline import StageStats
+
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    window = max(1000, args.count * 2)
+
+    # 替身和真实组件一起装进 main_v2 的全局变量
+    main_v2.tg_client = FakeTelegramClient(args.forward_latency)
+    main_v2.twitter_poster = poster = FakeTwitterPoster(args.post_latency, args.post_error_rate, args.seed)
+    main_v2.signal_parser = SignalParser()
+    main_v2.dedup_index = CADedupIndex(ttl=main_v2.DEDUP_TTL, max_size=main_v2.DEDUP_MAX_SIZE,
+                                       upgrade_ratio=main_v2.DEDUP_UPGRADE_RATIO)
+    main_v2.ai_rewriter = rewriter = AIRewriter()
+    main_v2.twitter_queue = DurableQueue(os.path.join(workdir, 'tweet_queue.db'))
+    main_v2.tweet_scheduler = scheduler = TweetScheduler(main_v2.twitter_queue, order=main_v2.TWEET_ORDER)
+    main_v2.channel_cursor = ChannelCursor(os.path.join(workdir, 'channel_cursor.db'), 'replay')
+    main_v2.ai_ready = asyncio.Event()
+    main_v2.twitter_ready = asyncio.Event()
+    main_v2.post_idle = asyncio.Event()
+    main_v2.ai_ready.set()
+    main_v2.twitter_ready.set()
+    main_v2.post_idle.set()
+    main_v2.ENABLE_TWITTER = True
+    main_v2.ENABLE_TG_FORWARD = args.forward
+    main_v2.POST_GAP = (0, 0)
+    main_v2.post_stats = StageStats('post', window)
+    main_v2.signal_pipeline = pipeline = main_v2.build_pipeline(stats_window=window)
+    pipeline.start()
+    worker = asyncio.ensure_future(main_v2.twitter_worker())
+
+    messages = load_messages(args)
+    samples = []
+
+    async def sample():
+        while True:
+            depths = {stage.name: stage.depth() for stage in pipeline.stages}
+            depths['scheduler'] = len(scheduler)
+            samples.append((time.perf_counter() - started, depths))
+            await asyncio.sleep(args.sample)
+
+    # 回放时不打印每条信号的日志
+    quiet = open(os.devnull, 'w') if not args.verbose else None
+    real_stdout = sys.stdout
+    if quiet:
+        sys.stdout = quiet
+
+    started = time.perf_counter()
+    sampler = asyncio.ensure_future(sample())
+    max_lag = 0.0
+    try:
+        for index, (offset, text) in enumerate(messages):
+            if args.speed > 0:
+                due = started + offset / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            await main_v2.handle_signal(FakeEvent(FakeMessage(index + 1, text, time.time())))
+        fed = time.perf_counter() - started
+
+        # 等流水线和发帖队列都排空
+        await pipeline.join()
+        deadline = time.perf_counter() + args.drain_timeout
+        while (len(scheduler) or poster.in_flight) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stdout = real_stdout
+        if quiet:
+            quiet.close()
+        sampler.cancel()
+        worker.cancel()
+        await pipeline.stop()
+
+    stages = pipeline.stats()
+    stages['post'] = main_v2.post_stats.as_dict()
+    return {
+        'messages': len(messages),
+        'speed': args.speed,
+        'backend': rewriter.backend.name,
+        'fed_seconds': round(fed, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'max_feed_lag': round(max_lag, 3),
+        'ingest_per_sec': round(len(messages) / fed, 1) if fed else None,
+        'posted': poster.posted,
+        'post_failed': poster.failed,
+        'left_in_queue': len(scheduler),
+        'posts_per_sec': round(poster.posted / elapsed, 2) if elapsed else None,
+        'forwarded': main_v2.tg_client.sent,
+        'stages': stages,
+        'end_to_end_p50': round(main_v2.END_TO_END_SECONDS.quantile(0.5), 3),
+        'end_to_end_p95': round(main_v2.END_TO_END_SECONDS.quantile(0.95), 3),
+        'queue_wait_p95': round(main_v2.QUEUE_WAIT_SECONDS.quantile(0.95), 3),
+        'backends': rewriter.backend_stats(),
+        'depth_samples': [{'t': round(t, 2), **depths} for t, depths in samples],
+    }
+
+
+def print_report(report: dict):
+    print(f"\n📼 回放 {report['messages']:,} 条消息 (速度 {report['speed'] or '最大'}，改写后端 {report['backend']})")
+    print(f"  灌入用时 {report['fed_seconds']:.2f}s ({report['ingest_per_sec']} 条/秒)，"
+          f"最大落后 {report['max_feed_lag']:.2f}s，总用时 {report['elapsed_seconds']:.2f}s")
+    print(f"  发出推文 {report['posted']} 条 ({report['posts_per_sec']} 条/秒)，失败 {report['post_failed']}，"
+          f"剩余 {report['left_in_queue']}，TG 转发 {report['forwarded']}")
+    print(f"  端到端 p50 {report['end_to_end_p50']}s  p95 {report['end_to_end_p95']}s，"
+          f"发帖队列等待 p95 {report['queue_wait_p95']}s")
+
+    print("\n  阶段        处理    丢弃   出错   延迟 (ms)")
+    for name, stats in report['stages'].items():
+        print(f"  {name:8} {stats['processed']:>7} {stats['dropped']:>7} {stats['errors']:>6}   {_percentiles(stats)}")
+
+    samples = report['depth_samples']
+    if samples:
+        names = [name for name in samples[0] if name != 't']
+        peaks = {name: max(sample[name] for sample in samples) for name in names}
+        print("\n  队列深度（最大值: " + "，".join(f"{name} {peak}" for name, peak in peaks.items()) + "）")
+        print("  " + f"{'t(s)':>7} " + " ".join(f"{name:>9}" for name in names))
+        step = max(1, len(samples) // 20)
+        for sample in samples[::step]:
+            print("  " + f"{sample['t']:>7.2f} " + " ".join(f"{sample[name]:>9}" for name in names))
+        busiest = max(peaks, key=peaks.get)
+        if peaks[busiest]:
+            print(f"\n  ⚠️ 积压最多的是 {busiest}（最多 {peaks[busiest]} 条），它就是瓶颈")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='离线回放 / 端到端压测')
+    arg_parser.add_argument('--input', help='JSONL 文件，每行 {"text": ..., "date": 时间戳(可选)}；不给则用合成信号')
+    arg_parser.add_argument('--count', type=int, default=1000, help='合成信号条数')
+    arg_parser.add_argument('--rate', type=float, default=2.0, help='合成信号 / 无时间戳输入的平均每秒条数（1 倍速时）')
+    arg_parser.add_argument('--speed', type=float, default=0, help='回放速度：1 实时，N 倍速，0 最大吞吐')
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--backend', choices=['template', 'mock'], default='template', help='改写后端')
+    arg_parser.add_argument('--llm-latency', type=float, default=0.8, help='LLM 替身平均延迟（秒）')
+    arg_parser.add_argument('--llm-jitter', type=float, default=0.3)
+    arg_parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    arg_parser.add_argument('--forward', action='store_true', help='同时模拟 TG 转发')
+    arg_parser.add_argument('--forward-latency', type=float, default=0.2)
+    arg_parser.add_argument('--post-latency', type=float, default=0.5, help='假发帖器每条耗时（秒）')
+    arg_parser.add_argument('--post-error-rate', type=float, default=0.0)
+    arg_parser.add_argument('--sample', type=float, default=0.5, help='队列深度采样间隔（秒）')
+    arg_parser.add_argument('--drain-timeout', type=float, default=120, help='灌完后最多等多久排空（秒）')
+    arg_parser.add_argument('--output', help='把报告写成 JSON')
+    arg_parser.add_argument('--verbose', action='store_true', help='保留每条信号的日志')
+    args = arg_parser.parse_args()
+
+    # 改写缓存只放内存；后端在 import 之前选好
+    os.environ['REWRITE_CACHE_PATH'] = ''
+    server = None
+    if args.backend == 'mock':
+        from mock_llm_server import start_server
+
+        server = start_server(port=0, latency=args.llm_latency, jitter=args.llm_jitter,
+                              error_rate=args.llm_error_rate, seed=args.seed)
+        os.environ['REWRITER_BACKEND'] = 'http'
+        os.environ['REWRITER_HTTP_URL'] = f'http://127.0.0.1:{server.server_address[1]}/generate'
+    else:
+        os.environ['REWRITER_BACKEND'] = 'template'
+
+    random.seed(args.seed)
+    report = asyncio.run(replay(args))
+    if server:
+        server.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 报告已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
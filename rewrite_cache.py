@@ -0,0 +1,192 @@
+"""
+改写缓存 - 同一个信号不重复调用 Gemini
+- 键：(CA, 币名, 涨幅档位, 市值档位)，档位按对数分桶，相近的数字落在同一档
+- 值：校验通过的推文正文，涨幅 / 市值存成占位符，命中时填入当前信号的数字
+- 内存 LRU + TTL，背后是 SQLite 文件，重启后仍然有效
+"""
+
+import os
+import re
+import math
+import time
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from signal_parser import SignalData, gain_value, market_cap_value, latest_market_cap
+
+
+GAIN_PLACEHOLDER = '\x00GAIN\x00'
+MC_PLACEHOLDER = '\x00MC\x00'
+
+
+def _bucket(value: float, ratio: float) -> int:
+    """对数分桶：相邻两档相差 ratio 倍；没有数值时为 -1"""
+    if math.isnan(value) or value <= 0:
+        return -1
+    return int(math.log(value) / math.log(ratio))
+
+
+def fingerprint(signal: SignalData, gain_ratio: float = 1.1, mc_ratio: float = 1.25) -> str:
+    """信号指纹：CA|币名|涨幅档位|市值档位"""
+    return "|".join((
+        signal.ca or "",
+        signal.token_name or "",
+        str(_bucket(gain_value(signal.gain), gain_ratio)),
+        str(_bucket(market_cap_value(signal.market_cap), mc_ratio)),
+    ))
+
+
+_GAIN_NUMBER = re.compile(r'\d+\.?\d*')
+_MC_PARTS = re.compile(r'(\d+\.?\d*)([KMB]?)')
+
+
+def _gain_number(signal: SignalData) -> Optional[str]:
+    # "12.83倍" / "12.83x" -> "12.83"
+    match = _GAIN_NUMBER.search(signal.gain) if signal.gain else None
+    return match.group() if match else None
+
+
+def _gain_pattern(number: str):
+    # 正文里的 "12.83x" / "12.83 x" / "12.83倍" / "12.83×"：只换数字，倍数的写法保持正文原样；前后是数字的不算（避免误伤 CA）
+    return re.compile(r'(?<![\d.])' + re.escape(number) + r'(?=\s*[xX倍×✕])')
+
+
+def _mc_pattern(latest: str):
+    # 正文里的 "$279.64K" / "$279.64 K"
+    number, unit = _MC_PARTS.fullmatch(latest).groups()
+    return re.compile(r'\$\s*' + re.escape(number) + (r'\s*' + unit if unit else '') + r'(?![\dA-Za-z])')
+
+
+def to_template(body: str, signal: SignalData) -> str:
+    """把正文里的涨幅 / 市值换成占位符"""
+    gain = _gain_number(signal)
+    if gain:
+        body = _gain_pattern(gain).sub(GAIN_PLACEHOLDER, body)
+    latest = latest_market_cap(signal.market_cap)
+    if latest:
+        body = body.replace(signal.market_cap, MC_PLACEHOLDER)
+        body = _mc_pattern(latest).sub(MC_PLACEHOLDER, body)
+    return body
+
+
+def from_template(template: str, signal: SignalData) -> Optional[str]:
+    """用当前信号的数字填回占位符；需要的数字缺失时返回 None"""
+    if GAIN_PLACEHOLDER in template:
+        gain = _gain_number(signal)
+        if not gain:
+            return None
+        template = template.replace(GAIN_PLACEHOLDER, gain)
+    if MC_PLACEHOLDER in template:
+        latest = latest_market_cap(signal.market_cap)
+        if not latest:
+            return None
+        template = template.replace(MC_PLACEHOLDER, f"${latest}")
+    return template
+
+
+class RewriteCache:
+    """内存 LRU + TTL，可选 SQLite 持久化"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 6 * 3600, max_size: int = 2048):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._memory: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS rewrite_cache ('
+                'key TEXT PRIMARY KEY, template TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._db.execute('DELETE FROM rewrite_cache WHERE created_at < ?', (time.time() - ttl,))
+
+    def _remember(self, key: str, template: str, created_at: float):
+        self._memory[key] = (template, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str, now: float) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            del self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                'SELECT template, created_at FROM rewrite_cache WHERE key = ? AND created_at >= ?',
+                (key, now - self.ttl),
+            ).fetchone()
+            if row:
+                self._remember(key, row[0], row[1])
+                self.stats['disk_hits'] += 1
+                return row[0]
+
+        self.stats['misses'] += 1
+        return None
+
+    def get(self, signal: SignalData) -> Optional[str]:
+        """取缓存的正文（已填入当前信号的数字），没有则返回 None"""
+        template = self._lookup(fingerprint(signal), time.time())
+        if template is None:
+            return None
+        return from_template(template, signal)
+
+    def put(self, signal: SignalData, body: str):
+        """缓存一条校验通过的正文；涨幅没能换成占位符的不缓存（命中时数字对不上，校验一定不过）"""
+        key = fingerprint(signal)
+        template = to_template(body, signal)
+        if _gain_number(signal) and GAIN_PLACEHOLDER not in template:
+            return
+        now = time.time()
+        self._remember(key, template, now)
+        if self._db is not None:
+            self._db.execute(
+                'INSERT OR REPLACE INTO rewrite_cache (key, template, created_at) VALUES (?, ?, ?)',
+                (key, template, now),
+            )
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return len(self._memory)
+
+
+# 测试
+if __name__ == '__main__':
+    import tempfile
+    from signal_parser import SignalParser
+
+    parser = SignalParser()
+    first = parser.parse("$KERNEL 最新涨幅为 12.83倍\nAL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n市值 $21.80K —> $279.64K")
+    repost = parser.parse("$KERNEL 最新涨幅为 13.1倍\nAL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n市值 $21.80K —> $285.00K")
+    body = "🚀 $KERNEL just ripped 12.83倍!\n\nCA: AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n\nMC now $279.64 K"
+
+    path = os.path.join(tempfile.mkdtemp(), 'rewrite_cache.db')
+    cache = RewriteCache(path)
+    cache.put(first, body)
+    print(f"  指纹: {fingerprint(first)} / {fingerprint(repost)}")
+    print(f"  内存命中: {cache.get(repost)!r}")
+    cache.close()
+
+    # 模拟重启
+    cache = RewriteCache(path)
+    start = time.perf_counter()
+    hit = cache.get(repost)
+    print(f"  重启后磁盘命中 ({(time.perf_counter() - start) * 1e6:.0f} µs): {hit is not None}")
+    start = time.perf_counter()
+    cache.get(repost)
+    print(f"  再次命中 ({(time.perf_counter() - start) * 1e6:.1f} µs)，统计: {cache.stats}")
+    print(f"  校验: {parser.validate_output(repost, hit)}")
@@ -0,0 +1,216 @@
+"""
+改写后端 - AIRewriter 可以切换的模型后端
+- GeminiBackend: Google Gemini（默认）
+- HTTPBackend: 本地 HTTP 替身（mock_llm_server.py），离线压测 / 联调用
+- TemplateBackend: 不调用模型，直接用模板
+- CircuitBreaker: 错误率或 p95 延迟超标时熔断，冷却后放一个探测请求，成功才恢复
+"""
+
+import os
+import json
+import time
+from collections import deque
+from typing import Optional
+
+from metrics import Counter, Histogram
+
+
+REWRITE_SECONDS = Histogram('rewrite_backend_seconds', '改写后端单次调用耗时（秒）', ['backend'])
+REWRITE_CALLS = Counter('rewrite_backend_calls', '改写后端调用次数', ['backend', 'result'])
+
+
+class BackendStats:
+    """单个后端的调用计数和延迟统计（最近 window 次），同时写入指标"""
+
+    def __init__(self, name: str = 'base', window: int = 200):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool = True):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.latencies.append(latency)
+        REWRITE_SECONDS.labels(backend=self.name).observe(latency)
+        REWRITE_CALLS.labels(backend=self.name, result='ok' if ok else 'error').inc()
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'p50': round(self.percentile(0.5), 4),
+            'p95': round(self.percentile(0.95), 4),
+        }
+
+
+class RewriterBackend:
+    """后端接口：generate(prompt) 是同步调用，由 AIRewriter 放到线程池里执行"""
+
+    name = 'base'
+    remote = True   # 是否真的调用模型（模板后端为 False）
+
+    def __init__(self):
+        self.stats = BackendStats(self.name)
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GeminiBackend(RewriterBackend):
+    name = 'gemini'
+
+    def __init__(self, api_key: str, model_name: str = 'gemini-pro'):
+        super().__init__()
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text
+
+
+class HTTPBackend(RewriterBackend):
+    """本地 HTTP 替身：POST {"prompt": ...}，返回 {"text": ...}"""
+
+    name = 'http'
+
+    def __init__(self, url: str, timeout: float = 30):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+
+    def generate(self, prompt: str) -> str:
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'prompt': prompt}).encode(),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())['text']
+
+
+class TemplateBackend(RewriterBackend):
+    """模板后端：不调用模型，AIRewriter 直接走模板，这里只记使用次数"""
+
+    name = 'template'
+    remote = False
+
+    def generate(self, prompt: str) -> str:
+        raise RuntimeError("模板后端不调用模型")
+
+
+def create_backend(kind: Optional[str] = None) -> RewriterBackend:
+    """按 REWRITER_BACKEND 环境变量创建后端（gemini / http / template）
+
+    没有指定时：有 GEMINI_API_KEY 用 Gemini，否则用模板。
+    """
+    api_key = os.getenv('GEMINI_API_KEY')
+    kind = (kind or os.getenv('REWRITER_BACKEND') or ('gemini' if api_key else 'template')).lower()
+
+    if kind == 'gemini':
+        if not api_key:
+            print("⚠️ 未设置 GEMINI_API_KEY，将使用模板模式")
+            return TemplateBackend()
+        return GeminiBackend(api_key, os.getenv('GEMINI_MODEL', 'gemini-pro'))
+    if kind == 'http':
+        return HTTPBackend(os.getenv('REWRITER_HTTP_URL', 'http://127.0.0.1:8765/generate'))
+    if kind != 'template':
+        print(f"⚠️ 未知的改写后端 {kind}，使用模板模式")
+    return TemplateBackend()
+
+
+class CircuitBreaker:
+    """熔断器
+
+    closed: 正常放行，最近 window 次里错误率或 p95 延迟超标就 open
+    open: 全部拒绝（走模板），cooldown 秒后进入 half_open
+    half_open: 只放一个探测请求，成功且不慢就 closed，否则重新 open；
+               探测 probe_timeout 秒还没有结果也算失败，不会一直卡在 half_open
+    放行之后每个请求都要有结果：record() 记成败，没拿到结果（排队超时、被取消）调 release()
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, error_rate: float = 0.5, p95_latency: float = 10.0,
+                 window: int = 20, min_calls: int = 5, cooldown: float = 30.0,
+                 probe_timeout: float = 60.0):
+        self.error_rate = error_rate
+        self.p95_latency = p95_latency
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.trips = 0
+        self._results = deque(maxlen=window)   # (ok, latency)
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and self._probing and \
+                time.monotonic() - self._probe_started >= self.probe_timeout:
+            self._probing = False
+            self._trip(f"探测 {self.probe_timeout:g}秒没有结果")
+            return False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            self._probe_started = time.monotonic()
+            return True
+        return False
+
+    def release(self):
+        """放行的请求没有结果就结束了（排队超时、被取消）：不计成败，探测名额还回去"""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def record(self, ok: bool, latency: float):
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if ok and latency < self.p95_latency:
+                print("🔌 探测成功，熔断恢复")
+                self.state = self.CLOSED
+                self._results.clear()
+            else:
+                self._trip("探测失败")
+            return
+
+        self._results.append((ok, latency))
+        if len(self._results) < self.min_calls:
+            return
+        errors = sum(1 for result_ok, _ in self._results if not result_ok)
+        if errors / len(self._results) >= self.error_rate:
+            self._trip(f"错误率 {errors}/{len(self._results)}")
+            return
+        latencies = sorted(latency for _, latency in self._results)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        if p95 >= self.p95_latency:
+            self._trip(f"p95 延迟 {p95:.1f}秒")
+
+    def _trip(self, reason: str):
+        if self.state != self.OPEN:
+            self.trips += 1
+        print(f"🔌 改写后端熔断 ({reason})，{self.cooldown:g}秒内使用模板")
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+
+    def as_dict(self) -> dict:
+        return {'state': self.state, 'trips': self.trips}
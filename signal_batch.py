@@ -0,0 +1,223 @@
+"""
+紧凑信号存储 - 用于加载历史信号做分析 / 去重（离线工具用，实时流水线里不用）
+- CompactSignal: __slots__ 版 SignalData，不保存原文，字符串 intern
+- SignalBatch: 列式存储，多条信号按字段存成并行数组
+- 目的是省内存（见下面的测试），过滤 / 去重都是普通 Python 循环，不比 SignalData 列表快
+"""
+
+import sys
+import math
+import time
+from array import array
+from enum import IntEnum
+from typing import Optional, List, Iterable, Iterator, Dict
+
+from signal_parser import SignalData, gain_value, market_cap_value
+
+
+class Chain(IntEnum):
+    """链代码"""
+    SOL = 0
+    BSC = 1
+
+    @classmethod
+    def from_name(cls, name: str) -> 'Chain':
+        return cls[name] if name in cls.__members__ else cls.SOL
+
+
+def _intern(text: Optional[str]) -> Optional[str]:
+    return sys.intern(text) if text else text
+
+
+class CompactSignal:
+    """SignalData 的紧凑版本（无 __dict__，不带 raw_text）"""
+
+    __slots__ = ('token_name', 'ca', 'chain', 'gain', 'market_cap', 'received_at')
+
+    def __init__(self, token_name: Optional[str] = None, ca: Optional[str] = None,
+                 chain: Chain = Chain.SOL, gain: Optional[str] = None,
+                 market_cap: Optional[str] = None, received_at: float = 0.0):
+        self.token_name = _intern(token_name)
+        self.ca = _intern(ca)
+        self.chain = Chain(chain)
+        self.gain = gain
+        self.market_cap = market_cap
+        self.received_at = received_at
+
+    @classmethod
+    def from_signal(cls, signal: SignalData, received_at: Optional[float] = None) -> 'CompactSignal':
+        return cls(
+            token_name=signal.token_name,
+            ca=signal.ca,
+            chain=Chain.from_name(signal.chain),
+            gain=signal.gain,
+            market_cap=signal.market_cap,
+            received_at=time.time() if received_at is None else received_at,
+        )
+
+    def to_signal(self, raw_text: str = "") -> SignalData:
+        return SignalData(
+            token_name=self.token_name,
+            ca=self.ca,
+            chain=self.chain.name,
+            gain=self.gain,
+            market_cap=self.market_cap,
+            raw_text=raw_text,
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactSignal):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"CompactSignal({fields})"
+
+
+class SignalBatch:
+    """列式信号容器
+
+    每个字段一列：CA / 币名是 intern 过的字符串列表，链、涨幅、市值、时间戳是 array，
+    缺失的涨幅 / 市值记为 NaN。
+    """
+
+    __slots__ = ('cas', 'tokens', 'chains', 'gains', 'market_caps', 'timestamps')
+
+    def __init__(self):
+        self.cas: List[Optional[str]] = []
+        self.tokens: List[Optional[str]] = []
+        self.chains = array('B')
+        self.gains = array('d')
+        self.market_caps = array('d')
+        self.timestamps = array('d')
+
+    @classmethod
+    def from_signals(cls, signals: Iterable[SignalData],
+                     received_at: Optional[Iterable[float]] = None) -> 'SignalBatch':
+        batch = cls()
+        if received_at is None:
+            for signal in signals:
+                batch.append(signal)
+        else:
+            for signal, timestamp in zip(signals, received_at):
+                batch.append(signal, timestamp)
+        return batch
+
+    def append(self, signal: SignalData, received_at: Optional[float] = None):
+        """追加一条信号（只保留结构化字段，原文丢弃）"""
+        self.cas.append(_intern(signal.ca))
+        self.tokens.append(_intern(signal.token_name))
+        self.chains.append(Chain.from_name(signal.chain))
+        self.gains.append(gain_value(signal.gain))
+        self.market_caps.append(market_cap_value(signal.market_cap))
+        self.timestamps.append(time.time() if received_at is None else received_at)
+
+    def __len__(self):
+        return len(self.cas)
+
+    def __getitem__(self, index: int) -> CompactSignal:
+        gain = self.gains[index]
+        market_cap = self.market_caps[index]
+        return CompactSignal(
+            token_name=self.tokens[index],
+            ca=self.cas[index],
+            chain=Chain(self.chains[index]),
+            gain=None if math.isnan(gain) else f"{gain:g}x",
+            market_cap=None if math.isnan(market_cap) else f"${market_cap:g}",
+            received_at=self.timestamps[index],
+        )
+
+    def __iter__(self) -> Iterator[CompactSignal]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def where(self, chain: Optional[Chain] = None, min_gain: Optional[float] = None,
+              min_market_cap: Optional[float] = None, since: Optional[float] = None) -> List[int]:
+        """按列过滤，返回命中的下标（NaN 不满足任何数值条件；逐条比较，没有向量化）"""
+        indices = range(len(self))
+        if chain is not None:
+            code = int(chain)
+            indices = [i for i in indices if self.chains[i] == code]
+        if min_gain is not None:
+            gains = self.gains
+            indices = [i for i in indices if gains[i] >= min_gain]
+        if min_market_cap is not None:
+            market_caps = self.market_caps
+            indices = [i for i in indices if market_caps[i] >= min_market_cap]
+        if since is not None:
+            timestamps = self.timestamps
+            indices = [i for i in indices if timestamps[i] >= since]
+        return list(indices)
+
+    def select(self, indices: Iterable[int]) -> 'SignalBatch':
+        """按下标取子集，返回新的 SignalBatch"""
+        batch = SignalBatch()
+        for i in indices:
+            batch.cas.append(self.cas[i])
+            batch.tokens.append(self.tokens[i])
+            batch.chains.append(self.chains[i])
+            batch.gains.append(self.gains[i])
+            batch.market_caps.append(self.market_caps[i])
+            batch.timestamps.append(self.timestamps[i])
+        return batch
+
+    def latest_by_ca(self) -> Dict[str, int]:
+        """每个 CA 最新一条记录的下标（用于去重）"""
+        latest: Dict[str, int] = {}
+        timestamps = self.timestamps
+        for i, ca in enumerate(self.cas):
+            if ca is None:
+                continue
+            previous = latest.get(ca)
+            if previous is None or timestamps[i] >= timestamps[previous]:
+                latest[ca] = i
+        return latest
+
+    def nbytes(self) -> int:
+        """列数据占用的字节数（字符串按 intern 后共享计，只算列表指针）"""
+        pointer_size = array('P').itemsize
+        return (
+            (len(self.cas) + len(self.tokens)) * pointer_size
+            + sum(column.itemsize * len(column)
+                  for column in (self.chains, self.gains, self.market_caps, self.timestamps))
+        )
+
+
+# 测试
+if __name__ == '__main__':
+    import random
+    import tracemalloc
+    from signal_parser import SignalParser
+
+    parser = SignalParser()
+    cas = [
+        "AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS",
+        "EKpQGSJtjMFqKZ9KQanSqYXRcF8fBopzLHYxdM65zcjm",
+        "7GCihgDB8fe6KNjn2MYtkzZcRjQy3t9GHdC8uHYmW2hr",
+        "0x55d398326f99059fF775485246999027B3197955",
+    ]
+    rng = random.Random(7)
+    texts = [
+        f"🎉 $T{i % 40} 最新涨幅为 {rng.uniform(1.5, 30):.2f}倍 🎉\n{rng.choice(cas)}\n"
+        f"💰 市值 ${rng.uniform(5, 50):.2f}K —> ${rng.uniform(50, 900):.2f}K\n💵💵💵💵💵"
+        for i in range(20000)
+    ]
+
+    tracemalloc.start()
+    signals = [parser.parse(text) for text in texts]
+    dataclass_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    batch = SignalBatch.from_signals(parser.parse(text) for text in texts)
+    batch_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"SignalData 列表: {dataclass_bytes / 1024:.0f} KB")
+    print(f"SignalBatch:     {batch_bytes / 1024:.0f} KB ({dataclass_bytes / batch_bytes:.1f}x)")
+
+    hits = batch.where(chain=Chain.SOL, min_gain=10, min_market_cap=300_000)
+    print(f"SOL & 涨幅>=10x & 市值>=300K: {len(hits)} 条")
+    print(f"去重后 CA 数: {len(batch.latest_by_ca())}")
+    print(batch[hits[0]] if hits else batch[0])
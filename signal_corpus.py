@@ -0,0 +1,158 @@
+"""
+合成信号语料生成器 - 给基准测试 / 回放用
+- 固定随机种子，结果可复现
+- 覆盖 SOL / BSC CA、中英文涨幅话术、市值箭头、emoji
+- 混入对抗噪声：假 CA、零宽字符、全角字符、引流链接、超长消息
+"""
+
+import json
+import random
+from typing import Iterator, List
+
+from signal_parser import b58encode, to_checksum_address
+
+
+EMOJIS = ["🎉", "🚀", "🔥", "💎", "💰", "💵", "📈", "⚡", "🌙", "👀", "🤖", "🎯"]
+
+TOKEN_NAMES = [
+    "KERNEL", "WIF", "BONK", "PEPE", "POPCAT", "MEW", "GIGA", "MOODENG", "PNUT",
+    "GOAT", "CHILLGUY", "FWOG", "MICHI", "RETARDIO", "SIGMA", "BILLY", "Ai16z", "ZEREBRO",
+]
+
+GAIN_PHRASES = [
+    "最新涨幅为 {gain}倍",
+    "涨幅 {gain} 倍",
+    "已经翻了 {gain}倍",
+    "just did {gain}x",
+    "pumped {gain}X since call",
+    "{gain}x from our entry",
+    "up {gain}x 🚀",
+]
+
+MC_ARROWS = ["—>", "->", "→", "-->", "—>>"]
+
+NOISE_LINES = [
+    "社区持续发酵，聪明钱大量买入，建议关注！",
+    "⚠️ 风险提示：加密货币投资有风险，请谨慎操作，DYOR！",
+    "更多信号请关注 https://t.me/someotherchannel 每日更新",
+    "联系管理员 @some_admin_bot 进 VIP 群",
+    "持有人数 {holders}，流动性 ${liquidity}K",
+    "Not financial advice. NFA / DYOR",
+    "MoonSoonGemsPumpWenLamboRocketsToMarsYes",   # 看起来像 base58 的长单词
+    "tx: {fake_hash}",
+]
+
+
+class SignalCorpus:
+    """可复现的合成信号语料"""
+
+    def __init__(self, seed: int = 42, noise_ratio: float = 0.15):
+        self.rng = random.Random(seed)
+        self.noise_ratio = noise_ratio
+        # CA 池：真实频道里同一个 CA 会反复出现
+        self.sol_cas = [self._sol_ca() for _ in range(2000)]
+        self.bsc_cas = [self._bsc_ca() for _ in range(300)]
+
+    def _sol_ca(self) -> str:
+        while True:
+            ca = b58encode(bytes(self.rng.getrandbits(8) for _ in range(32)))
+            if len(ca) >= 43:
+                return ca
+
+    def _bsc_ca(self) -> str:
+        return to_checksum_address('0x' + bytes(self.rng.getrandbits(8) for _ in range(20)).hex())
+
+    def _number(self, low: float, high: float) -> str:
+        return f"{self.rng.uniform(low, high):.2f}"
+
+    def signal(self) -> str:
+        """生成一条正常信号"""
+        rng = self.rng
+        chain_is_bsc = rng.random() < 0.15
+        ca = rng.choice(self.bsc_cas if chain_is_bsc else self.sol_cas)
+        token = rng.choice(TOKEN_NAMES)
+        gain = self._number(1.5, 80)
+        emoji = rng.choice(EMOJIS)
+
+        lines = [
+            f"{emoji} ${token} {rng.choice(GAIN_PHRASES).format(gain=gain)} {emoji}",
+            ca if rng.random() < 0.7 else f"CA: {ca}",
+        ]
+        if rng.random() < 0.85:
+            lines.append(
+                f"💰 市值 ${self._number(5, 90)}K {rng.choice(MC_ARROWS)} "
+                f"${self._number(100, 999)}{rng.choice('KKKM')}"
+            )
+        elif rng.random() < 0.5:
+            lines.append(f"MC ${self._number(50, 999)}K")
+        if rng.random() < 0.4:
+            lines.append(rng.choice(EMOJIS) * rng.randint(3, 8))
+        if rng.random() < 0.3:
+            lines.append(self._noise_line())
+        body = lines[1:]
+        rng.shuffle(body)
+        return "\n".join([lines[0]] + body)
+
+    def _noise_line(self) -> str:
+        return self.rng.choice(NOISE_LINES).format(
+            holders=self.rng.randint(100, 9999),
+            liquidity=self._number(10, 500),
+            fake_hash=b58encode(bytes(self.rng.getrandbits(8) for _ in range(64))),
+        )
+
+    def adversarial(self) -> str:
+        """生成一条对抗样本（不应被当成信号，或需要规范化才能识别）"""
+        rng = self.rng
+        kind = rng.randrange(7)
+        if kind == 0:
+            # 假 Solana CA：base58 字符但解码后不是 32 字节
+            return f"🔥 ${rng.choice(TOKEN_NAMES)} 马上起飞\n" + "".join(
+                rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz") for _ in range(36))
+        if kind == 1:
+            # 校验和错误的 BSC 地址
+            ca = rng.choice(self.bsc_cas)
+            return f"${rng.choice(TOKEN_NAMES)} {self._number(2, 9)}x\n{ca[:-1]}{ca[-1].swapcase()}"
+        if kind == 2:
+            # CA 中间插零宽字符
+            ca = rng.choice(self.sol_cas)
+            cut = rng.randint(5, 30)
+            return f"${rng.choice(TOKEN_NAMES)} {self._number(2, 9)}倍\n{ca[:cut]}\u200b{ca[cut:]}"
+        if kind == 3:
+            # 全角字符
+            return f"＄{rng.choice(TOKEN_NAMES)} 涨了 {self._number(2, 20)}ｘ\n{rng.choice(self.sol_cas)}"
+        if kind == 4:
+            # 只有引流和噪声
+            return "\n".join(self._noise_line() for _ in range(rng.randint(1, 4)))
+        if kind == 5:
+            # 超长消息
+            return self.signal() + "\n" + "\n".join(self._noise_line() for _ in range(rng.randint(20, 60)))
+        return ""
+
+    def message(self) -> str:
+        if self.rng.random() < self.noise_ratio:
+            return self.adversarial()
+        return self.signal()
+
+    def take(self, count: int) -> List[str]:
+        return [self.message() for _ in range(count)]
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            yield self.message()
+
+
+def iter_corpus(count: int, seed: int = 42, pool_size: int = 50000) -> Iterator[str]:
+    """产出 count 条消息；超过 pool_size 时循环复用预生成的池子，生成开销不计入计时"""
+    pool = SignalCorpus(seed).take(min(count, pool_size))
+    for i in range(count):
+        yield pool[i % len(pool)]
+
+
+# 导出 JSONL：python signal_corpus.py 10000 > corpus.jsonl
+if __name__ == '__main__':
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+    for text in SignalCorpus(seed).take(count):
+        print(json.dumps({'text': text}, ensure_ascii=False))
@@ -0,0 +1,161 @@
+"""
+CA 去重索引 - 在改写之前挡掉重复信号
+- 源频道会随着涨幅上涨反复发同一个 CA（3x、5x、12x…）
+- 时间窗口内的 TTL 表（有容量上限），O(1) 判断：跳过 / 升级 / 发布
+- 可选布隆过滤器：覆盖比 TTL 表更长的窗口，内存固定
+"""
+
+import math
+import time
+import hashlib
+from enum import Enum
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from signal_parser import SignalData, gain_value
+
+
+class Decision(Enum):
+    """去重结果"""
+    POST = 'post'          # 第一次见到，正常发
+    UPGRADE = 'upgrade'    # 见过，但涨幅明显更高，值得再发一条
+    SKIP = 'skip'          # 重复，不调用 AI 也不占发帖额度
+
+
+class BloomFilter:
+    """简单的布隆过滤器（双重哈希）"""
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+
+class CADedupIndex:
+    """按 CA 去重的时间窗口索引
+
+    TTL 表记录每个 CA 第一次出现的时间和已发布的最高涨幅，按插入顺序淘汰。
+    开启布隆过滤器后，被挤出 TTL 表的 CA 在 bloom_window 内仍然算"见过"；
+    过滤器分新旧两代轮换，每 bloom_window 秒丢掉旧的一代。
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, max_size: int = 10_000,
+                 upgrade_ratio: float = 2.0, bloom_window: float = 0,
+                 bloom_capacity: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.upgrade_ratio = upgrade_ratio
+        self.bloom_window = bloom_window
+        self.bloom_capacity = bloom_capacity
+
+        # ca -> (首次出现时间, 已发布的最高涨幅)
+        self._entries: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+        self._bloom: Optional[BloomFilter] = None
+        self._previous_bloom: Optional[BloomFilter] = None
+        self._bloom_started: Optional[float] = None
+        if bloom_window > 0:
+            self._bloom = BloomFilter(bloom_capacity)
+
+        self.stats = {decision.value: 0 for decision in Decision}
+
+    def _rotate_bloom(self, now: float):
+        if self._bloom is None:
+            return
+        if self._bloom_started is None:
+            self._bloom_started = now
+        elif now - self._bloom_started >= self.bloom_window:
+            self._previous_bloom = self._bloom
+            self._bloom = BloomFilter(self.bloom_capacity)
+            self._bloom_started = now
+
+    def _seen_in_bloom(self, ca: str) -> bool:
+        if self._bloom is None:
+            return False
+        return ca in self._bloom or (self._previous_bloom is not None and ca in self._previous_bloom)
+
+    def _remember(self, ca: str, first_seen: float, gain: float, now: float):
+        self._entries[ca] = (first_seen, gain)
+        self._entries.move_to_end(ca)
+        # 先丢过期的（按插入顺序，最老的在前面），再按容量淘汰
+        while self._entries:
+            seen_at, _ = next(iter(self._entries.values()))
+            if now - seen_at < self.ttl and len(self._entries) <= self.max_size:
+                break
+            self._entries.popitem(last=False)
+        if self._bloom is not None:
+            self._bloom.add(ca)
+
+    def check(self, ca: str, gain: float = math.nan, now: Optional[float] = None) -> Decision:
+        """判断这个 CA 该发、该升级还是跳过，并记录本次结果"""
+        now = time.time() if now is None else now
+        self._rotate_bloom(now)
+
+        entry = self._entries.get(ca)
+        if entry is not None and now - entry[0] >= self.ttl:
+            entry = None
+
+        if entry is None:
+            if self._seen_in_bloom(ca):
+                # 长窗口内见过但不知道当时的涨幅：以这次为基准，后面明显更高的才升级
+                decision = Decision.SKIP
+            else:
+                decision = Decision.POST
+            first_seen, posted_gain = now, gain
+        else:
+            first_seen, posted_gain = entry
+            if not math.isnan(gain) and (math.isnan(posted_gain) or gain >= posted_gain * self.upgrade_ratio):
+                decision = Decision.UPGRADE
+                posted_gain = gain
+            else:
+                decision = Decision.SKIP
+
+        if decision is not Decision.SKIP or entry is None:
+            self._remember(ca, first_seen, posted_gain, now)
+        self.stats[decision.value] += 1
+        return decision
+
+    def check_signal(self, signal: SignalData, now: Optional[float] = None) -> Decision:
+        return self.check(signal.ca, gain_value(signal.gain), now)
+
+    def __contains__(self, ca: str) -> bool:
+        entry = self._entries.get(ca)
+        return entry is not None and time.time() - entry[0] < self.ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 测试
+if __name__ == '__main__':
+    index = CADedupIndex(ttl=3600, max_size=3, upgrade_ratio=2.0, bloom_window=86400)
+    ca = "AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS"
+
+    for gain, at in [(3.0, 0), (5.0, 60), (12.0, 120), (13.0, 180), (30.0, 240), (4.0, 4000)]:
+        print(f"  {gain:>5}x @ {at:>5}s -> {index.check(ca, gain, now=1_000_000 + at).value}")
+
+    # 容量淘汰后由布隆过滤器兜底
+    for i in range(5):
+        index.check(f"OtherCA{i}", 2.0, now=1_005_000 + i)
+    print(f"  TTL 表大小: {len(index)}，被挤出的 CA: {index.check(ca, 2.0, now=1_005_010).value}")
+    print(f"  统计: {index.stats}")
@@ -4,8 +4,12 @@
 """
 
 import re
-from dataclasses import dataclass
-from typing import Optional, List
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
+from typing import Optional, List, Iterable, Iterator, Dict
 
 
 @dataclass
@@ -19,6 +23,345 @@ class SignalData:
     raw_text: str = ""                    # 原始文本
 
 
+# ================= 数值换算 =================
+
+_NUMBER_PATTERN = re.compile(r'\d+\.?\d*')
+_MC_VALUE_PATTERN = re.compile(r'\$(\d+\.?\d*)\s*([KMB]?)')
+_MC_UNITS = {'': 1.0, 'K': 1e3, 'M': 1e6, 'B': 1e9}
+
+
+def gain_value(gain: Optional[str]) -> float:
+    """涨幅字符串转数值 ("12.83倍" -> 12.83)，缺失时返回 NaN"""
+    if gain:
+        match = _NUMBER_PATTERN.search(gain)
+        if match:
+            return float(match.group())
+    return float('nan')
+
+
+def market_cap_value(market_cap: Optional[str]) -> float:
+    """市值字符串转美元数值，市值变化取最新值 ("$21.80K —> $279.64K" -> 279640.0)"""
+    if market_cap:
+        matches = _MC_VALUE_PATTERN.findall(market_cap)
+        if matches:
+            number, unit = matches[-1]
+            return float(number) * _MC_UNITS[unit]
+    return float('nan')
+
+
+def latest_market_cap(market_cap: Optional[str]) -> Optional[str]:
+    """市值字符串里最新的值，数字 + 单位 ("$21.80 K —> $279.64 K" -> "279.64K")"""
+    if market_cap:
+        matches = _MC_VALUE_PATTERN.findall(market_cap)
+        if matches:
+            number, unit = matches[-1]
+            return f"{number}{unit}"
+    return None
+
+
+# ================= CA 校验 =================
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+
+# 同一个 CA 在拉盘期间会反复出现，校验结果缓存起来
+CA_CACHE_SIZE = 4096
+
+
+def b58decode(text: str) -> bytes:
+    """base58 解码（Bitcoin / Solana 字母表），非法字符抛 ValueError"""
+    number = 0
+    for char in text:
+        index = _BASE58_INDEX.get(char)
+        if index is None:
+            raise ValueError(f"非法 base58 字符: {char!r}")
+        number = number * 58 + index
+
+    # 开头的每个 '1' 对应一个 0x00 字节
+    leading_zeros = len(text) - len(text.lstrip('1'))
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return b'\x00' * leading_zeros + body
+
+
+def b58encode(data: bytes) -> str:
+    """base58 编码（b58decode 的逆操作）"""
+    number = int.from_bytes(data, 'big')
+    chars = []
+    while number:
+        number, remainder = divmod(number, 58)
+        chars.append(BASE58_ALPHABET[remainder])
+    leading_zeros = len(data) - len(data.lstrip(b'\x00'))
+    return '1' * leading_zeros + ''.join(reversed(chars))
+
+
+_KECCAK_ROUND_CONSTANTS = (
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+)
+
+# 旋转位数，按 lane 下标 x + 5 * y 排列
+_KECCAK_ROTATIONS = (
+    0, 1, 62, 28, 27,
+    36, 44, 6, 55, 20,
+    3, 10, 43, 25, 39,
+    41, 45, 15, 21, 8,
+    18, 2, 61, 56, 14,
+)
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _keccak_f(lanes: List[int]) -> List[int]:
+    """Keccak-f[1600] 置换"""
+    for round_constant in _KECCAK_ROUND_CONSTANTS:
+        # θ
+        columns = [lanes[x] ^ lanes[x + 5] ^ lanes[x + 10] ^ lanes[x + 15] ^ lanes[x + 20]
+                   for x in range(5)]
+        for x in range(5):
+            right = columns[(x + 1) % 5]
+            d = columns[(x - 1) % 5] ^ (((right << 1) | (right >> 63)) & _MASK_64)
+            for y in range(0, 25, 5):
+                lanes[x + y] ^= d
+
+        # ρ + π
+        moved = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                lane = lanes[x + 5 * y]
+                shift = _KECCAK_ROTATIONS[x + 5 * y]
+                moved[y + 5 * ((2 * x + 3 * y) % 5)] = ((lane << shift) | (lane >> (64 - shift))) & _MASK_64
+
+        # χ
+        for y in range(0, 25, 5):
+            row = moved[y:y + 5]
+            for x in range(5):
+                lanes[x + y] = row[x] ^ (~row[(x + 1) % 5] & row[(x + 2) % 5])
+
+        # ι
+        lanes[0] ^= round_constant
+
+    return lanes
+
+
+def keccak256(data: bytes) -> bytes:
+    """以太坊使用的 Keccak-256（注意不是 hashlib.sha3_256，两者填充方式不同）"""
+    rate = 136
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(b'\x00' * (-len(padded) % rate))
+    padded[-1] |= 0x80
+
+    lanes = [0] * 25
+    for offset in range(0, len(padded), rate):
+        for i in range(rate // 8):
+            start = offset + i * 8
+            lanes[i] ^= int.from_bytes(padded[start:start + 8], 'little')
+        _keccak_f(lanes)
+
+    return b''.join(lane.to_bytes(8, 'little') for lane in lanes[:4])
+
+
+def to_checksum_address(address: str) -> str:
+    """生成 EIP-55 大小写校验地址"""
+    hex_part = address[2:].lower()
+    digest = keccak256(hex_part.encode('ascii')).hex()
+    return '0x' + ''.join(
+        char.upper() if char.isalpha() and int(digest[i], 16) >= 8 else char
+        for i, char in enumerate(hex_part)
+    )
+
+
+@lru_cache(maxsize=CA_CACHE_SIZE)
+def is_valid_ca(ca: str) -> bool:
+    """校验 CA 是否是真实地址（结果带 LRU 缓存）
+
+    - Solana: base58 解码后必须正好是 32 字节公钥
+    - BSC: 0x + 40 位 hex；大小写混合时必须通过 EIP-55 校验
+    """
+    if ca.startswith('0x'):
+        if len(ca) != 42:
+            return False
+        hex_part = ca[2:]
+        try:
+            int(hex_part, 16)
+        except ValueError:
+            return False
+        # 全小写 / 全大写不带校验信息
+        if hex_part.islower() or hex_part.isupper() or hex_part.isdigit():
+            return True
+        return to_checksum_address(ca) == ca
+
+    # 长度合理
+    if len(ca) < 32 or len(ca) > 44:
+        return False
+    # 不是全相同字符
+    if len(set(ca)) < 5:
+        return False
+    try:
+        return len(b58decode(ca)) == 32
+    except ValueError:
+        return False
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    """等价于正则两端的 \\b：前后字符都不是单词字符"""
+    if start > 0:
+        before = text[start - 1]
+        if before.isalnum() or before == '_':
+            return False
+    if end < len(text):
+        after = text[end]
+        if after.isalnum() or after == '_':
+            return False
+    return True
+
+
+# ================= 输出校验 =================
+
+# LLM 偶尔插入的零宽字符；ZWJ 只在 ASCII 字符旁边删除，保留 emoji 组合序列
+_ZERO_WIDTH_PATTERN = re.compile(r'[\u200b\u200c\u2060\ufeff]|(?<=[!-~])\u200d|\u200d(?=[!-~])')
+
+# 控制字符（保留换行和制表符）
+_CONTROL_PATTERN = re.compile(r'[\x00-\x08\x0b-\x1f\x7f-\x9f]')
+
+# 数字后面的 倍 / × 统一写成 x
+_MULTIPLIER_PATTERN = re.compile(r'[倍×✕]')
+
+
+def _replace_multipliers(text: str) -> str:
+    """把紧跟在数字后面（允许中间有空白）的 倍 / × 换成 x"""
+    parts = []
+    last = 0
+    for match in _MULTIPLIER_PATTERN.finditer(text):
+        start = match.start()
+        while start > last and text[start - 1].isspace():
+            start -= 1
+        if start > 0 and text[start - 1].isdigit():
+            parts.append(text[last:start])
+            parts.append('x')
+            last = match.end()
+    if not parts:
+        return text
+    parts.append(text[last:])
+    return ''.join(parts)
+
+
+def clean_output(text: str) -> str:
+    """清理 AI 输出：只去掉零宽字符和控制字符，其余原样保留（发推用这个）"""
+    if _CONTROL_PATTERN.search(text):
+        text = _CONTROL_PATTERN.sub('', text)
+    if not text.isascii() and ('\u200b' in text or '\u200c' in text or '\u200d' in text
+                               or '\u2060' in text or '\ufeff' in text):
+        text = _ZERO_WIDTH_PATTERN.sub('', text)
+    return text
+
+
+def normalize_output(text: str) -> str:
+    """规范化清理过的 AI 输出，只用于校验和匹配：全角转半角 (NFKC)、12.83倍 -> 12.83x
+
+    NFKC 会改掉发推时想保留的字符（全角标点、上标、部分符号），不能用在要发出去的文本上。
+    每一步都先用廉价的检查判断是否需要，绝大多数输出会直接原样返回。
+    """
+    if text.isascii():
+        return text
+    if not unicodedata.is_normalized('NFKC', text):
+        text = unicodedata.normalize('NFKC', text)
+    if '倍' in text or '×' in text or '✕' in text:
+        text = _replace_multipliers(text)
+    return text
+
+
+# 边界上不允许出现的字符
+_ALNUM_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+_NUMBER_CHARS = '0123456789.'
+
+
+@dataclass
+class ValidationResult:
+    """改写输出的逐字段校验结果"""
+    ok: bool
+    text: str                                              # 去掉零宽 / 控制字符的原文，发推应使用这个
+    fields: Dict[str, bool] = field(default_factory=dict)  # 字段 -> 是否找到
+    errors: List[str] = field(default_factory=list)
+
+
+class OutputMatcher:
+    """针对一条信号预先构建的多字段匹配器
+
+    构建时把每个受保护字段转成 (字段, 子串, 左边界, 右边界, 是否逐字)，检查时只做 str.find
+    加边界判断；实测比合并成一个交替正则扫一遍更快。
+    CA / 币名 / 涨幅 必须出现，市值只做记录（prompt 不要求保留）。
+    CA 和币名要在发出去的文本里逐字出现（全角的 CA 没法复制使用）；涨幅和市值在规范化后的文本里找。
+    """
+
+    def __init__(self, ca: Optional[str], token_name: Optional[str],
+                 gain: Optional[str], market_cap: Optional[str]):
+        self.expected: Dict[str, str] = {}
+        self._needles = []
+
+        if ca:
+            self._add('ca', ca, ca, _ALNUM_CHARS, _ALNUM_CHARS, verbatim=True)
+        if token_name:
+            self._add('token', token_name, token_name, '', _ALNUM_CHARS, verbatim=True)
+        if gain:
+            number = _NUMBER_PATTERN.search(gain)
+            if number:
+                # 只比数字，12.83x / 12.83倍 / 12.83 x 都算；112.83 不算
+                self._add('gain', gain, number.group(), _NUMBER_CHARS + '$', '0123456789')
+        latest = latest_market_cap(market_cap)
+        if latest:
+            self._add('market_cap', market_cap, latest, _NUMBER_CHARS, _NUMBER_CHARS)
+
+    def _add(self, name, expected, needle, left_forbidden, right_forbidden, verbatim=False):
+        self.expected[name] = expected
+        self._needles.append((name, needle, left_forbidden, right_forbidden, verbatim))
+
+    def check(self, output_text: str) -> ValidationResult:
+        cleaned = clean_output(output_text)
+        normalized = normalize_output(cleaned)
+
+        fields = {}
+        for name, needle, left_forbidden, right_forbidden, verbatim in self._needles:
+            # 找到一处两边紧挨的字符都不在禁止集合里的 needle 即可
+            text = cleaned if verbatim else normalized
+            length = len(text)
+            found = False
+            start = text.find(needle)
+            while start != -1:
+                end = start + len(needle)
+                if (start == 0 or text[start - 1] not in left_forbidden) \
+                        and (end == length or text[end] not in right_forbidden):
+                    found = True
+                    break
+                start = text.find(needle, start + 1)
+            fields[name] = found
+
+        errors = []
+        if not fields.get('ca', True):
+            errors.append(f"CA 丢失: {self.expected['ca']}")
+        if not fields.get('token', True):
+            errors.append(f"币名丢失: {self.expected['token']}")
+        if not fields.get('gain', True):
+            errors.append(f"涨幅丢失: {self.expected['gain']}")
+
+        return ValidationResult(ok=not errors, text=cleaned, fields=fields, errors=errors)
+
+
+@lru_cache(maxsize=256)
+def _build_matcher(ca, token_name, gain, market_cap) -> OutputMatcher:
+    return OutputMatcher(ca, token_name, gain, market_cap)
+
+
+def _parse_chunk(texts: List[str]) -> List[SignalData]:
+    """在子进程里解析一批文本（模块级函数，才能被进程池 pickle）"""
+    parser = SignalParser()
+    return [parser.parse(text) for text in texts]
+
+
 class SignalParser:
     """信号解析器"""
 
@@ -40,85 +383,125 @@ class SignalParser:
     # 市值变化正则 ($21.80K —> $279.64K)
     MC_CHANGE_PATTERN = r'\$[\d.]+\s*[KMB]?\s*[—\-\→>]+\s*\$[\d.]+\s*[KMB]?'
 
+    # 预编译扫描器
+    # 合并成一个大的交替正则会丢掉 re 的前缀加速和提前退出，实测反而比逐个 search 更慢，
+    # 所以保持按字段扫描，但全部预编译，并让每个模式都以字面量/字符集开头：
+    #   - CA 两端的 \b 改成手动判断，正则可以按前缀快速跳过无关字符
+    #   - 涨幅的第一个数字提到分组外面，同理
+    _TOKEN_SCANNER = re.compile(TOKEN_PATTERN)
+    _SOL_SCANNER = re.compile(r'[1-9A-HJ-NP-Za-km-z][1-9A-HJ-NP-Za-km-z]{31,}')
+    _BSC_SCANNER = re.compile(r'0x[a-fA-F0-9]{40}')
+    _GAIN_SCANNER = re.compile(r'\d(\d*\.?\d*)\s*(倍|x|X)')
+    _MC_CHANGE_SCANNER = re.compile(MC_CHANGE_PATTERN)
+    _MC_SCANNER = re.compile(MC_PATTERN)
+
     def parse(self, text: str) -> SignalData:
         """解析信号文本"""
         signal = SignalData(raw_text=text)
 
         # 1. 提取币名 ($XXX)
-        token_match = re.search(self.TOKEN_PATTERN, text)
+        token_match = self._TOKEN_SCANNER.search(text)
         if token_match:
             signal.token_name = f"${token_match.group(1)}"
 
         # 2. 提取 CA
-        # 先尝试 Solana
-        sol_match = re.search(self.SOL_CA_PATTERN, text)
-        if sol_match:
-            ca = sol_match.group(1)
-            # 过滤掉太短或无效的
-            if len(ca) >= 32 and self._is_valid_ca(ca):
-                signal.ca = ca
+        # 先尝试 Solana（取第一个通过校验的完整单词）
+        ca_span = None
+        for match in self._SOL_SCANNER.finditer(text):
+            start, end = match.span()
+            if end - start <= 44 and _is_word_boundary(text, start, end) \
+                    and self._is_valid_ca(match.group()):
+                signal.ca = match.group()
                 signal.chain = "SOL"
+                ca_span = (start, end)
+                break
 
         # 再尝试 BSC
         if not signal.ca:
-            bsc_match = re.search(self.BSC_CA_PATTERN, text)
-            if bsc_match:
-                signal.ca = bsc_match.group(1)
-                signal.chain = "BSC"
-
-        # 3. 提取涨幅
-        gain_match = re.search(self.GAIN_PATTERN, text)
-        if gain_match:
-            number = gain_match.group(1)
-            unit = gain_match.group(2)
-            signal.gain = f"{number}{unit}"
+            for match in self._BSC_SCANNER.finditer(text):
+                start, end = match.span()
+                if _is_word_boundary(text, start, end) and self._is_valid_ca(match.group()):
+                    signal.ca = match.group()
+                    signal.chain = "BSC"
+                    ca_span = (start, end)
+                    break
+
+        # 3. 提取涨幅（跳过 CA 内部的 "0x"、"9x" 之类）
+        for match in self._GAIN_SCANNER.finditer(text):
+            start = match.start()
+            if ca_span and ca_span[0] <= start < ca_span[1]:
+                continue
+            signal.gain = f"{text[start:match.end(1)]}{match.group(2)}"
+            break
 
         # 4. 提取市值变化
-        mc_change_match = re.search(self.MC_CHANGE_PATTERN, text)
+        mc_change_match = self._MC_CHANGE_SCANNER.search(text)
         if mc_change_match:
             signal.market_cap = mc_change_match.group(0)
         else:
-            # 单独的市值
-            mc_matches = re.findall(self.MC_PATTERN, text)
+            # 单独的市值，取最后一个作为当前市值
+            mc_matches = self._MC_SCANNER.findall(text)
             if mc_matches:
-                # 取最后一个作为当前市值
                 last_mc = mc_matches[-1]
                 signal.market_cap = f"${last_mc[0]}{last_mc[1]}"
 
         return signal
 
-    def _is_valid_ca(self, ca: str) -> bool:
-        """验证 CA 是否有效"""
-        # 不是全相同字符
-        if len(set(ca)) < 5:
-            return False
-        # 长度合理
-        if len(ca) < 32 or len(ca) > 44:
-            return False
-        return True
+    def parse_many(self, texts: Iterable[str], workers: int = 0,
+                   chunk_size: int = 500) -> Iterator[SignalData]:
+        """批量 / 流式解析，按输入顺序逐条产出 SignalData
 
-    def validate_output(self, signal: SignalData, output_text: str) -> tuple:
-        """验证改写输出是否保留了关键信息"""
-        errors = []
+        texts 可以是任意迭代器（导出的频道历史、逐行读取的 JSONL 等），不会一次性读进内存。
+        workers > 0 时用进程池并行解析：输入按 chunk_size 分批提交，
+        最多 workers * 2 批在途，保证顺序的同时内存有界。
+        """
+        if workers <= 0:
+            for text in texts:
+                yield self.parse(text)
+            return
+
+        # 进程池只有批量解析才用到，不拖慢启动
+        from concurrent.futures import ProcessPoolExecutor
+
+        iterator = iter(texts)
+        max_pending = workers * 2
+        pending = deque()
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                # 在途批次不足时继续提交
+                while len(pending) < max_pending:
+                    chunk = list(islice(iterator, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(pool.submit(_parse_chunk, chunk))
+
+                if not pending:
+                    break
 
-        # CA 必须存在
-        if signal.ca and signal.ca not in output_text:
-            errors.append(f"CA 丢失: {signal.ca}")
+                # 按提交顺序取回，保证输出顺序
+                for signal in pending.popleft().result():
+                    yield signal
+        finally:
+            # 调用方提前停止迭代时，取消还没开始的批次
+            pool.shutdown(wait=True, cancel_futures=True)
 
-        # 币名必须存在
-        if signal.token_name and signal.token_name not in output_text:
-            errors.append(f"币名丢失: {signal.token_name}")
+    def _is_valid_ca(self, ca: str) -> bool:
+        """验证 CA 是否有效"""
+        return is_valid_ca(ca)
 
-        # 涨幅必须存在（数字部分）
-        if signal.gain:
-            gain_number = re.search(r'(\d+\.?\d*)', signal.gain)
-            if gain_number and gain_number.group(1) not in output_text:
-                errors.append(f"涨幅丢失: {signal.gain}")
+    def matcher(self, signal: SignalData) -> OutputMatcher:
+        """获取信号的输出匹配器（同一组字段只构建一次）"""
+        return _build_matcher(signal.ca, signal.token_name, signal.gain, signal.market_cap)
 
-        if errors:
-            return False, errors
+    def check_output(self, signal: SignalData, output_text: str) -> ValidationResult:
+        """校验改写输出，返回逐字段结果和清理后的文本"""
+        return self.matcher(signal).check(output_text)
 
-        return True, []
+    def validate_output(self, signal: SignalData, output_text: str) -> tuple:
+        """验证改写输出是否保留了关键信息"""
+        result = self.check_output(signal, output_text)
+        return result.ok, result.errors
 
 
 # 测试
@@ -140,3 +523,13 @@ if __name__ == '__main__':
     print(f"  链: {signal.chain}")
     print(f"  涨幅: {signal.gain}")
     print(f"  市值: {signal.market_cap}")
+
+    # 扫描器和参考实现的一致性见 test_signal_parser.py
+
+    # 输出校验：零宽字符、全角数字、倍 / x 混用都能通过；全角的币名 / CA 不算保留
+    llm_output = "🚀 $KERNEL just did １２.８３倍!\n\nCA: AL9ECCZrSbSdmL8hngx\u200bjxTwZvYPpoBtHqGW51pZVBAGS"
+    result = parser.check_output(signal, llm_output)
+    print(f"  输出校验: ok={result.ok} fields={result.fields}")
+    print(f"  发推文本: {result.text!r}")
+    result = parser.check_output(signal, llm_output.replace('$KERNEL', '＄ＫＥＲＮＥＬ'))
+    print(f"  全角币名: ok={result.ok} errors={result.errors}")
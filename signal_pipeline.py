@@ -0,0 +1,261 @@
+"""
+信号流水线 - 接收 → 解析 → 去重 → 改写 → 入队 → 发帖，每一步是独立的阶段
+- 信号只解析一次，SignalRecord 带着 SignalData 和各阶段时间戳往下传
+- 每个阶段有自己的并发数和有界输入队列：下游处理不过来时上游的 put 会等待（背压）
+- 每个阶段单独统计处理量、丢弃、出错、耗时，便于分别调参
+- 发帖阶段在持久化队列之后（durable_queue + tweet_scheduler），记录以 JSON 形式落盘
+"""
+
+import json
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, List, Callable, Awaitable, Any
+
+from signal_parser import SignalData
+from metrics import Counter, Gauge, Histogram
+
+
+STAGE_SECONDS = Histogram('pipeline_stage_seconds', '流水线各阶段处理一条记录的耗时（秒）', ['stage'])
+STAGE_RECORDS = Counter('pipeline_stage_records', '流水线各阶段处理的记录数', ['stage', 'result'])
+STAGE_DEPTH = Gauge('pipeline_stage_depth', '流水线各阶段排队中的记录数', ['stage'])
+
+
+@dataclass
+class SignalRecord:
+    """在各阶段之间传递的一条信号"""
+    raw_text: str
+    received_at: float = field(default_factory=time.time)
+    message_ids: List[int] = field(default_factory=list)  # 来源 TG 消息 id（相册有多个）
+    media: Any = None                       # TG 媒体，只在接收阶段用，不落盘
+    entities: Any = None                    # TG 格式实体（对应 raw_text），只在接收阶段用，不落盘
+    signal: Optional[SignalData] = None     # 解析阶段填入
+    decision: Optional[str] = None          # 去重结果 (post / upgrade)
+    tweet: Optional[str] = None             # 改写阶段填入
+    timings: Dict[str, float] = field(default_factory=dict)  # 阶段名 -> 完成时间戳
+
+    def mark(self, stage: str):
+        self.timings[stage] = time.time()
+
+    def age(self, now: Optional[float] = None) -> float:
+        """从收到信号到现在的秒数"""
+        return (time.time() if now is None else now) - self.received_at
+
+    def to_payload(self) -> str:
+        """序列化成推文队列里的消息（不含原文和媒体）"""
+        signal = None
+        if self.signal:
+            signal = asdict(self.signal)
+            del signal['raw_text']
+        return json.dumps({
+            'tweet': self.tweet,
+            'signal': signal,
+            'decision': self.decision,
+            'received_at': self.received_at,
+            'timings': self.timings,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_payload(cls, payload: str) -> 'SignalRecord':
+        """从推文队列消息还原；兼容旧版本直接存推文文本的消息"""
+        if not payload.startswith('{'):
+            return cls(raw_text="", tweet=payload, received_at=0.0)
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return cls(raw_text="", tweet=payload, received_at=0.0)
+        signal = SignalData(**data['signal']) if data.get('signal') else None
+        return cls(
+            raw_text="",
+            received_at=data.get('received_at', 0.0),
+            signal=signal,
+            decision=data.get('decision'),
+            tweet=data.get('tweet'),
+            timings=data.get('timings') or {},
+        )
+
+
+class StageStats:
+    """单个阶段的计数和耗时（最近 window 条），同时写入指标"""
+
+    def __init__(self, name: str, window: int = 200):
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, latency: float, passed: bool = True, ok: bool = True):
+        self.processed += 1
+        if not ok:
+            self.errors += 1
+            result = 'error'
+        elif not passed:
+            self.dropped += 1
+            result = 'dropped'
+        else:
+            result = 'passed'
+        self.latencies.append(latency)
+        STAGE_SECONDS.labels(stage=self.name).observe(latency)
+        STAGE_RECORDS.labels(stage=self.name, result=result).inc()
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'p50': round(self.percentile(0.5), 4),
+            'p95': round(self.percentile(0.95), 4),
+            'p99': round(self.percentile(0.99), 4),
+        }
+
+
+# 阶段处理函数：返回记录则交给下一阶段，返回 None 表示到此为止（过滤掉 / 已处理完）
+StageHandler = Callable[[SignalRecord], Awaitable[Optional[SignalRecord]]]
+
+
+class Stage:
+    """流水线的一个阶段：concurrency 个 worker 从有界队列里取记录处理"""
+
+    def __init__(self, name: str, handler: StageHandler, concurrency: int = 1, queue_size: int = 100,
+                 stats_window: int = 200):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.stats = StageStats(name, stats_window)
+        self.next: Optional['Stage'] = None
+        self.on_exit: Optional[Callable[[SignalRecord], None]] = None  # 记录离开流水线时回调（由 Pipeline 设置）
+        self._queue: Optional[asyncio.Queue] = None   # 在事件循环里 start() 时创建
+        self._workers: List[asyncio.Task] = []
+
+    async def put(self, record: SignalRecord):
+        """交给这个阶段；队列满时等待（背压）"""
+        await self._queue.put(record)
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        STAGE_DEPTH.labels(stage=self.name).set_function(self.depth)
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+
+    async def _work(self):
+        while True:
+            record = await self._queue.get()
+            try:
+                await self._process(record)
+            finally:
+                # 交给下一阶段之后才算完成，join() 才不会提前返回
+                self._queue.task_done()
+
+    async def _process(self, record: SignalRecord):
+        start = time.perf_counter()
+        try:
+            result = await self.handler(record)
+        except Exception as e:
+            print(f"❌ [{self.name}] 处理出错: {e}")
+            self.stats.record(time.perf_counter() - start, ok=False)
+            self._exit(record)
+            return
+        self.stats.record(time.perf_counter() - start, passed=result is not None)
+        if result is None:
+            self._exit(record)
+            return
+        result.mark(self.name)
+        if self.next is not None:
+            await self.next.put(result)
+        else:
+            self._exit(result)
+
+    def _exit(self, record: SignalRecord):
+        if self.on_exit is not None:
+            self.on_exit(record)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class Pipeline:
+    """按顺序串起来的阶段；on_exit 在每条记录走完、被过滤或出错时调用（用来推进消息游标）"""
+
+    def __init__(self, stages: List[Stage], on_exit: Optional[Callable[[SignalRecord], None]] = None):
+        self.stages = stages
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        for stage in stages:
+            stage.on_exit = on_exit
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    async def submit(self, record: SignalRecord):
+        """从第一个阶段进入流水线（第一个阶段满了会等待）"""
+        await self.stages[0].put(record)
+
+    async def join(self):
+        """等所有已提交的记录走完（测试 / 压测用）"""
+        for stage in self.stages:
+            await stage._queue.join()
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+
+    def stats(self) -> Dict[str, dict]:
+        return {stage.name: dict(stage.stats.as_dict(), depth=stage.depth()) for stage in self.stages}
+
+
+# 测试
+if __name__ == '__main__':
+    from signal_parser import SignalParser
+
+    parser = SignalParser()
+    sample = "💰 $KERNEL 12.83倍\nCA: AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS\n市值: $279.64K"
+
+    async def parse(record):
+        record.signal = parser.parse(record.raw_text)
+        return record if record.signal.ca else None
+
+    async def rewrite(record):
+        await asyncio.sleep(0.05)   # 模拟 AI 延迟
+        record.tweet = f"🚀 {record.signal.token_name} just did {record.signal.gain}!"
+        return record
+
+    finished = []
+
+    async def enqueue(record):
+        finished.append(record.to_payload())
+        return record
+
+    async def demo():
+        pipeline = Pipeline([
+            Stage('parse', parse),
+            Stage('rewrite', rewrite, concurrency=4, queue_size=2),
+            Stage('enqueue', enqueue),
+        ])
+        pipeline.start()
+        start = time.time()
+        for i in range(20):
+            await pipeline.submit(SignalRecord(sample if i % 5 else "no ca here"))
+        await pipeline.join()
+        print(f"  20 条用时 {time.time() - start:.2f}s")
+        for name, stats in pipeline.stats().items():
+            print(f"  {name:8} {stats}")
+        record = SignalRecord.from_payload(finished[0])
+        print(f"  还原: {record.signal.ca} {record.tweet} 阶段 {list(record.timings)}")
+        await pipeline.stop()
+
+    asyncio.run(demo())
@@ -0,0 +1,94 @@
+"""
+启动耗时分析 - 记录启动过程中每一步的开始时间和耗时，启动完成后打印一张时间线
+- phase(): 同步代码块；track(): 协程（并发初始化的几项各自计时）
+- 时间从进程启动算起（包含 import），能看出重新部署时"听不到信号"的窗口有多长
+- 看单个模块的 import 耗时：python -X importtime main_v2.py 2> import.log
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, List, Optional, Tuple
+
+
+def _process_started() -> float:
+    """进程启动时刻（perf_counter 坐标）；拿不到时用本模块被导入的时刻"""
+    try:
+        with open(f'/proc/{os.getpid()}/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+        if 0 <= age < 60:
+            return time.perf_counter() - age
+    except (OSError, ValueError, IndexError):
+        pass
+    return time.perf_counter()
+
+
+class StartupProfile:
+    def __init__(self, started: Optional[float] = None):
+        self.started = _process_started() if started is None else started
+        self.phases: List[Tuple[str, float, float]] = []   # (名称, 开始, 结束)，相对 started 的秒数
+
+    def record(self, name: str, start: float, end: float):
+        self.phases.append((name, start - self.started, end - self.started))
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    async def track(self, name: str, awaitable: Awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name: str):
+        """记录一个时间点（例如"开始监听"）"""
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, width: int = 40) -> str:
+        if not self.phases:
+            return ""
+        total = max(end for _, _, end in self.phases) or 1e-9
+        lines = [f"⏱️ 启动耗时 (从进程启动算起，共 {total:.2f}s)"]
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            left = int(start / total * width)
+            bar = '█' * max(1, int((end - start) / total * width)) if end > start else '│'
+            lines.append(f"  {name:<14} {start:>6.2f}s +{end - start:>6.2f}s  {' ' * left}{bar}")
+        return "\n".join(lines)
+
+
+# 测试
+if __name__ == '__main__':
+    import asyncio
+
+    profile = StartupProfile()
+    with profile.phase('import'):
+        time.sleep(0.05)
+
+    async def demo():
+        await asyncio.gather(
+            profile.track('telegram', asyncio.sleep(0.3)),
+            profile.track('browser', asyncio.sleep(0.8)),
+            profile.track('ai', asyncio.sleep(0.2)),
+        )
+
+    async def run():
+        task = asyncio.ensure_future(demo())
+        await asyncio.sleep(0.3)
+        profile.mark('listening')
+        await task
+
+    asyncio.run(run())
+    print(profile.report())
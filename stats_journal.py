@@ -0,0 +1,169 @@
+"""
+统计事件日志 - 只追加的事件日志 + 定期快照，重启后发帖限流状态可信
+- record(): 内存状态立即更新；追加写日志交给单独的写线程（保持顺序），不阻塞事件循环
+- 每条事件写完 flush + fsync；崩溃时最多丢最后一条，写了一半的行启动时忽略
+- 每 snapshot_every 条事件写一次快照（临时文件 + fsync + rename，原子替换），然后清空日志
+- 快照里记着覆盖到的事件序号：rename 之后、清空日志之前崩溃，重启也不会重复计数
+- 启动：读快照，只重放快照之后的事件，再压缩一次
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple
+
+
+class StatsJournal:
+    def __init__(self, path: str, default: dict, apply: Callable[[dict, dict], None], snapshot_every: int = 100):
+        """
+        path: 快照文件（旧版本直接写的统计 JSON 可以直接当快照读）；日志写在同名的 .journal 文件里
+        default: 没有快照时的初始状态
+        apply: 把一条事件应用到状态上（记录时和启动重放时共用）
+        """
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self.apply = apply
+        self.snapshot_every = snapshot_every
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-journal')
+        self._journal = None   # 日志文件，只在写线程里用
+
+        self.state, self.seq, replayed = self._load(default)
+        self._since_snapshot = 0
+        if replayed or os.path.exists(self.journal_path):
+            # 重放过的事件并进快照，顺便去掉写了一半的最后一行，之后的追加从干净的文件开始
+            self._compact(self._snapshot_data())
+        if replayed:
+            print(f"📒 发帖统计: 快照之后重放了 {replayed} 条事件")
+
+    def _load(self, default: dict) -> Tuple[dict, int, int]:
+        state, seq = dict(default), 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                seq = data.pop('journal_seq', 0)
+                state.update(data)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 发帖统计快照读取失败，从日志重建: {e}")
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        break   # 崩溃时写了一半的最后一行
+                    if event['seq'] <= seq:
+                        continue   # 已经在快照里
+                    self.apply(state, event)
+                    seq = event['seq']
+                    replayed += 1
+        return state, seq, replayed
+
+    def record(self, kind: str, **fields):
+        """记一条事件：内存状态立即更新，落盘交给写线程"""
+        self.seq += 1
+        event = dict(fields, type=kind, seq=self.seq)
+        self.apply(self.state, event)
+        self._executor.submit(self._write, self._append, json.dumps(event))
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self._since_snapshot = 0
+            self._executor.submit(self._write, self._compact, self._snapshot_data())
+
+    def _snapshot_data(self) -> dict:
+        """当前状态的拷贝（在调用方线程里拷，写线程拿到的是不会再变的数据）"""
+        data = {key: list(value) if isinstance(value, list) else value for key, value in self.state.items()}
+        data['journal_seq'] = self.seq
+        return data
+
+    def _write(self, fn, data):
+        try:
+            fn(data)
+        except OSError as e:
+            print(f"⚠️ 发帖统计写入失败: {e}")
+
+    def _append(self, line: str):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(line + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _compact(self, data: dict):
+        """写快照（原子替换）后清空日志"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._fsync_dir()
+
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w')
+        os.fsync(self._journal.fileno())
+
+    def _fsync_dir(self):
+        """让 rename 本身也落盘（Windows 上打不开目录，跳过）"""
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def flush(self):
+        """等写线程把已经记录的事件都写完"""
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        """写最后一次快照并关闭（会阻塞，异步代码里用 asyncio.to_thread 调用）"""
+        self._executor.submit(self._write, self._compact, self._snapshot_data())
+        self._executor.shutdown(wait=True)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+# 测试
+if __name__ == '__main__':
+    import time
+    import tempfile
+
+    def apply(state, event):
+        if event['type'] == 'tweet':
+            state['tweets_today'] += 1
+            state['recent_tweets'].append(event['ts'])
+        elif event['type'] == 'day':
+            state['today'] = event['today']
+            state['tweets_today'] = 0
+
+    path = os.path.join(tempfile.mkdtemp(), 'stats.json')
+    default = {'today': '2024-01-01', 'tweets_today': 0, 'recent_tweets': []}
+
+    journal = StatsJournal(path, default, apply, snapshot_every=4)
+    start = time.perf_counter()
+    for i in range(6):
+        journal.record('tweet', ts=1000.0 + i)
+    print(f"  记录 6 条用时 {(time.perf_counter() - start) * 1000:.2f} ms (不等落盘)")
+    journal.flush()
+    with open(journal.journal_path) as f:
+        print(f"  快照之后的日志 {len(f.readlines())} 行，状态 {journal.state['tweets_today']} 条")
+    # 模拟崩溃：不调用 close，日志最后一行只写了一半
+    with open(journal.journal_path, 'a') as f:
+        f.write('{"seq": 7, "ty')
+
+    journal = StatsJournal(path, default, apply, snapshot_every=4)
+    print(f"  重启后: {journal.state['tweets_today']} 条，序号 {journal.seq}")
+    journal.record('day', today='2024-01-02')
+    journal.close()
+    journal = StatsJournal(path, default, apply)
+    print(f"  换日后重启: {journal.state}")
+    journal.close()
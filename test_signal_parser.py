@@ -0,0 +1,109 @@
+"""
+信号解析器测试 - 扫描器 (SignalParser.parse) 和逐字段 re.search 参考实现的一致性
+
+运行: python -m pytest -q test_signal_parser.py
+"""
+
+import re
+
+import pytest
+
+from signal_parser import SignalParser, SignalData, is_valid_ca
+
+
+def parse_reference(text: str) -> SignalData:
+    """逐字段 re.search 的参考实现（优化前的写法），只用来校验扫描器结果"""
+    signal = SignalData(raw_text=text)
+
+    # 1. 提取币名 ($XXX)
+    token_match = re.search(SignalParser.TOKEN_PATTERN, text)
+    if token_match:
+        signal.token_name = f"${token_match.group(1)}"
+
+    # 2. 提取 CA：先尝试 Solana，再尝试 BSC
+    for sol_match in re.finditer(SignalParser.SOL_CA_PATTERN, text):
+        ca = sol_match.group(1)
+        if len(ca) >= 32 and is_valid_ca(ca):
+            signal.ca = ca
+            signal.chain = "SOL"
+            break
+    if not signal.ca:
+        for bsc_match in re.finditer(SignalParser.BSC_CA_PATTERN, text):
+            if is_valid_ca(bsc_match.group(1)):
+                signal.ca = bsc_match.group(1)
+                signal.chain = "BSC"
+                break
+
+    # 3. 提取涨幅
+    gain_match = re.search(SignalParser.GAIN_PATTERN, text)
+    if gain_match:
+        signal.gain = f"{gain_match.group(1)}{gain_match.group(2)}"
+
+    # 4. 提取市值变化，没有变化时取最后一个单独的市值
+    mc_change_match = re.search(SignalParser.MC_CHANGE_PATTERN, text)
+    if mc_change_match:
+        signal.market_cap = mc_change_match.group(0)
+    else:
+        mc_matches = re.findall(SignalParser.MC_PATTERN, text)
+        if mc_matches:
+            last_mc = mc_matches[-1]
+            signal.market_cap = f"${last_mc[0]}{last_mc[1]}"
+
+    return signal
+
+
+KERNEL_SIGNAL = """
+    🎉 $KERNEL 最新涨幅为 12.83倍 🎉
+    AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS
+    💰 市值 $21.80K —> $279.64K
+    💵💵💵💵💵
+    """
+
+PARITY_CASES = [
+    KERNEL_SIGNAL,
+    "",
+    "没有任何信号的普通消息",
+    "$PEPE 🚀 5x\n0x55d398326f99059fF775485246999027B3197955\n市值 $1.2M",
+    "🔥 $WIF 涨了 3.5X\nEKpQGSJtjMFqKZ9KQanSqYXRcF8fBopzLHYxdM65zcjm\n$500K -> $1.75M",
+    "$DOGE 最新涨幅为 2倍 市值 $80K 之前 $40K 现在 $120.5K",
+    "$A1B2 $C3D4 10x 20x 8xDgnV6Ks2nC7xWq7kQ3D7hyAyqTW1X4wU1pLMXfzRpF",
+    "CA: 7GCihgDB8fe6KNjn2MYtkzZcRjQy3t9GHdC8uHYmW2hr\n涨幅 12.83 倍\n$21.80K —> $279.64K",
+    "价格 $0.0012 → $0.05 ... $3.1B",
+    "$KERNEL 12x AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    "MoonSoonGemsPumpWenLamboRocketsToMarsYes 不是 CA，后面才是 $BONK 8x\n"
+    "DezXAZ8z7PnrnRJjz3wXBoRgixCa6xjnB7YaB1pPB263",
+    "$FAKE 2x 0x55d398326f99059ff775485246999027B3197955",
+    "t.me/somechannel @someone $ABC 1.5x $12",
+]
+
+
+@pytest.fixture(scope='module')
+def parser():
+    return SignalParser()
+
+
+@pytest.mark.parametrize('text', PARITY_CASES)
+def test_scanner_matches_reference(parser, text):
+    assert parser.parse(text) == parse_reference(text)
+
+
+def test_kernel_fields(parser):
+    signal = parser.parse(KERNEL_SIGNAL)
+    assert signal.token_name == '$KERNEL'
+    assert signal.ca == 'AL9ECCZrSbSdmL8hngxjxTwZvYPpoBtHqGW51pZVBAGS'
+    assert signal.chain == 'SOL'
+    assert signal.gain == '12.83倍'
+    assert signal.market_cap == '$21.80K —> $279.64K'
+
+
+def test_ca_before_gain_is_intentional_difference(parser):
+    # 有意的差异：CA 出现在涨幅前面时，参考实现会把地址里的 "0x" 当成涨幅
+    text = "0x55d398326f99059fF775485246999027B3197955 $CAKE 4.2x"
+    assert parser.parse(text).gain == '4.2x'
+    assert parse_reference(text).gain == '0x'
+
+
+def test_parse_many_matches_serial(parser):
+    batch = PARITY_CASES * 50
+    pooled = list(parser.parse_many(batch, workers=2, chunk_size=64))
+    assert pooled == [parser.parse(text) for text in batch]
@@ -0,0 +1,131 @@
+"""
+推文长度计算 - 按 Twitter 的加权规则算字数
+- 拉丁字母、数字、常用标点：1
+- emoji、中日韩文字等：2（emoji 组合序列整体算一个 emoji）
+- 链接：不管多长都算 23（t.co 短链）
+- 上限 280
+"""
+
+import re
+from typing import List, Tuple
+
+
+TWEET_LIMIT = 280
+URL_WEIGHT = 23
+
+# 权重为 1 的码位范围（twitter-text v3 配置），其余为 2
+_LIGHT_RANGES = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+# 依附在前一个 emoji 上、本身不占字数的码位：ZWJ、变体选择符、肤色、键帽、标签序列
+_ZERO_WIDTH_JOINER = 0x200D
+_KEYCAP = 0x20E3
+_ATTACHED = frozenset((_ZERO_WIDTH_JOINER, 0xFE0E, 0xFE0F, _KEYCAP, *range(0x1F3FB, 0x1F400), *range(0xE0020, 0xE0080)))
+_REGIONAL_INDICATORS = range(0x1F1E6, 0x1F200)
+
+# 权重为 2 的字符（不在上面几个范围里的）
+_HEAVY_PATTERN = re.compile('[^\u0000-\u10ff\u2000-\u200d\u2010-\u201f\u2032-\u2037]')
+
+# emoji 组合序列里的特殊字符，出现时需要逐字精算
+_SEQUENCE_PATTERN = re.compile('[\u200d\ufe0e\ufe0f\u20e3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F\U0001F1E6-\U0001F1FF]')
+
+# Twitter 会自动识别成链接的写法（带不带 http 都算）：先找顶级域名，再往前后扩展出完整链接
+_TLD_PATTERN = re.compile(r'\.(?:com|net|org|io|me|xyz|fun|app|gg|co|ai|so|tv|info|finance|money|tech)\b')
+_HOST_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-.')
+
+
+def _char_weight(cp: int) -> int:
+    for low, high in _LIGHT_RANGES:
+        if low <= cp <= high:
+            return 1
+    return 2
+
+
+def _sequence_weight(text: str) -> int:
+    """逐字计算，处理 ZWJ 组合、变体选择符、肤色、键帽、国旗"""
+    weight = 0
+    joined = False          # 上一个字符是 ZWJ，当前字符并入前一个 emoji
+    pending_flag = False    # 国旗由两个区域指示符组成，只算一次
+    for ch in text:
+        cp = ord(ch)
+        if cp in _ATTACHED:
+            joined = cp == _ZERO_WIDTH_JOINER
+            if cp == _KEYCAP:
+                weight += 1  # 1️⃣ 整体是 emoji，前面的数字已经算了 1
+            continue
+        if joined:
+            joined = False
+            continue
+        if cp in _REGIONAL_INDICATORS:
+            if pending_flag:
+                pending_flag = False
+                continue
+            pending_flag = True
+        else:
+            pending_flag = False
+        weight += 1 if cp <= 4351 else _char_weight(cp)
+    return weight
+
+
+def _text_weight(text: str) -> int:
+    """不含链接的文本权重"""
+    if text.isascii():
+        return len(text)
+    if _SEQUENCE_PATTERN.search(text):
+        return _sequence_weight(text)
+    return len(text) + len(_HEAVY_PATTERN.findall(text))
+
+
+def _url_spans(text: str) -> List[Tuple[int, int]]:
+    """找出会被 Twitter 识别成链接的区间"""
+    spans = []
+    last_end = 0
+    for match in _TLD_PATTERN.finditer(text):
+        tld_start = match.start()
+        if tld_start < last_end:
+            continue
+        start = tld_start
+        while start > last_end and text[start - 1] in _HOST_CHARS:
+            start -= 1
+        while start < tld_start and text[start] in '.-':
+            start += 1
+        if start == tld_start or (start > 0 and text[start - 1] in '@$_'):
+            continue
+        if text.startswith('https://', start - 8):
+            start -= 8
+        elif text.startswith('http://', start - 7):
+            start -= 7
+        end = match.end()
+        if text.startswith('/', end):
+            while end < len(text) and not text[end].isspace():
+                end += 1
+        spans.append((start, end))
+        last_end = end
+    return spans
+
+
+def weighted_length(text: str) -> int:
+    """按 Twitter 规则计算的推文长度"""
+    weight = 0
+    last = 0
+    for start, end in _url_spans(text):
+        weight += _text_weight(text[last:start]) + URL_WEIGHT
+        last = end
+    return weight + _text_weight(text[last:])
+
+
+def fits(text: str, limit: int = TWEET_LIMIT) -> bool:
+    return weighted_length(text) <= limit
+
+
+# 测试
+if __name__ == '__main__':
+    samples = [
+        "hello world",
+        "🚀 $KERNEL just did 12.83x!",
+        "👨‍👩‍👧‍👦 🇦🇺 1️⃣ 👍🏽",
+        "加入 EgeEye，抓住下一个 100 倍！",
+        "👀 We called it early! Next 100x? 👉 t.me/egeyeaimeme",
+        "more at https://x.com/some/very/long/path/that/is/way/longer/than/twenty/three",
+    ]
+    for text in samples:
+        print(f"  len={len(text):>3}  weighted={weighted_length(text):>3}  {text}")
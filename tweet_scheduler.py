@@ -0,0 +1,267 @@
+"""
+推文调度器 - 最小堆延迟任务调度，替代 twitter_worker 里的 sleep + 重新入队
+- 延迟堆 (可发时间, 优先级, 排名, 序号)：到期的任务移入就绪堆 (优先级, 排名, 序号)
+- 序号就是持久化队列里的消息 id，放回去的任务保持原来的位置，发帖顺序稳定
+- 全局闸门 pause_until()：发帖器限流 / 休眠时整体暂停到指定时间，不用逐条轮询
+- 精确睡到最早的到期时间；新任务（或更高优先级任务）入队时提前唤醒重新计算
+- 按 CA 合并：同一个 CA 的新推文 O(1) 替换还在排队的旧推文；超过最长等待时间的直接丢弃
+- 额度紧张时按涨幅（或新鲜度）排序，先发最有价值的
+"""
+
+import math
+import time
+import heapq
+import asyncio
+from typing import Optional, Dict, Tuple
+
+from durable_queue import DurableQueue, QueueMessage
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+# 同优先级内的排序方式
+ORDER_FIFO = 'fifo'     # 先进先出
+ORDER_GAIN = 'gain'     # 涨幅高的先发
+ORDER_FRESH = 'fresh'   # 最新的先发
+
+
+class _Job:
+    """调度器里的一条任务；堆里的条目带 version，任务被替换后旧条目自动失效"""
+
+    __slots__ = ('priority', 'rank', 'eligible_at', 'enqueued_at', 'key', 'version')
+
+    def __init__(self, priority: int, rank: float, eligible_at: float, enqueued_at: float, key: Optional[str]):
+        self.priority = priority
+        self.rank = rank
+        self.eligible_at = eligible_at
+        self.enqueued_at = enqueued_at
+        self.key = key
+        self.version = 0
+
+
+class TweetScheduler:
+    """在 DurableQueue 之上的内存调度（持久化仍由 DurableQueue 负责，重启后从里面恢复）
+
+    优先级数字越小越优先；同优先级按 order 排序，排名相同按入队顺序。
+    """
+
+    def __init__(self, queue: DurableQueue, order: str = ORDER_FIFO, max_age: float = 0):
+        self.queue = queue
+        self.order = order
+        self.max_age = max_age              # 最长等待时间（秒），0 为不限
+        self._jobs: Dict[int, _Job] = {}
+        self._by_key: Dict[str, int] = {}   # key -> 还在排队（未租出）的消息 id
+        self._leased = set()
+        self._delayed = []                  # (eligible_at, priority, rank, id, version)
+        self._ready = []                    # (priority, rank, id, version)
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {'replaced': 0, 'expired': 0, 'superseded': 0}
+
+        # 恢复持久化队列里的待发消息（优先级不落盘，恢复后都按普通优先级）
+        # 同一个 key 有两条时（上次租出期间又来了新的），按 id 顺序后面的覆盖前面的，旧的直接丢弃
+        for message_id, visible_at, key, score, enqueued_at in queue.pending():
+            if key and key in self._by_key:
+                self._supersede(self._by_key[key])
+            self._add(message_id, visible_at, PRIORITY_NORMAL, score, enqueued_at, key)
+
+    def _rank(self, score: float, enqueued_at: float) -> float:
+        if self.order == ORDER_GAIN:
+            return -score if not math.isnan(score) else 0.0
+        if self.order == ORDER_FRESH:
+            return -enqueued_at
+        return 0.0
+
+    def _add(self, message_id: int, eligible_at: float, priority: int, score: float,
+             enqueued_at: float, key: Optional[str]):
+        job = _Job(priority, self._rank(score, enqueued_at), eligible_at, enqueued_at, key)
+        self._jobs[message_id] = job
+        if key:
+            self._by_key[key] = message_id
+        self._push(message_id, job)
+
+    def _push(self, message_id: int, job: _Job):
+        heapq.heappush(self._delayed, (job.eligible_at, job.priority, job.rank, message_id, job.version))
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _forget(self, message_id: int):
+        job = self._jobs.pop(message_id, None)
+        self._leased.discard(message_id)
+        if job and job.key and self._by_key.get(job.key) == message_id:
+            del self._by_key[job.key]
+
+    def _supersede(self, message_id: int):
+        """同 key 已经有更新的消息排着，这条不再发"""
+        self.queue.ack(message_id)
+        self._forget(message_id)
+        self.stats['superseded'] += 1
+
+    def put(self, payload: str, key: Optional[str] = None, score: float = 0.0,
+            priority: int = PRIORITY_NORMAL, delay: float = 0) -> Tuple[int, bool]:
+        """入队（先落盘再进堆），返回 (消息 id, 是否替换了同 key 的旧消息)
+
+        同一个 key 还有没发出去的消息时，直接用新内容替换它，不再新增。
+        """
+        now = time.time()
+        score = 0.0 if math.isnan(score) else score
+        message_id = self._by_key.get(key) if key else None
+        if message_id is not None and message_id not in self._leased and self.queue.replace(message_id, payload, score):
+            job = self._jobs[message_id]
+            job.enqueued_at = now
+            job.rank = self._rank(score, now)
+            job.priority = min(job.priority, priority)
+            job.version += 1
+            self._push(message_id, job)
+            self.stats['replaced'] += 1
+            self._notify()
+            return message_id, True
+
+        message_id = self.queue.put(payload, delay=delay, key=key, score=score)
+        self._add(message_id, now + delay, priority, score, now, key)
+        self._notify()
+        return message_id, False
+
+    def ack(self, message: QueueMessage):
+        self.queue.ack(message.id)
+        self._forget(message.id)
+
+    def retry(self, message: QueueMessage, delay: float = 0):
+        """放回调度，delay 秒后再发；序号不变，到期后仍排在后来的任务前面"""
+        self.queue.nack(message.id, delay=delay)
+        self._requeue(message.id, time.time() + delay)
+
+    def defer(self, message: QueueMessage):
+        """还没处理就放回原位（不算一次尝试），通常配合 pause_until 使用"""
+        self.queue.release(message.id)
+        self._requeue(message.id, time.time())
+
+    def _requeue(self, message_id: int, eligible_at: float):
+        self._leased.discard(message_id)
+        job = self._jobs.get(message_id)
+        if job is None:
+            return
+        # 租出期间同 key 来了新消息：新消息已经单独入队，这条过时了，不放回去（否则两条都会发）
+        if job.key:
+            newer = self._by_key.get(job.key)
+            if newer is not None and newer != message_id:
+                self._supersede(message_id)
+                return
+            self._by_key[job.key] = message_id
+        job.eligible_at = eligible_at
+        job.version += 1
+        self._push(message_id, job)
+        self._notify()
+
+    def pause_until(self, timestamp: float):
+        """暂停发放任务直到 timestamp（限流 / 休眠）"""
+        if timestamp > self._paused_until:
+            self._paused_until = timestamp
+
+    def _promote(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, priority, rank, message_id, version = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (priority, rank, message_id, version))
+
+    def _is_current(self, message_id: int, version: int) -> bool:
+        job = self._jobs.get(message_id)
+        return job is not None and job.version == version and message_id not in self._leased
+
+    def next_due_at(self) -> Optional[float]:
+        """下一个任务可以发放的时间（考虑暂停闸门），没有任务时为 None"""
+        while self._ready and not self._is_current(self._ready[0][2], self._ready[0][3]):
+            heapq.heappop(self._ready)
+        while self._delayed and not self._is_current(self._delayed[0][3], self._delayed[0][4]):
+            heapq.heappop(self._delayed)
+        if self._ready:
+            due = time.time()
+        elif self._delayed:
+            due = self._delayed[0][0]
+        else:
+            return None
+        return max(due, self._paused_until)
+
+    async def get(self) -> QueueMessage:
+        """等到有任务可发为止，返回已租出的消息（超过最长等待时间的任务会被丢弃）"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            self._promote(now)
+            if self._ready and now >= self._paused_until:
+                _, _, message_id, version = heapq.heappop(self._ready)
+                if not self._is_current(message_id, version):
+                    continue
+                if self.max_age and now - self._jobs[message_id].enqueued_at > self.max_age:
+                    self.queue.ack(message_id)
+                    self._forget(message_id)
+                    self.stats['expired'] += 1
+                    continue
+                message = self.queue.lease_id(message_id)
+                if message is None:
+                    self._forget(message_id)
+                    continue
+                self._leased.add(message_id)
+                job = self._jobs[message_id]
+                if job.key and self._by_key.get(job.key) == message_id:
+                    del self._by_key[job.key]
+                return message
+
+            due = self.next_due_at()
+            timeout = None if due is None else max(0.0, due - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self):
+        """排队中（不含正在发送）的任务数"""
+        return len(self._jobs) - len(self._leased)
+
+
+# 测试
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), 'scheduler.db')
+    scheduler = TweetScheduler(DurableQueue(path), order=ORDER_GAIN, max_age=0.25)
+
+    async def demo():
+        start = time.time()
+        scheduler.pause_until(time.time() + 0.1)   # 模拟限流 0.1 秒
+        scheduler.put("$A did 3x", key="CA_A", score=3)
+        scheduler.put("$B did 5x", key="CA_B", score=5)
+        scheduler.put("$C did 2x", key="CA_C", score=2)
+        print(f"  替换: {scheduler.put('$A did 12x', key='CA_A', score=12)}")
+        scheduler.put("$D did 8x (会过期)", key="CA_D", score=8, delay=0.3)
+
+        async def late_arrival():
+            await asyncio.sleep(0.05)
+            scheduler.put("$E 高优先级 1.5x", key="CA_E", score=1.5, priority=PRIORITY_HIGH)
+        asyncio.ensure_future(late_arrival())
+        await asyncio.sleep(0.06)
+
+        while len(scheduler):
+            try:
+                message = await asyncio.wait_for(scheduler.get(), 1)
+            except asyncio.TimeoutError:
+                break   # 剩下的都过期丢弃了
+            print(f"  {time.time() - start:5.2f}s  {message.payload}")
+            scheduler.ack(message)
+            if message.payload.startswith("$B"):
+                scheduler.pause_until(time.time() + 0.1)
+
+        # 发送失败等重试期间，同一个 CA 来了更新的推文：旧的不再放回
+        scheduler.put("$F did 4x", key="CA_F", score=4)
+        message = await scheduler.get()
+        scheduler.put("$F did 9x", key="CA_F", score=9)
+        scheduler.retry(message, delay=0)
+        print(f"  重试时已有更新的: {(await scheduler.get()).payload}，排队中 {len(scheduler)} 条")
+
+    asyncio.run(demo())
+    print(f"  统计: {scheduler.stats}")
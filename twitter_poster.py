@@ -8,26 +8,36 @@ Twitter Auto Poster V2 - 高级反检测版本
 """
 
 import os
-import json
+import time
 import random
 import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from playwright.async_api import async_playwright
+
+from tweet_length import weighted_length, TWEET_LIMIT
+from stats_journal import StatsJournal
+from metrics import Counter, Histogram
+
+# 发推各步骤耗时：随机延迟 / 打开首页 / 互动 / 打字 / 点发送
+POST_PHASE_SECONDS = Histogram('twitter_post_phase_seconds', '发推各步骤耗时（秒）', ['phase'])
+POST_RESULTS = Counter('twitter_posts', '发推结果', ['result'])
 
 class TwitterPoster:
     def __init__(self):
         self.cookies_file = os.path.join(os.path.dirname(__file__), 'twitter_cookies.json')
         self.stats_file = os.path.join(os.path.dirname(__file__), 'twitter_stats.json')
+        self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
+        self.submitted = False   # 本次 post_tweet 已经点了发送（关闭时据此判断推文算不算发出）
 
         # 悉尼时区
         self.timezone = ZoneInfo('Australia/Sydney')
 
-        # 加载统计数据
-        self.stats = self._load_stats()
+        # 加载统计数据（快照 + 快照之后的事件日志）；之后每次变化只追加一条事件，写盘不占事件循环
+        self.journal = StatsJournal(self.stats_file, self._default_stats(), self._apply_stats_event)
+        self.stats = self.journal.state
 
         # 配置参数
         self.config = {
@@ -41,11 +51,8 @@ class TwitterPoster:
             'interaction_chance': 0.3,  # 30%概率做互动
         }
 
-    def _load_stats(self):
-        """加载统计数据"""
-        if os.path.exists(self.stats_file):
-            with open(self.stats_file, 'r') as f:
-                return json.load(f)
+    def _default_stats(self):
+        """第一次运行时的统计数据"""
         return {
             'today': datetime.now(self.timezone).strftime('%Y-%m-%d'),
             'tweets_today': 0,
@@ -53,25 +60,36 @@ class TwitterPoster:
             'last_interaction': 0,
         }
 
-    def _save_stats(self):
-        """保存统计数据"""
-        with open(self.stats_file, 'w') as f:
-            json.dump(self.stats, f)
+    @staticmethod
+    def _apply_stats_event(stats, event):
+        """把一条统计事件应用到 stats（记录时和启动重放时共用）"""
+        kind = event['type']
+        if kind == 'tweet':
+            # 顺手去掉30分钟前的记录，快照不会越来越大
+            stats['recent_tweets'] = [t for t in stats['recent_tweets'] if t > event['ts'] - 1800]
+            stats['recent_tweets'].append(event['ts'])
+            stats['tweets_today'] += 1
+        elif kind == 'interaction':
+            stats['last_interaction'] = event['ts']
+        elif kind == 'day':
+            stats['today'] = event['today']
+            stats['tweets_today'] = 0
 
     def _reset_daily_stats(self):
         """重置每日统计"""
         today = datetime.now(self.timezone).strftime('%Y-%m-%d')
         if self.stats['today'] != today:
-            self.stats['today'] = today
-            self.stats['tweets_today'] = 0
-            self._save_stats()
+            self.journal.record('day', today=today)
             print(f"📅 新的一天，计数器已重置")
 
     async def init_browser(self):
         """初始化浏览器"""
-        playwright = await async_playwright().start()
+        # playwright 比较重，用到时再导入，不拖慢启动
+        from playwright.async_api import async_playwright
 
-        self.browser = await playwright.chromium.launch(
+        self.playwright = await async_playwright().start()
+
+        self.browser = await self.playwright.chromium.launch(
             headless=os.getenv('HEADLESS', 'false').lower() == 'true'
         )
 
@@ -97,9 +115,19 @@ class TwitterPoster:
         print(f"✅ 登录状态已保存")
 
     async def check_login(self):
-        """检查是否已登录"""
-        await self.page.goto('https://x.com/home', wait_until='networkidle')
-        await asyncio.sleep(2)
+        """检查是否已登录
+
+        不等 networkidle：首页的发帖按钮或登录页的用户名输入框出现就能判断，
+        都没出现时按超时后的地址判断（和以前一样看有没有跳到登录页）。
+        """
+        await self.page.goto('https://x.com/home', wait_until='domcontentloaded')
+        try:
+            await self.page.wait_for_selector(
+                '[data-testid="SideNav_NewTweet_Button"], input[autocomplete="username"]',
+                timeout=15000
+            )
+        except Exception:
+            pass
         if 'login' in self.page.url or 'i/flow' in self.page.url:
             return False
         return True
@@ -118,51 +146,70 @@ class TwitterPoster:
 
     def is_sleep_time(self):
         """检查是否在休眠时段（悉尼时间凌晨3点-早上9点）"""
-        now = datetime.now(self.timezone)
-        hour = now.hour
-        if self.config['sleep_start'] <= hour or hour < self.config['sleep_end']:
-            # 凌晨3-23点 或 0-9点
-            if hour >= self.config['sleep_start'] or hour < self.config['sleep_end']:
-                return True
-        return False
-
-    def can_tweet(self):
-        """检查是否可以发推"""
+        hour = datetime.now(self.timezone).hour
+        start, end = self.config['sleep_start'], self.config['sleep_end']
+        if start <= end:
+            return start <= hour < end
+        # 跨零点的休眠时段，例如 23 点 - 7 点
+        return hour >= start or hour < end
+
+    def next_post_time(self):
+        """下一次可以发推的时间戳和原因
+
+        原因: 'ok' / 'sleep'（休眠）/ 'daily_limit'（每日上限）/ 'rate_limit'（30分钟上限）/ 'min_interval'（最小间隔）
+        """
         self._reset_daily_stats()
-        now = datetime.now(self.timezone).timestamp()
+        now_dt = datetime.now(self.timezone)
+        now = now_dt.timestamp()
 
-        # 1. 检查休眠时段
+        # 1. 休眠时段：到休眠结束
         if self.is_sleep_time():
-            hour = datetime.now(self.timezone).hour
-            print(f"😴 休眠时段 (悉尼时间 {hour}点)，暂停发帖")
-            return False, "休眠时段"
+            wake = now_dt.replace(hour=self.config['sleep_end'], minute=0, second=0, microsecond=0)
+            if wake <= now_dt:
+                wake += timedelta(days=1)
+            return wake.timestamp(), 'sleep'
 
-        # 2. 检查每日限制
+        # 2. 每日限制：到明天零点
         daily_limit = self.config['new_account_limit'] if self.config['new_account_mode'] else self.config['daily_limit']
         if self.stats['tweets_today'] >= daily_limit:
-            print(f"📊 已达今日上限 ({daily_limit}条)")
-            return False, "达到每日上限"
+            tomorrow = (now_dt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            return tomorrow.timestamp(), 'daily_limit'
 
         # 3. 清理30分钟前的记录
         thirty_min_ago = now - 1800
         self.stats['recent_tweets'] = [t for t in self.stats['recent_tweets'] if t > thirty_min_ago]
 
-        # 4. 检查30分钟内发推数量
+        # 4. 30分钟内发推数量：到最早一条满30分钟
         if len(self.stats['recent_tweets']) >= self.config['max_per_30min']:
-            wait_time = int(self.stats['recent_tweets'][0] + 1800 - now)
-            print(f"⏰ 30分钟内已发 {self.config['max_per_30min']} 条，需等待 {wait_time} 秒")
-            return False, f"等待 {wait_time} 秒"
+            return self.stats['recent_tweets'][0] + 1800, 'rate_limit'
 
-        # 5. 检查最小间隔
+        # 5. 最小间隔：到上一条之后 min_interval 秒
         if self.stats['recent_tweets']:
-            last_tweet = max(self.stats['recent_tweets'])
-            elapsed = now - last_tweet
-            if elapsed < self.config['min_interval']:
-                wait = int(self.config['min_interval'] - elapsed)
-                print(f"⏳ 距上次发推仅 {int(elapsed)} 秒，需再等 {wait} 秒")
-                return False, f"等待 {wait} 秒"
+            ready_at = max(self.stats['recent_tweets']) + self.config['min_interval']
+            if ready_at > now:
+                return ready_at, 'min_interval'
+
+        return now, 'ok'
 
-        return True, "OK"
+    def can_tweet(self):
+        """检查是否可以发推"""
+        ready_at, why = self.next_post_time()
+        if why == 'ok':
+            return True, "OK"
+
+        wait = int(ready_at - datetime.now(self.timezone).timestamp())
+        if why == 'sleep':
+            hour = datetime.now(self.timezone).hour
+            print(f"😴 休眠时段 (悉尼时间 {hour}点)，暂停发帖")
+            return False, "休眠时段"
+        if why == 'daily_limit':
+            print(f"📊 已达今日上限 ({self.stats['tweets_today']}条)")
+            return False, "达到每日上限"
+        if why == 'rate_limit':
+            print(f"⏰ 30分钟内已发 {self.config['max_per_30min']} 条，需等待 {wait} 秒")
+        else:
+            print(f"⏳ 距上次发推不到 {self.config['min_interval']} 秒，需再等 {wait} 秒")
+        return False, f"等待 {wait} 秒"
 
     async def random_scroll(self):
         """随机滚动页面，模拟真人浏览"""
@@ -189,30 +236,49 @@ class TwitterPoster:
                 print("❤️ 点赞了一条推文")
                 await asyncio.sleep(random.uniform(1, 3))
 
-            self.stats['last_interaction'] = datetime.now(self.timezone).timestamp()
-            self._save_stats()
+            self.journal.record('interaction', ts=datetime.now(self.timezone).timestamp())
 
         except Exception as e:
             print(f"⚠️ 互动失败 (不影响发帖): {e}")
 
     async def post_tweet(self, content):
         """发送推文"""
+        # 超长的推文发不出去，别浪费打字时间
+        length = weighted_length(content)
+        if length > TWEET_LIMIT:
+            print(f"❌ 推文超长 ({length}/{TWEET_LIMIT})，跳过")
+            POST_RESULTS.labels(result='too_long').inc()
+            return False, f"推文超长 {length}"
+
         # 检查是否可以发推
         can_post, reason = self.can_tweet()
         if not can_post:
+            POST_RESULTS.labels(result='throttled').inc()
             return False, reason
 
+        self.submitted = False
+        phase_started = time.perf_counter()
+
+        def phase_done(phase):
+            nonlocal phase_started
+            now = time.perf_counter()
+            POST_PHASE_SECONDS.labels(phase=phase).observe(now - phase_started)
+            phase_started = now
+
         try:
             # 随机延迟
             await asyncio.sleep(random.uniform(2, 5))
+            phase_done('delay')
 
             # 打开首页
             await self.page.goto('https://x.com/home', wait_until='networkidle')
             await asyncio.sleep(random.uniform(2, 4))
+            phase_done('load_home')
 
             # 随机概率先做互动
             if random.random() < self.config['interaction_chance']:
                 await self.do_interaction()
+                phase_done('interaction')
 
             # 点击发推输入框
             tweet_box = await self.page.wait_for_selector(
@@ -230,6 +296,7 @@ class TwitterPoster:
                     await asyncio.sleep(random.uniform(0.3, 0.8))
 
             await asyncio.sleep(random.uniform(1, 3))
+            phase_done('compose')
 
             # 点击发送
             post_button = await self.page.wait_for_selector(
@@ -237,26 +304,38 @@ class TwitterPoster:
                 timeout=5000
             )
             await post_button.click()
-            await asyncio.sleep(random.uniform(2, 4))
 
-            # 更新统计
-            now = datetime.now(self.timezone).timestamp()
-            self.stats['tweets_today'] += 1
-            self.stats['recent_tweets'].append(now)
-            self._save_stats()
+            # 点了发送就算发出：先更新统计，再等页面反应
+            self.submitted = True
+            self.journal.record('tweet', ts=datetime.now(self.timezone).timestamp())
+
+            await asyncio.sleep(random.uniform(2, 4))
+            phase_done('submit')
 
             print(f"✅ 推文发送成功 (今日第 {self.stats['tweets_today']} 条): {content[:40]}...")
+            POST_RESULTS.labels(result='ok').inc()
             return True, "发送成功"
 
         except Exception as e:
             print(f"❌ 发推失败: {e}")
+            POST_RESULTS.labels(result='error').inc()
             return False, str(e)
 
     async def close(self):
-        """关闭浏览器"""
+        """保存统计后关闭浏览器（先关 context，再关浏览器和 playwright 驱动）；可以重复调用"""
+        journal, self.journal = self.journal, None
+        if journal is not None:
+            await asyncio.to_thread(journal.close)
+        if self.context:
+            await self.context.close()
+            self.context = None
         if self.browser:
             await self.browser.close()
+            self.browser = None
             print("🔒 浏览器已关闭")
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
 
 
 async def main():